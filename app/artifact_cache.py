@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Shared by every process on the host; point several hosts at the same directory to share builds
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifact_cache")
+DEFAULT_CACHE_SIZE_MB = 4096
+
+# Files whose contents define a model; anything derived is keyed by their hashes
+SOURCE_FILES = ("config.json", "model.safetensors", "pytorch_model.bin")
+LFS_POINTER_PREFIX = b"version https://git-lfs"
+MANIFEST_NAME = "artifact.json"
+HASH_INDEX_NAME = "source_hashes.json"
+
+
+def lfs_pointer_oid(path):
+    """sha256 from a git-lfs pointer file, or None when the file holds real content"""
+    with open(path, 'rb') as f:
+        head = f.read(512)
+    if not head.startswith(LFS_POINTER_PREFIX):
+        return None
+    for line in head.decode('utf-8', 'replace').splitlines():
+        if line.startswith("oid sha256:"):
+            return line.split(":", 1)[1].strip()
+    return None
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recipe_digest(recipe):
+    return hashlib.sha256(json.dumps(recipe, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ArtifactCache:
+    """On-disk cache of converted model artifacts keyed by source weights + conversion recipe
+
+    A source is identified by the sha256 of its weight and config files: the
+    oid from the git-lfs pointer when the file is still a pointer (what a
+    fresh checkout has), otherwise the hash of the content, memoized by size
+    and mtime so large files are hashed once. An artifact (ONNX export, int8
+    state dict, safetensors conversion, ...) lives in its own directory named
+    after that hash and the recipe, is built into a temporary directory and
+    renamed into place, so concurrent builders never see partial output.
+    Least recently used artifacts are evicted when the cache outgrows its
+    size budget.
+    """
+
+    def __init__(self, root=None, max_size_mb=None):
+        self.root = root or os.environ.get('MEDAI_ARTIFACT_CACHE', DEFAULT_CACHE_DIR)
+        self.max_size = int(
+            (max_size_mb or float(os.environ.get('MEDAI_ARTIFACT_CACHE_MB', DEFAULT_CACHE_SIZE_MB))) * 1e6
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---------------- Keys ----------------
+    def _hash_index(self):
+        try:
+            with open(os.path.join(self.root, HASH_INDEX_NAME), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_hash_index(self, index):
+        path = os.path.join(self.root, HASH_INDEX_NAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def file_hash(self, path):
+        """sha256 of one source file (LFS oid when it is a pointer)"""
+        oid = lfs_pointer_oid(path)
+        if oid:
+            return oid
+
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            index = self._hash_index()
+            entry = index.get(key)
+            if entry and entry['stamp'] == stamp:
+                return entry['sha256']
+        digest = file_sha256(path)
+        with self.lock:
+            index = self._hash_index()
+            index[key] = {'stamp': stamp, 'sha256': digest}
+            self._save_hash_index(index)
+        return digest
+
+    def source_hash(self, model_path):
+        """Combined hash of the files that define the model at model_path"""
+        parts = []
+        for name in SOURCE_FILES:
+            path = os.path.join(model_path, name)
+            if os.path.exists(path):
+                parts.append(f"{name}:{self.file_hash(path)}")
+        if not parts:
+            raise FileNotFoundError(f"No model files in {model_path}")
+        return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+    def key(self, model_path, recipe):
+        return f"{self.source_hash(model_path)[:20]}-{recipe.get('kind', 'artifact')}-{recipe_digest(recipe)[:12]}"
+
+    # ---------------- Artifacts ----------------
+    def lookup(self, model_path, recipe):
+        """Directory of a finished artifact, or None"""
+        directory = os.path.join(self.root, self.key(model_path, recipe))
+        if not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            return None
+        # Directory mtime is the LRU clock (shared across processes and hosts)
+        os.utime(directory)
+        return directory
+
+    def get_or_build(self, model_path, recipe, build):
+        """Return the artifact directory, calling build(output_dir) only on a miss"""
+        key = self.key(model_path, recipe)
+        directory = os.path.join(self.root, key)
+        if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            os.utime(directory)
+            self.hits += 1
+            return directory
+
+        print(f"Building artifact {key} ({recipe.get('kind')})...")
+        start_time = time.time()
+        tmp_dir = f"{directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            build(tmp_dir)
+            manifest = {
+                'key': key,
+                'recipe': recipe,
+                'source': os.path.abspath(model_path),
+                'created': time.time(),
+                'build_seconds': round(time.time() - start_time, 2),
+                'size_bytes': self._directory_size(tmp_dir)
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(tmp_dir, directory)
+            except OSError:
+                # Another process finished the same artifact first; keep theirs
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.builds += 1
+        print(f"✅ Artifact {key} ready in {time.time() - start_time:.1f}s")
+        self.evict(keep=key)
+        return directory
+
+    @staticmethod
+    def _directory_size(directory):
+        total = 0
+        for base, _, files in os.walk(directory):
+            for name in files:
+                total += os.path.getsize(os.path.join(base, name))
+        return total
+
+    def entries(self):
+        """Finished artifacts, least recently used first"""
+        entries = []
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            manifest_path = os.path.join(directory, MANIFEST_NAME)
+            if name.endswith(".tmp") or not os.path.exists(manifest_path):
+                continue
+            try:
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifest['last_used'] = os.path.getmtime(directory)
+            manifest['path'] = directory
+            entries.append(manifest)
+        return sorted(entries, key=lambda entry: entry['last_used'])
+
+    def evict(self, keep=None):
+        """Drop least recently used artifacts until the cache fits its size budget"""
+        entries = self.entries()
+        total = sum(entry.get('size_bytes', 0) for entry in entries)
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            if entry['key'] == keep:
+                continue
+            shutil.rmtree(entry['path'], ignore_errors=True)
+            total -= entry.get('size_bytes', 0)
+            print(f"Evicted artifact {entry['key']} ({entry.get('size_bytes', 0) / 1e6:.1f} MB)")
+        return total
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'root': self.root,
+            'artifacts': len(entries),
+            'size_mb': round(sum(entry.get('size_bytes', 0) for entry in entries) / 1e6, 1),
+            'max_size_mb': round(self.max_size / 1e6, 1),
+            'hits': self.hits,
+            'builds': self.builds
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_artifact_cache():
+    """Process-wide cache at MEDAI_ARTIFACT_CACHE (created on first use)"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ArtifactCache()
+        return _default_cache
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+asyncio (ASGI) serving mode for the Medical AI web app
+
+Serves /api/chat, /api/chat/stream, /api/history and /api/status natively
+on the event loop and mounts the Flask app for everything else (index,
+static files, /api/chat/batch). Generation requests are queued on the same
+batching engine / worker pool as web_app; their tokens are delivered to the
+loop through GenerationRequest.subscribe, so a waiting or streaming
+connection costs a coroutine rather than a thread. Tokenization and history
+file I/O run in a small thread pool.
+
+Needs starlette and uvicorn (see requirements_web.txt):
+
+    python asgi_app.py
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from starlette.applications import Starlette
+    from starlette.middleware.wsgi import WSGIMiddleware
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Mount, Route
+except ImportError:
+    Starlette = None
+
+import web_app
+from generation import StreamingTextDecoder
+from inference_engine import DeadlineExceeded
+
+# Threads for tokenization and blocking file I/O (not for waiting on generations)
+EXECUTOR_WORKERS = int(os.environ.get('MEDAI_EXECUTOR_WORKERS', 4))
+executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="medai-io")
+
+# chat_history.json is rewritten as a whole, so writes must not interleave
+_history_lock = None
+
+
+def run_blocking(func, *args):
+    return asyncio.get_event_loop().run_in_executor(executor, func, *args)
+
+
+def history_lock():
+    global _history_lock
+    if _history_lock is None:
+        _history_lock = asyncio.Lock()
+    return _history_lock
+
+
+async def save_history(message, response, source):
+    async with history_lock():
+        await run_blocking(web_app.save_chat_history, message, response, source)
+
+
+async def aiter_tokens(generation, timeout=None):
+    """Async iterator over a GenerationRequest's tokens, fed from the engine thread
+
+    Raises TimeoutError if the next token takes longer than timeout seconds.
+    """
+    loop = asyncio.get_event_loop()
+    tokens = asyncio.Queue()
+    generation.subscribe(lambda token: loop.call_soon_threadsafe(tokens.put_nowait, token))
+    while True:
+        try:
+            token = await asyncio.wait_for(tokens.get(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No token within {timeout:g}s")
+        if token is None:
+            break
+        yield token
+    if generation.error:
+        raise generation.error
+
+
+async def generate_response(message, max_new_tokens=None, deadline_seconds=None):
+    """Async counterpart of web_app.generate_medical_response"""
+    # Questions with a close match in the knowledge bases skip generation
+    kb_answer = await run_blocking(web_app.retrieve_answer, message)
+    if kb_answer:
+        return kb_answer, "knowledge_base"
+
+    if web_app.model_loaded:
+        generation = None
+        try:
+            input_text = web_app.build_prompt(message)
+            inputs = await run_blocking(web_app.tokenizer.encode, input_text)
+            stopping = web_app.build_stopping_criteria(inputs, max_new_tokens)
+
+            generation = web_app.submit_generation(message, inputs, stopping, deadline_seconds)
+            if generation is not None:
+                outputs = [token async for token in aiter_tokens(generation, web_app.GENERATION_TIMEOUT_SECONDS)]
+                response = web_app.tokenizer.decode(inputs + outputs, skip_special_tokens=True)
+                response = stopping.trim(response.split("### Answer:")[-1])
+                if response and len(response) > 10:
+                    return response, "model"
+
+        except DeadlineExceeded:
+            web_app.scheduler.record_shed(generation)
+            print("Deadline passed while queued, answering from the knowledge base")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Model generation error: {e}")
+        finally:
+            if generation is not None:
+                # No-op when finished; frees the slot if the client disconnected
+                generation.cancel()
+
+    return web_app.get_knowledge_based_response(message), "knowledge_base"
+
+
+async def stream_response(message, max_new_tokens=None, deadline_seconds=None):
+    """Async counterpart of web_app.stream_medical_response (same SSE frames)"""
+    start_time = time.time()
+    first_token_time = None
+    token_count = 0
+    response = ""
+    response_source = "knowledge_base"
+    stopping = None
+
+    # Questions with a close match in the knowledge bases skip generation
+    kb_answer = await run_blocking(web_app.retrieve_answer, message)
+    if kb_answer:
+        response = kb_answer
+    elif web_app.model_loaded:
+        generation = None
+        try:
+            input_text = web_app.build_prompt(message)
+            inputs = await run_blocking(web_app.tokenizer.encode, input_text)
+            decoder = StreamingTextDecoder(web_app.tokenizer)
+            stopping = web_app.build_stopping_criteria(inputs, max_new_tokens)
+            started = False
+
+            generation = web_app.submit_generation(message, inputs, stopping, deadline_seconds)
+            if generation is not None:
+                try:
+                    async for token in aiter_tokens(generation, web_app.GENERATION_TIMEOUT_SECONDS):
+                        token_count += 1
+                        if first_token_time is None:
+                            first_token_time = time.time()
+
+                        delta = decoder.push(token)
+                        if not started:
+                            delta = delta.lstrip()
+                            started = bool(delta)
+                        if delta:
+                            yield web_app.sse_event({'token': delta})
+                finally:
+                    generation.cancel()
+
+                response = stopping.trim((input_text + decoder.text()).split("### Answer:")[-1])
+                if response and len(response) > 10:
+                    response_source = "model"
+
+        except DeadlineExceeded:
+            web_app.scheduler.record_shed(generation)
+            print("Deadline passed while queued, answering from the knowledge base")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Model streaming error: {e}")
+
+    if response_source != "model":
+        if not kb_answer:
+            response = web_app.get_knowledge_based_response(message)
+        if first_token_time is None:
+            first_token_time = time.time()
+
+    total_time = time.time() - start_time
+    await save_history(message, response, response_source)
+
+    yield web_app.sse_event({
+        'response': response,
+        'source': response_source,
+        'model_loaded': web_app.model_loaded,
+        'timing': {
+            'time_to_first_token_ms': round((first_token_time - start_time) * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+            'tokens': token_count,
+            'tokens_per_second': round(token_count / total_time, 2) if total_time > 0 else 0.0,
+            'stop_reason': stopping.stop_reason if stopping else None,
+            'tokens_saved': stopping.tokens_saved() if stopping else 0
+        }
+    }, event='done')
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def chat(request):
+    try:
+        data = await read_json(request)
+        message = str(data.get('message', '')).strip()
+
+        if not message:
+            return JSONResponse({'error': 'Empty message'}, status_code=400)
+
+        response, response_source = await generate_response(
+            message, web_app.parse_max_new_tokens(data), web_app.parse_deadline(data)
+        )
+        await save_history(message, response, response_source)
+
+        return JSONResponse({
+            'response': response,
+            'source': response_source,
+            'model_loaded': web_app.model_loaded
+        })
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def chat_stream(request):
+    data = await read_json(request)
+    message = str(data.get('message', '')).strip()
+
+    if not message:
+        return JSONResponse({'error': 'Empty message'}, status_code=400)
+
+    return StreamingResponse(
+        stream_response(message, web_app.parse_max_new_tokens(data), web_app.parse_deadline(data)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def history(request):
+    return JSONResponse({'history': await run_blocking(web_app.load_chat_history)})
+
+
+async def status(request):
+    return JSONResponse(web_app.status_payload())
+
+
+def create_app():
+    if Starlette is None:
+        raise ImportError("starlette is not installed")
+    return Starlette(routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/history', history, methods=['GET']),
+        Route('/api/status', status, methods=['GET']),
+        # Index page, static files and the batch endpoint stay on Flask
+        Mount('/', app=WSGIMiddleware(web_app.app))
+    ])
+
+
+app = create_app() if Starlette is not None else None
+
+
+def main():
+    if app is None:
+        print("ASGI mode needs starlette and uvicorn: pip install starlette uvicorn")
+        return 1
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is not installed: pip install uvicorn")
+        return 1
+
+    print("🚀 Starting Medical AI Assistant (asyncio server)...")
+    print("🌐 Server ready at: http://localhost:5000")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
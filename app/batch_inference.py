@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Offline batch inference for question files
+
+Reads questions from a JSONL file, runs them through the heart-specialized
+model in padded batches and appends one JSON result per line to the output
+file as soon as each batch finishes, so memory stays flat for any input size.
+
+Each input line is either a JSON string or an object with a "question" field
+(an optional "id" is copied to the output):
+
+    python batch_inference.py questions.jsonl answers.jsonl --batch-size 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import torch
+from tokenization import pad_batch
+
+INSTRUCTION_TEMPLATE = "### Instruction:\n{}\n\n### Response:\n"
+INSTRUCTION_MARKER = "### Response:"
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", "heart_attack_specialized_complete", "model"
+)
+
+
+def parse_record(line):
+    """Turn one JSONL line into a {'question': ..., 'id': ...} record"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        data = line
+
+    if isinstance(data, str):
+        return {'question': data}
+    if isinstance(data, dict) and data.get('question'):
+        return data
+    return None
+
+
+def read_questions(path):
+    """Yield (line_number, record) pairs without loading the whole file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            record = parse_record(line)
+            if record is not None:
+                yield line_number, record
+
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def prepare_tokenizer(tokenizer):
+    """Batched decoder-only generation needs a pad token (generate_batch pads on the left itself)"""
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def encode_prompts(tokenizer, prompts):
+    """Token ids for a chunk of prompts, in one call when the tokenizer supports it"""
+    if hasattr(tokenizer, 'encode_batch'):
+        return tokenizer.encode_batch(prompts)
+    return [tokenizer.encode(prompt) for prompt in prompts]
+
+
+def bucket_by_length(items, token_ids, batch_size):
+    """Sort a chunk by prompt length and split it into batches of similar length"""
+    order = sorted(range(len(items)), key=lambda i: len(token_ids[i]))
+    for start in range(0, len(order), batch_size):
+        yield [order[i] for i in range(start, min(start + batch_size, len(order)))]
+
+
+def generate_batch(model, tokenizer, prompt_ids, max_length=200, temperature=0.7,
+                   do_sample=True, repetition_penalty=1.1):
+    """Run one left-padded batch of token id lists through model.generate and return decoded texts"""
+    device = next(model.parameters()).device
+    input_ids, attention_mask = pad_batch(prompt_ids, tokenizer.pad_token_id, padding_side='left', device=device)
+
+    # max_length counts the prompt, as in the single-question path
+    longest_prompt = int(attention_mask.sum(dim=1).max())
+    max_new_tokens = max(max_length - longest_prompt, 1)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            do_sample=do_sample,
+            pad_token_id=tokenizer.pad_token_id,
+            repetition_penalty=repetition_penalty
+        )
+
+    return [tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
+
+
+def batch_generate(model, tokenizer, records, template=INSTRUCTION_TEMPLATE, marker=INSTRUCTION_MARKER,
+                   batch_size=16, chunk_size=512, **generation_kwargs):
+    """Yield a result dict per (index, record) pair, one bucketed batch at a time
+
+    Only ``chunk_size`` records are held in memory; each chunk is sorted by
+    prompt length so a batch carries as little padding as possible. Results
+    come back in bucket order and carry their input index.
+    """
+    prepare_tokenizer(tokenizer)
+
+    for chunk in iter_chunks(records, chunk_size):
+        prompts = [template.format(record['question']) for _, record in chunk]
+        # Encoded once: the lengths drive bucketing and the ids feed the batch directly
+        token_ids = encode_prompts(tokenizer, prompts)
+
+        for batch in bucket_by_length(chunk, token_ids, batch_size):
+            start_time = time.time()
+            texts = generate_batch(model, tokenizer, [token_ids[i] for i in batch], **generation_kwargs)
+            elapsed_ms = (time.time() - start_time) * 1000
+
+            for i, text in zip(batch, texts):
+                index, record = chunk[i]
+                result = {
+                    'index': index,
+                    'question': record['question'],
+                    'answer': text.split(marker)[-1].strip(),
+                    'source': 'model',
+                    'batch_ms': round(elapsed_ms, 1)
+                }
+                if 'id' in record:
+                    result['id'] = record['id']
+                yield result
+
+
+def run_file(model, tokenizer, input_path, output_path, batch_size=16, chunk_size=512, **generation_kwargs):
+    """Answer every question in input_path, appending results to output_path as they finish"""
+    count = 0
+    start_time = time.time()
+
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for result in batch_generate(model, tokenizer, read_questions(input_path),
+                                     batch_size=batch_size, chunk_size=chunk_size, **generation_kwargs):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+            if count % batch_size == 0:
+                out.flush()
+                print(f"Answered {count} questions ({count / (time.time() - start_time):.2f}/s)")
+
+    print(f"✅ Wrote {count} answers to {output_path} in {time.time() - start_time:.1f}s")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch inference over a JSONL file of questions")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("output", help="JSONL file to write answers to")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH, help="Model directory")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=512,
+                        help="Questions read and length-sorted at a time")
+    parser.add_argument("--max-length", type=int, default=200)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--greedy", action="store_true", help="Disable sampling for reproducible answers")
+    args = parser.parse_args()
+
+    from heart_attack_specialist import HeartAttackSpecialist
+
+    specialist = HeartAttackSpecialist(args.model_path)
+    if not specialist.model or not specialist.tokenizer:
+        print(f"❌ Could not load model from {args.model_path}")
+        return 1
+
+    run_file(
+        specialist.model,
+        specialist.tokenizer,
+        args.input,
+        args.output,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        max_length=args.max_length,
+        temperature=args.temperature,
+        do_sample=not args.greedy
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
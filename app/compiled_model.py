@@ -0,0 +1,211 @@
+import threading
+import time
+import warnings
+import torch
+from transformers.modeling_outputs import CausalLMOutputWithPast
+from onnx_backend import _DecoderWithPast
+
+# Selectable through MEDAI_COMPILE; "compile" needs torch 2.x, "trace" works on the Jetson's 1.10
+COMPILE_MODES = ("off", "trace", "compile")
+
+# Calls are padded up to the next bucket in each dimension, so a handful of graphs cover all shapes
+BATCH_BUCKETS = (1, 2, 4, 8)
+SEQUENCE_BUCKETS = (1, 8, 16, 32, 64, 128)
+PAST_BUCKETS = (0, 16, 32, 64, 128, 256)
+# Graphs built on first use beyond the warmed-up ones; later new shapes run eagerly
+MAX_GRAPHS = 48
+
+
+def _bucket(value, buckets):
+    for bucket in buckets:
+        if value <= bucket:
+            return bucket
+    return None
+
+
+class CompiledGPT2Model:
+    """GPT-2 forward pass run through TorchScript traces (or torch.compile) per shape bucket
+
+    Tracing removes the Python/dispatcher overhead of the eager module, which
+    dominates a single-token decode step of a 6-layer model on CPU. Traces
+    are shape-specialized, so each call is padded on the left up to its
+    (batch, new tokens, cached tokens) bucket, with padding masked out and
+    explicit position ids, and the padding is stripped from the logits and
+    the returned cache. Shapes beyond the largest buckets, or calls with
+    arguments the graph does not take, go to the eager model. Everything
+    else (generate, config, parameters, ...) is the wrapped model's.
+    """
+
+    def __init__(self, model, mode="trace", batch_buckets=BATCH_BUCKETS, sequence_buckets=SEQUENCE_BUCKETS,
+                 past_buckets=PAST_BUCKETS, max_graphs=MAX_GRAPHS):
+        if mode == "compile" and not hasattr(torch, "compile"):
+            print("torch.compile needs torch 2.x, using TorchScript tracing")
+            mode = "trace"
+        self.__dict__.update(
+            model=model,
+            mode=mode,
+            decoder=_DecoderWithPast(model).eval(),
+            batch_buckets=tuple(sorted(batch_buckets)),
+            sequence_buckets=tuple(sorted(sequence_buckets)),
+            past_buckets=tuple(sorted(set(past_buckets) | {0})),
+            max_graphs=max_graphs,
+            graphs={},
+            lock=threading.Lock(),
+            compiled_calls=0,
+            eager_calls=0,
+            compile_seconds=0.0
+        )
+        if mode == "compile":
+            # Every bucket is a separate specialization of the same code object
+            from torch import _dynamo
+            for limit in ("cache_size_limit", "recompile_limit"):
+                if hasattr(_dynamo.config, limit):
+                    setattr(_dynamo.config, limit, max(getattr(_dynamo.config, limit), max_graphs))
+        config = model.config
+        self.__dict__['cache_shape'] = (config.n_head, config.n_embd // config.n_head)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.model, name, value)
+
+    # ---------------- Graphs ----------------
+    def _example_inputs(self, key):
+        batch, sequence, past = key
+        param = next(self.model.parameters())
+        heads, head_dim = self.cache_shape
+        input_ids = torch.zeros((batch, sequence), dtype=torch.long, device=param.device)
+        attention_mask = torch.ones((batch, past + sequence), dtype=torch.long, device=param.device)
+        # Values don't matter to the trace; zeros stay inside any position table
+        position_ids = torch.zeros((batch, sequence), dtype=torch.long, device=param.device)
+        cache = [torch.zeros((batch, heads, past, head_dim), dtype=param.dtype, device=param.device)
+                 for _ in range(2 * self.model.config.n_layer)]
+        return (input_ids, attention_mask, position_ids, *cache)
+
+    def _build(self, key):
+        start_time = time.time()
+        inputs = self._example_inputs(key)
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if self.mode == "compile":
+                graph = torch.compile(self.decoder, dynamic=False)
+            else:
+                graph = torch.jit.trace(self.decoder, inputs, check_trace=False)
+            # First call runs the optimizer passes (and the actual compile for torch.compile)
+            graph(*inputs)
+        self.__dict__['compile_seconds'] += time.time() - start_time
+        return graph
+
+    def _graph(self, key):
+        if key[1] + key[2] > self.model.config.n_positions:
+            # Padding would run past the causal mask/position table
+            return None
+        with self.lock:
+            graph = self.graphs.get(key)
+            if graph is None and len(self.graphs) < self.max_graphs:
+                graph = self.graphs[key] = self._build(key)
+            return graph
+
+    def warm_up(self, max_batch_size=max(BATCH_BUCKETS), max_length=max(PAST_BUCKETS), prefix_length=0):
+        """Build the decode-step graphs and the prompt prefill graphs before serving"""
+        start_time = time.time()
+        batches = [b for b in self.batch_buckets if b <= max(max_batch_size, 1)]
+        longest = _bucket(max_length, self.past_buckets) or self.past_buckets[-1]
+        pasts = [p for p in self.past_buckets if 0 < p <= longest]
+        prefill_past = _bucket(prefix_length, self.past_buckets) or 0
+
+        keys = [(b, 1, p) for b in batches for p in pasts]
+        keys += [(1, s, prefill_past) for s in self.sequence_buckets if 1 < s < max_length]
+        for key in keys:
+            self._graph(key)
+        print(f"Compiled {len(self.graphs)} {self.mode} graphs in {time.time() - start_time:.1f}s")
+        return len(self.graphs)
+
+    # ---------------- Forward ----------------
+    def _eager(self, input_ids, past_key_values, attention_mask, position_ids, use_cache, **kwargs):
+        self.__dict__['eager_calls'] += 1
+        return self.model(input_ids, past_key_values=past_key_values, attention_mask=attention_mask,
+                          position_ids=position_ids, use_cache=use_cache, **kwargs)
+
+    def __call__(self, input_ids, past_key_values=None, attention_mask=None, position_ids=None,
+                 use_cache=True, **kwargs):
+        kwargs.pop('return_dict', None)
+        batch, sequence = input_ids.shape
+        past = past_key_values[0][0].shape[2] if past_key_values else 0
+        key = (_bucket(batch, self.batch_buckets), _bucket(sequence, self.sequence_buckets),
+               _bucket(past, self.past_buckets))
+
+        graph = None
+        if not kwargs and use_cache and None not in key:
+            graph = self._graph(key)
+        if graph is None:
+            return self._eager(input_ids, past_key_values, attention_mask, position_ids, use_cache, **kwargs)
+
+        padded_batch, padded_sequence, padded_past = key
+        device = input_ids.device
+        if attention_mask is None:
+            attention_mask = torch.ones((batch, past + sequence), dtype=torch.long, device=device)
+        if position_ids is None:
+            position_ids = torch.arange(past, past + sequence, device=device).unsqueeze(0).repeat(batch, 1)
+
+        # Left padding in both the cache and the new tokens, masked out of attention
+        ids = torch.zeros((padded_batch, padded_sequence), dtype=torch.long, device=device)
+        ids[:batch, padded_sequence - sequence:] = input_ids
+        positions = torch.zeros((padded_batch, padded_sequence), dtype=torch.long, device=device)
+        positions[:batch, padded_sequence - sequence:] = position_ids
+        mask = torch.zeros((padded_batch, padded_past + padded_sequence), dtype=torch.long, device=device)
+        mask[:batch, padded_past - past:padded_past] = attention_mask[:, :past]
+        mask[:batch, padded_past + padded_sequence - sequence:] = attention_mask[:, past:]
+        # Dummy rows attend to their own last token so no attention row is empty
+        mask[batch:, -1] = 1
+
+        heads, head_dim = self.cache_shape
+        cache = []
+        for layer in range(self.model.config.n_layer):
+            for tensor in past_key_values[layer] if past_key_values else (None, None):
+                padded = torch.zeros((padded_batch, heads, padded_past, head_dim),
+                                     dtype=next(self.model.parameters()).dtype, device=device)
+                if tensor is not None and past:
+                    padded[:batch, :, padded_past - past:] = tensor
+                cache.append(padded)
+
+        with torch.no_grad():
+            outputs = graph(ids, mask, positions, *cache)
+        self.__dict__['compiled_calls'] += 1
+
+        logits = outputs[0][:batch, padded_sequence - sequence:]
+        present = []
+        for layer in range(self.model.config.n_layer):
+            key_value = []
+            for tensor in outputs[1 + 2 * layer], outputs[2 + 2 * layer]:
+                tensor = tensor[:batch]
+                real = [tensor[:, :, padded_past - past:padded_past], tensor[:, :, padded_past + padded_sequence - sequence:]]
+                key_value.append(torch.cat(real, dim=2))
+            present.append(tuple(key_value))
+        return CausalLMOutputWithPast(logits=logits, past_key_values=tuple(present))
+
+    forward = __call__
+
+    def compile_stats(self):
+        return {
+            'mode': self.mode,
+            'graphs': len(self.graphs),
+            'compile_seconds': round(self.compile_seconds, 2),
+            'compiled_calls': self.compiled_calls,
+            'eager_calls': self.eager_calls
+        }
+
+
+def compile_model(model, mode="trace", **kwargs):
+    """Wrap a torch GPT-2 model for bucketed compiled execution; other backends are returned as-is"""
+    mode = (mode or "off").lower()
+    if mode not in COMPILE_MODES:
+        print(f"Unknown compile mode '{mode}', running eagerly")
+        return model
+    if mode == "off" or getattr(model, 'backend', 'torch') != 'torch':
+        return model
+    return CompiledGPT2Model(model, mode=mode, **kwargs)
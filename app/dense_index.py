@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Dense retrieval over every knowledge source
+
+Facts from the compiled knowledge snapshot (knowledge_bases/verified/*.json,
+VerifiedHeartAttackKnowledgeSystem and HeartAttackKnowledgeSystem, see
+kb_snapshot.py) are embedded as hashed TF-IDF vectors (word
+terms plus character trigrams, so "symptons" or "it's symptoms" still land
+near the right fact) and stored L2-normalized in a float32 .npy matrix that
+is memory-mapped on load. A query is one matrix-vector product against the
+whole matrix. The index is rebuilt only when a source file changes.
+
+    python dense_index.py                 # build (or refresh) the index
+    python dense_index.py "chest pain?"   # show the top matches
+"""
+
+import hashlib
+import json
+import math
+import os
+import sys
+import zlib
+from collections import defaultdict
+import numpy as np
+from knowledge_index import tokenize
+from kb_snapshot import BASE_DIR, KEYWORD_SYSTEM_SOURCE, VERIFIED_DIR, KnowledgeSnapshot, source_fingerprint
+DEFAULT_INDEX_DIR = os.environ.get('MEDAI_KB_INDEX_DIR', os.path.join(BASE_DIR, "knowledge_bases", "index"))
+
+VECTORS_NAME = "vectors.npy"
+IDF_NAME = "idf.npy"
+DOCUMENTS_NAME = "documents.json"
+MANIFEST_NAME = "manifest.json"
+
+DIMENSIONS = 1024
+# Bump when _features or tokenize changes so saved indexes are rebuilt
+FEATURE_VERSION = 2
+# Key terms say what a fact is about; answer text only adds context
+KEY_WEIGHT = 2.0
+TRIGRAM_WEIGHT = 0.3
+# answer() needs this cosine score and this fraction of the query's terms among the fact's key terms
+MIN_SCORE = 0.35
+MIN_COVERAGE = 0.6
+
+
+def _features(text):
+    """Hashed feature -> weight for words and their character trigrams"""
+    features = defaultdict(float)
+    for word in tokenize(text):
+        features["w:" + word] += 1.0
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            features["c:" + padded[i:i + 3]] += TRIGRAM_WEIGHT
+    hashed = defaultdict(float)
+    for feature, weight in features.items():
+        code = zlib.crc32(feature.encode('utf-8'))
+        # The sign bit keeps colliding features from always adding up
+        sign = 1.0 if code & 0x80000000 else -1.0
+        hashed[code % DIMENSIONS] += sign * (1.0 + math.log(weight) if weight >= 1 else weight)
+    return hashed
+
+
+def _document_features(key, answer):
+    combined = defaultdict(float)
+    for bucket, weight in _features(key).items():
+        combined[bucket] += KEY_WEIGHT * weight
+    for bucket, weight in _features(answer).items():
+        combined[bucket] += weight
+    return combined
+
+
+def _vector(features, idf):
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for bucket, weight in features.items():
+        vector[bucket] += weight
+    vector *= idf
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def knowledge_documents(verified_dir=VERIFIED_DIR):
+    """(key, answer, source) for every fact in the knowledge snapshot (verified JSON files first); duplicate keys keep the first"""
+    return snapshot_documents(KnowledgeSnapshot.load_or_build(verified_dir=verified_dir))
+
+
+def snapshot_documents(snapshot):
+    """(key, answer, source) for every fact of a loaded snapshot; keyword categories get their keywords as key terms"""
+    keywords = {}
+    for keyword, category in snapshot.keywords():
+        keywords.setdefault(category, []).append(keyword)
+
+    documents = []
+    seen = set()
+    for fact in range(len(snapshot)):
+        source = snapshot.source(fact)
+        key = snapshot.key(fact)
+        answer = snapshot.answer(fact)
+        if source == KEYWORD_SYSTEM_SOURCE:
+            category = int(snapshot.facts[fact]['category'])
+            # Keyword lists repeat words ("signs", "warning signs"); count each once
+            words = " ".join([key.replace("_", " ")] + keywords.get(category, [])).split()
+            key = " ".join(dict.fromkeys(words))
+            answer += snapshot.disclaimer
+        if key not in seen:
+            seen.add(key)
+            documents.append((key, answer, source))
+    return documents
+
+
+def index_fingerprint(verified_dir=VERIFIED_DIR, sources=None):
+    """Knowledge source fingerprint (or the given one) salted with the embedding settings"""
+    sources = sources or source_fingerprint(verified_dir)
+    return hashlib.sha256(f"dims={DIMENSIONS}:v{FEATURE_VERSION}:{sources}".encode('utf-8')).hexdigest()
+
+
+def covering_answer(query, results, min_score=MIN_SCORE, min_coverage=MIN_COVERAGE):
+    """First (key, score, answer) result that clears min_score and whose key terms cover the query, else None
+
+    Cosine alone lets a query ride on one shared word ("symptoms of flu"
+    lands on heart attack symptoms), so the fact's key terms must also
+    contain min_coverage of the query's terms.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return None
+    for key, score, answer in results:
+        if score < min_score:
+            break
+        if len(terms & set(tokenize(key))) / len(terms) >= min_coverage:
+            return answer
+    return None
+
+
+class DenseKnowledgeIndex:
+    """Memory-mapped matrix of normalized fact vectors with cosine top-k search"""
+
+    def __init__(self, vectors, idf, documents):
+        self.vectors = vectors
+        self.idf = idf
+        self.keys = [doc[0] for doc in documents]
+        self.answers = [doc[1] for doc in documents]
+        self.sources = [doc[2] for doc in documents]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def embed_documents(documents):
+        """(vectors, idf) for (key, answer, source) documents"""
+        features = []
+        document_frequency = np.zeros(DIMENSIONS, dtype=np.float64)
+        for key, answer, _ in documents:
+            combined = _document_features(key, answer)
+            features.append(combined)
+            document_frequency[list(combined)] += 1
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)).astype(np.float32) + 1
+        vectors = np.zeros((len(documents), DIMENSIONS), dtype=np.float32)
+        for row, combined in enumerate(features):
+            vectors[row] = _vector(combined, idf)
+        return vectors, idf
+
+    @classmethod
+    def build(cls, documents, index_dir=DEFAULT_INDEX_DIR, fingerprint=None):
+        """Embed documents and write the index files (atomically, so readers never see a half-built index)"""
+        vectors, idf = cls.embed_documents(documents)
+        os.makedirs(index_dir, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        for name, array in ((VECTORS_NAME, vectors), (IDF_NAME, idf)):
+            with open(os.path.join(index_dir, name + suffix), 'wb') as f:
+                np.save(f, array)
+        with open(os.path.join(index_dir, DOCUMENTS_NAME + suffix), 'w', encoding='utf-8') as f:
+            json.dump(documents, f, ensure_ascii=False)
+        with open(os.path.join(index_dir, MANIFEST_NAME + suffix), 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'documents': len(documents), 'dimensions': DIMENSIONS}, f, indent=2)
+        # Manifest last: a matching fingerprint means the other files are complete
+        for name in (VECTORS_NAME, IDF_NAME, DOCUMENTS_NAME, MANIFEST_NAME):
+            os.replace(os.path.join(index_dir, name + suffix), os.path.join(index_dir, name))
+        print(f"Built dense knowledge index: {len(documents)} facts x {DIMENSIONS} dims in {index_dir}")
+        return cls.load(index_dir)
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR):
+        vectors = np.load(os.path.join(index_dir, VECTORS_NAME), mmap_mode='r')
+        idf = np.load(os.path.join(index_dir, IDF_NAME))
+        with open(os.path.join(index_dir, DOCUMENTS_NAME), 'r', encoding='utf-8') as f:
+            documents = json.load(f)
+        return cls(vectors, idf, documents)
+
+    @classmethod
+    def load_or_build(cls, index_dir=DEFAULT_INDEX_DIR, verified_dir=VERIFIED_DIR):
+        """Open the index, rebuilding it first when any knowledge source changed"""
+        return cls.load_cached(index_dir, index_fingerprint(verified_dir), lambda: knowledge_documents(verified_dir))
+
+    @classmethod
+    def load_cached(cls, index_dir, fingerprint, documents):
+        """Open the index in index_dir if it was built for fingerprint, else build it there from documents()"""
+        try:
+            with open(os.path.join(index_dir, MANIFEST_NAME), 'r') as f:
+                if json.load(f).get('fingerprint') == fingerprint:
+                    return cls.load(index_dir)
+        except (OSError, ValueError):
+            pass
+        return cls.build(documents(), index_dir, fingerprint)
+
+    def embed(self, text):
+        return _vector(_features(text), self.idf)
+
+    def search(self, query, k=5):
+        """Top-k (key, cosine score, answer) for query, best first"""
+        if not len(self.keys):
+            return []
+        scores = self.vectors @ self.embed(query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.keys[i], float(scores[i]), self.answers[i]) for i in top]
+
+    def answer(self, query, min_score=MIN_SCORE, min_coverage=MIN_COVERAGE, k=3):
+        """Answer of the best fact among the top k that clears min_score and covers the query (covering_answer)"""
+        return covering_answer(query, self.search(query, k), min_score, min_coverage)
+
+    def search_batch(self, queries, k=5):
+        """search() for many queries with one matrix-matrix product"""
+        if not len(self.keys):
+            return [[] for _ in queries]
+        scores = np.stack([self.embed(query) for query in queries]) @ self.vectors.T
+        k = min(k, scores.shape[1])
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top], kind='stable')]
+            results.append([(self.keys[i], float(row[i]), self.answers[i]) for i in top])
+        return results
+
+
+class SegmentedDenseIndex:
+    """Several DenseKnowledgeIndex segments (one per knowledge source) searched as one
+
+    Each segment is embedded with its own IDF, like the per-source BM25
+    indexes of a KnowledgeView, so changing one source re-embeds only that
+    source. Scores are cosines of normalized vectors and are merged as-is.
+    With a vector_index (an ann_index.IVFSnapshot holding the same facts),
+    search probes it instead of scanning every segment; facts it still holds
+    from replaced or removed sources are skipped. A snapshot never changes,
+    so later inserts into the IVF index do not reach a published view.
+    """
+
+    def __init__(self, segments, vector_index=None):
+        self.segments = dict(segments)
+        self.vector_index = vector_index
+        self.facts = None
+        if vector_index is not None:
+            self.facts = {(key, answer) for segment in self.segments.values()
+                          for key, answer in zip(segment.keys, segment.answers)}
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments.values())
+
+    def documents(self):
+        """(key, answer, source) of every fact in every segment"""
+        return [document for segment in self.segments.values()
+                for document in zip(segment.keys, segment.answers, segment.sources)]
+
+    def search(self, query, k=5):
+        """Top-k (key, cosine score, answer) over every segment, best first"""
+        if self.vector_index is not None:
+            # Fetch more until k hits are facts of this view or the index runs out of candidates
+            fetch = 2 * k
+            while True:
+                hits = self.vector_index.search(query, fetch)
+                results = [(key, score, answer) for key, score, answer, _ in hits if (key, answer) in self.facts]
+                if len(results) >= k or len(hits) < fetch:
+                    return results[:k]
+                fetch *= 4
+        results = []
+        for segment in self.segments.values():
+            results.extend(segment.search(query, k))
+        results.sort(key=lambda result: -result[1])
+        return results[:k]
+
+    def answer(self, query, min_score=MIN_SCORE, min_coverage=MIN_COVERAGE, k=3):
+        return covering_answer(query, self.search(query, k), min_score, min_coverage)
+
+
+def main():
+    index = DenseKnowledgeIndex.load_or_build()
+    for query in sys.argv[1:]:
+        print(f"\n{query}")
+        for key, score, answer in index.search(query):
+            print(f"  {score:.3f}  {key}: {answer[:70]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import inspect
+import math
+import torch
+
+
+def apply_repetition_penalty(logits, token_ids, penalty):
+    """Penalize tokens that already appear in the sequence (same rule as HF generate)"""
+    if penalty == 1.0 or not token_ids:
+        return logits
+    index = torch.tensor(sorted(set(token_ids)), dtype=torch.long, device=logits.device)
+    score = logits.index_select(0, index)
+    score = torch.where(score < 0, score * penalty, score / penalty)
+    logits.index_copy_(0, index, score)
+    return logits
+
+
+def next_token_logits(logits, token_ids, temperature=0.7, top_k=50, repetition_penalty=1.0, do_sample=True):
+    """Apply the repetition penalty and, when sampling, temperature and top-k to a 1-D logits vector"""
+    logits = apply_repetition_penalty(logits.float().clone(), token_ids, repetition_penalty)
+
+    if not do_sample:
+        return logits
+
+    if temperature and temperature != 1.0:
+        logits = logits / temperature
+
+    if top_k and top_k < logits.size(-1):
+        threshold = torch.topk(logits, top_k)[0][-1]
+        logits = logits.masked_fill(logits < threshold, -float("inf"))
+    return logits
+
+
+def sample_next_token(logits, token_ids, temperature=0.7, top_k=50, repetition_penalty=1.0, do_sample=True):
+    """Pick the next token from a 1-D logits vector"""
+    logits = next_token_logits(logits, token_ids, temperature, top_k, repetition_penalty, do_sample)
+
+    if not do_sample:
+        return int(torch.argmax(logits))
+
+    probs = torch.softmax(logits, dim=-1)
+    return int(torch.multinomial(probs, num_samples=1))
+
+
+class PrefixCache:
+    """KV cache for a fixed prompt prefix, computed once per loaded model
+
+    Every request shares the same template scaffold (e.g. ``### Instruction:\n``),
+    so its keys and values are computed at load time and each request only
+    prefills the tokens that follow it. GPT-2 concatenates new keys onto the
+    cache rather than writing into it, so one cache is safely shared.
+    """
+
+    def __init__(self, model, tokenizer, prefix):
+        self.prefix = prefix
+        self.prefix_ids = tokenizer.encode(prefix)
+        device = next(model.parameters()).device
+
+        with torch.no_grad():
+            outputs = model(torch.tensor([self.prefix_ids], dtype=torch.long, device=device), use_cache=True)
+        self.past_key_values = tuple(tuple(t.detach() for t in layer) for layer in outputs.past_key_values)
+
+    def __len__(self):
+        return len(self.prefix_ids)
+
+    def suffix(self, token_ids):
+        """Return the tokens after the prefix, or None if the prompt does not start with it
+
+        BPE can merge across the template boundary (e.g. a question starting
+        with a newline), so the check is on token ids rather than text.
+        """
+        size = len(self.prefix_ids)
+        if len(token_ids) > size and list(token_ids[:size]) == self.prefix_ids:
+            return list(token_ids[size:])
+        return None
+
+    def prefill(self, model, token_ids):
+        """Run the model over a prompt starting from the cached prefix
+
+        Returns the model outputs (logits for the suffix, cache for the whole
+        prompt) or None when the prompt does not start with the prefix.
+        """
+        suffix = self.suffix(token_ids)
+        if suffix is None:
+            return None
+        device = self.past_key_values[0][0].device
+        with torch.no_grad():
+            return model(
+                torch.tensor([suffix], dtype=torch.long, device=device),
+                past_key_values=self.past_key_values,
+                use_cache=True
+            )
+
+    def past_for_generate(self, model, token_ids):
+        """Cache covering all but the last prompt token, as expected by ``model.generate``"""
+        suffix = self.suffix(token_ids)
+        if suffix is None:
+            return None
+        if len(suffix) == 1:
+            return self.past_key_values
+        outputs = self.prefill(model, token_ids[:-1])
+        return outputs.past_key_values if outputs is not None else None
+
+
+def _past_kwarg(model):
+    # transformers 4.25 (our pinned version) calls the generate cache "past"
+    params = inspect.signature(model.prepare_inputs_for_generation).parameters
+    return "past" if "past" in params else "past_key_values"
+
+
+def generate_with_prefix(model, input_ids, prefix_cache=None, **generate_kwargs):
+    """Call ``model.generate`` starting from a precomputed prefix cache when it applies"""
+    if prefix_cache is not None and input_ids.size(0) == 1:
+        past = prefix_cache.past_for_generate(model, input_ids[0].tolist())
+        if past is not None:
+            generate_kwargs[_past_kwarg(model)] = past
+    return model.generate(input_ids, **generate_kwargs)
+
+
+def stream_generate(model, input_ids, max_length=200, temperature=0.7, top_k=50,
+                    repetition_penalty=1.0, do_sample=True, eos_token_id=None, prefix_cache=None,
+                    stopping=None):
+    """Yield generated token ids one at a time, reusing the KV cache between steps
+
+    Mirrors the sampling settings of ``model.generate`` (``max_length`` counts
+    the prompt) so callers can switch to it without changing answers. An
+    optional ``stopping.StoppingCriteria`` ends generation early; the token
+    that triggered it is still yielded.
+    """
+    token_ids = input_ids[0].tolist()
+    next_input = input_ids
+    past_key_values = None
+
+    suffix = prefix_cache.suffix(token_ids) if prefix_cache is not None else None
+    if suffix is not None:
+        next_input = torch.tensor([suffix], dtype=torch.long, device=input_ids.device)
+        past_key_values = prefix_cache.past_key_values
+
+    try:
+        with torch.no_grad():
+            while len(token_ids) < max_length:
+                outputs = model(next_input, past_key_values=past_key_values, use_cache=True)
+                past_key_values = outputs.past_key_values
+
+                token = sample_next_token(
+                    outputs.logits[0, -1, :],
+                    token_ids,
+                    temperature=temperature,
+                    top_k=top_k,
+                    repetition_penalty=repetition_penalty,
+                    do_sample=do_sample
+                )
+                token_ids.append(token)
+                stopped = stopping is not None and stopping.check(token) is not None
+                yield token
+
+                if stopped or (eos_token_id is not None and token == eos_token_id):
+                    break
+                next_input = torch.tensor([[token]], dtype=torch.long, device=input_ids.device)
+    finally:
+        if stopping is not None:
+            stopping.finish()
+
+
+class NGramBanTable:
+    """Incrementally maintained equivalent of ``no_repeat_ngram_size``
+
+    HF generate rebuilds every n-gram of the sequence on each step; here each
+    new token registers just the one n-gram it completes, and the banned set
+    for the next step is a single dict lookup.
+    """
+
+    def __init__(self, n, token_ids=()):
+        self.n = n
+        self.table = {}
+        if n > 0:
+            for end in range(n, len(token_ids) + 1):
+                self._register(token_ids[end - n:end])
+
+    def _register(self, ngram):
+        self.table.setdefault(tuple(ngram[:-1]), set()).add(ngram[-1])
+
+    def add(self, token_ids):
+        """Register the n-gram ending at the newest token"""
+        if self.n > 0 and len(token_ids) >= self.n:
+            self._register(token_ids[-self.n:])
+
+    def banned(self, token_ids):
+        if self.n <= 0 or len(token_ids) + 1 < self.n:
+            return ()
+        return self.table.get(tuple(token_ids[len(token_ids) - self.n + 1:]), ())
+
+
+class StaticCacheDecoder:
+    """Token-by-token GPT-2 decoding over a preallocated KV buffer
+
+    Runs the model's own blocks but writes keys and values into a fixed
+    ``[layers, heads, max_length, head_dim]`` buffer instead of growing the
+    cache with ``torch.cat`` every step. The repetition penalty is a per-vocab
+    factor vector updated as tokens are added and n-gram bans come from an
+    NGramBanTable, so sampling reproduces ``model.generate`` with
+    ``repetition_penalty`` and ``no_repeat_ngram_size``.
+
+    One decoder is created per loaded model and reused across requests; it is
+    not safe to share between threads.
+    """
+
+    def __init__(self, model, max_length=200):
+        transformer = model.transformer
+        config = model.config
+        self.model = model
+        self.max_length = max_length
+        self.wte = transformer.wte
+        self.wpe = transformer.wpe
+        self.blocks = transformer.h
+        self.ln_f = transformer.ln_f
+        self.lm_head = model.lm_head
+
+        self.num_heads = config.n_head
+        self.embed_dim = config.n_embd
+        self.head_dim = config.n_embd // config.n_head
+        self.scale = math.sqrt(self.head_dim) if getattr(config, 'scale_attn_weights', True) else 1.0
+        self.inverse_layer_scale = getattr(config, 'scale_attn_by_inverse_layer_idx', False)
+
+        param = next(model.parameters())
+        self.device = param.device
+        dtype = self.wte.weight.dtype
+        shape = (config.n_layer, self.num_heads, max_length, self.head_dim)
+        self.keys = torch.zeros(shape, dtype=dtype, device=self.device)
+        self.values = torch.zeros(shape, dtype=dtype, device=self.device)
+        self.causal_mask = torch.ones((max_length, max_length), dtype=torch.bool, device=self.device).tril()
+        self.positions = torch.arange(max_length, dtype=torch.long, device=self.device)
+
+        vocab_size = config.vocab_size
+        self._penalty = torch.ones(vocab_size, device=self.device)
+        self._inverse_penalty = torch.ones(vocab_size, device=self.device)
+        self._negative = torch.zeros(vocab_size, dtype=torch.bool, device=self.device)
+        self._logits = torch.zeros(vocab_size, device=self.device)
+
+    def forward(self, token_ids, start):
+        """Run tokens at positions [start, start + len) and return logits for the last one"""
+        length = len(token_ids)
+        end = start + length
+        input_ids = torch.tensor(token_ids, dtype=torch.long, device=self.device)
+        hidden = self.wte(input_ids) + self.wpe(self.positions[start:end])
+        mask = self.causal_mask[start:end, :end]
+
+        for layer, block in enumerate(self.blocks):
+            attn = block.attn
+            query, key, value = attn.c_attn(block.ln_1(hidden)).split(self.embed_dim, dim=-1)
+            query = query.view(length, self.num_heads, self.head_dim).transpose(0, 1)
+            self.keys[layer, :, start:end] = key.view(length, self.num_heads, self.head_dim).transpose(0, 1)
+            self.values[layer, :, start:end] = value.view(length, self.num_heads, self.head_dim).transpose(0, 1)
+
+            scores = torch.matmul(query, self.keys[layer, :, :end].transpose(-1, -2)) / self.scale
+            if self.inverse_layer_scale:
+                scores = scores / float(layer + 1)
+            scores = scores.masked_fill(~mask, torch.finfo(scores.dtype).min)
+            context = torch.matmul(torch.softmax(scores, dim=-1), self.values[layer, :, :end])
+            context = context.transpose(0, 1).reshape(length, self.embed_dim)
+
+            hidden = hidden + attn.c_proj(context)
+            hidden = hidden + block.mlp(block.ln_2(hidden))
+
+        return self.lm_head(self.ln_f(hidden[-1:]))[0]
+
+    def _prefill(self, token_ids, prefix_cache=None):
+        suffix = prefix_cache.suffix(token_ids) if prefix_cache is not None else None
+        if suffix is None:
+            return self.forward(token_ids, 0)
+
+        # Copy the precomputed template keys/values instead of recomputing them
+        size = len(prefix_cache)
+        for layer, (key, value) in enumerate(prefix_cache.past_key_values):
+            self.keys[layer, :, :size] = key[0]
+            self.values[layer, :, :size] = value[0]
+        return self.forward(suffix, size)
+
+    def _mark_seen(self, token, penalty):
+        self._penalty[token] = penalty
+        self._inverse_penalty[token] = 1.0 / penalty
+
+    def generate(self, input_ids, max_length=200, temperature=0.7, top_k=50, repetition_penalty=1.0,
+                 no_repeat_ngram_size=0, do_sample=True, eos_token_id=None, prefix_cache=None,
+                 stopping=None):
+        """Yield generated token ids one at a time (``max_length`` counts the prompt)"""
+        token_ids = input_ids[0].tolist() if isinstance(input_ids, torch.Tensor) else list(input_ids)
+        max_length = min(max_length, self.max_length)
+        if not token_ids or len(token_ids) >= max_length:
+            return
+
+        self._penalty.fill_(1.0)
+        self._inverse_penalty.fill_(1.0)
+        if repetition_penalty != 1.0:
+            for token in set(token_ids):
+                self._mark_seen(token, repetition_penalty)
+        bans = NGramBanTable(no_repeat_ngram_size, token_ids)
+
+        try:
+            with torch.no_grad():
+                logits = self._prefill(token_ids, prefix_cache)
+
+                while True:
+                    scores = self._logits
+                    scores.copy_(logits)
+
+                    if repetition_penalty != 1.0:
+                        torch.lt(scores, 0, out=self._negative)
+                        scores.mul_(torch.where(self._negative, self._penalty, self._inverse_penalty))
+
+                    banned = bans.banned(token_ids)
+                    if banned:
+                        scores[list(banned)] = -float("inf")
+
+                    if do_sample:
+                        if temperature and temperature != 1.0:
+                            scores.div_(temperature)
+                        if top_k and top_k < scores.size(0):
+                            threshold = torch.topk(scores, top_k)[0][-1]
+                            scores.masked_fill_(scores < threshold, -float("inf"))
+                        token = int(torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1))
+                    else:
+                        token = int(torch.argmax(scores))
+
+                    token_ids.append(token)
+                    bans.add(token_ids)
+                    if repetition_penalty != 1.0:
+                        self._mark_seen(token, repetition_penalty)
+                    stopped = stopping is not None and stopping.check(token) is not None
+                    yield token
+
+                    if stopped or token == eos_token_id or len(token_ids) >= max_length:
+                        break
+                    logits = self.forward([token], len(token_ids) - 1)
+        finally:
+            if stopping is not None:
+                stopping.finish()
+
+
+class StreamingTextDecoder:
+    """Turn a growing list of token ids into printable text deltas
+
+    Byte-level BPE can split a single character across tokens, so text is only
+    emitted once the pending tokens decode to complete characters.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, token_id):
+        self.token_ids.append(token_id)
+
+        prefix_text = self.tokenizer.decode(
+            self.token_ids[self.prefix_offset:self.read_offset], skip_special_tokens=True
+        )
+        new_text = self.tokenizer.decode(
+            self.token_ids[self.prefix_offset:], skip_special_tokens=True
+        )
+
+        if len(new_text) > len(prefix_text) and not new_text.endswith("�"):
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.token_ids)
+            return new_text[len(prefix_text):]
+        return ""
+
+    def text(self):
+        return self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
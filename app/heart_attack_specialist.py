@@ -3,6 +3,9 @@ import sys
 import torch
 import warnings
 from typing import Dict, List, Optional
+from generation import PrefixCache, generate_with_prefix
+from precision import apply_precision, DEFAULT_PRECISION
+from stopping import default_stopping_criteria
 
 # Add the knowledge_bases directory to the path to import heart_attack_knowledge
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,10 +23,12 @@ except ImportError:
                 return "Knowledge base not available. Please ask about heart attack symptoms, prevention, or emergency response."
 
 class HeartAttackSpecialist:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, precision=DEFAULT_PRECISION):
         self.model_path = model_path
+        self.precision = precision
         self.tokenizer = None
         self.model = None
+        self.prefix_cache = None
         self.knowledge_system = HeartAttackKnowledgeSystem()
         
         # Load model if path provided
@@ -33,18 +38,19 @@ class HeartAttackSpecialist:
     def load_model(self, model_path):
         """Load model with PyTorch compatibility"""
         try:
-            from transformers import GPT2Tokenizer, GPT2LMHeadModel
+            from transformers import GPT2LMHeadModel
+            from tokenization import load_tokenizer
             
             # Load tokenizer
-            self.tokenizer = GPT2Tokenizer.from_pretrained(model_path)
+            self.tokenizer = load_tokenizer(model_path)
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
                 
             # Load model
             self.model = GPT2LMHeadModel.from_pretrained(model_path)
             
-            # Set to evaluation mode
-            self.model.eval()
+            # Set to evaluation mode in the requested precision
+            self.model = apply_precision(self.model, self.precision)
             
             # Handle device assignment
             if hasattr(self.model, 'device'):
@@ -53,12 +59,16 @@ class HeartAttackSpecialist:
                 self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
                 self.model.to(self.device)
                 
+            # Precompute the KV cache for the fixed instruction scaffold
+            self.prefix_cache = PrefixCache(self.model, self.tokenizer, "### Instruction:\n")
+                
             print(f"Heart attack model loaded on {self.device}")
             
         except Exception as e:
             warnings.warn(f"Error loading model: {str(e)}")
             self.model = None
             self.tokenizer = None
+            self.prefix_cache = None
             
     def get_response(self, question):
         """Get a response using knowledge base first, then model"""
@@ -73,7 +83,7 @@ class HeartAttackSpecialist:
             
         return "Please ask about heart attack symptoms, prevention, or emergency response."
         
-    def generate_with_model(self, question, max_length=200):
+    def generate_with_model(self, question, max_length=200, max_new_tokens=None):
         """Generate response with model"""
         try:
             input_text = f"### Instruction:\n{question}\n\n### Response:\n"
@@ -83,26 +93,47 @@ class HeartAttackSpecialist:
             
             # Move to appropriate device
             inputs = inputs.to(self.device)
+            stopping = default_stopping_criteria(
+                self.tokenizer,
+                max_new_tokens=max_new_tokens,
+                budget=max_length - inputs.size(1),
+                eos_token_id=self.tokenizer.eos_token_id
+            )
                 
             # Generate response
             with torch.no_grad():
-                outputs = self.model.generate(
+                outputs = generate_with_prefix(
+                    self.model,
                     inputs,
+                    self.prefix_cache,
                     max_length=max_length,
                     num_return_sequences=1,
                     temperature=0.7,
                     do_sample=True,
                     pad_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.1
+                    repetition_penalty=1.1,
+                    stopping_criteria=stopping.as_hf_stopping_criteria()
                 )
+            stopping.finish()
             
             # Decode response
             response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
             if "### Response:" in response:
-                response = response.split("### Response:")[-1].strip()
+                response = stopping.trim(response.split("### Response:")[-1])
                 
             return response
             
         except Exception as e:
             warnings.warn(f"Error generating response: {str(e)}")
-            return "Error generating response. Please try again."
\ No newline at end of file
+            return "Error generating response. Please try again."
+            
+    def generate_batch_with_model(self, questions, batch_size=16, max_length=200):
+        """Generate responses for many questions using padded, length-bucketed batches"""
+        from batch_inference import batch_generate
+        
+        answers = [None] * len(questions)
+        records = ((i, {'question': q}) for i, q in enumerate(questions))
+        for result in batch_generate(self.model, self.tokenizer, records,
+                                     batch_size=batch_size, max_length=max_length):
+            answers[result['index']] = result['answer']
+        return answers
@@ -0,0 +1,498 @@
+import itertools
+import queue
+import threading
+import time
+import weakref
+from collections import Counter
+import torch
+from generation import sample_next_token
+from speculative import verify_draft_token
+
+# Lower value is admitted first
+PRIORITY_EMERGENCY = 0
+PRIORITY_NORMAL = 1
+
+# Weight of the newest sample in the running mean of request service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class DeadlineExceeded(Exception):
+    """The request's latency deadline passed before it got a batch slot"""
+
+
+class EngineClosed(RuntimeError):
+    """The engine is draining or stopped and takes no new requests"""
+
+
+class GenerationRequest:
+    """A single prompt travelling through the batching engine"""
+
+    def __init__(self, prompt_ids, max_length=200, temperature=0.7, top_k=50,
+                 repetition_penalty=1.0, do_sample=True, eos_token_id=None, stopping=None,
+                 priority=PRIORITY_NORMAL, deadline=None):
+        self.prompt_ids = list(prompt_ids)
+        self.token_ids = list(prompt_ids)
+        self.generated = []
+        self.max_length = max_length
+        self.temperature = temperature
+        self.top_k = top_k
+        self.repetition_penalty = repetition_penalty
+        self.do_sample = do_sample
+        self.eos_token_id = eos_token_id
+        # Optional stopping.StoppingCriteria checked after every token
+        self.stopping = stopping
+        # Admission order and absolute time.time() after which it is shed instead of started
+        self.priority = priority
+        self.deadline = deadline
+
+        # KV cache slot and number of tokens currently held in it
+        self.slot = None
+        self.length = 0
+
+        self.error = None
+        self.cancelled = False
+        self.submitted_at = time.time()
+        self.admitted_at = None
+        self._tokens = queue.Queue()
+        self._done = threading.Event()
+        self._listeners = []
+        self._listener_lock = threading.Lock()
+
+    def push(self, token):
+        with self._listener_lock:
+            self.token_ids.append(token)
+            self.generated.append(token)
+            listeners = list(self._listeners)
+        self._tokens.put(token)
+        for listener in listeners:
+            listener(token)
+
+    def finish(self, error=None):
+        with self._listener_lock:
+            self.error = error
+            self._done.set()
+            listeners = list(self._listeners)
+        self._tokens.put(None)
+        for listener in listeners:
+            listener(None)
+
+    def subscribe(self, listener):
+        """Call listener(token) for every generated token, then listener(None) at the end
+
+        Tokens produced before subscribing are replayed first (under the lock,
+        so they stay in order); the listener must return quickly. Used by the
+        asyncio server to get tokens without parking a thread per request.
+        """
+        with self._listener_lock:
+            for token in self.generated:
+                listener(token)
+            if self._done.is_set():
+                listener(None)
+            else:
+                self._listeners.append(listener)
+
+    def cancel(self):
+        """Ask the engine to drop this sequence at the next step (e.g. client disconnected)"""
+        self.cancelled = True
+
+    def is_finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until generation ends and return the generated token ids
+
+        Raises TimeoutError if it has not ended within timeout seconds.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Generation did not finish within {timeout:g}s")
+        if self.error:
+            raise self.error
+        return list(self.generated)
+
+    def iter_tokens(self, timeout=None):
+        """Yield generated token ids as soon as the engine produces them
+
+        Raises TimeoutError if the next token takes longer than timeout seconds.
+        """
+        while True:
+            try:
+                token = self._tokens.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No token within {timeout:g}s")
+            if token is None:
+                break
+            yield token
+        if self.error:
+            raise self.error
+
+
+class ContinuousBatchingEngine:
+    """Iteration-level batching for GPT-2 style models
+
+    A single worker thread owns the model. New requests are admitted between
+    decoding steps, each gets its own slot in a preallocated KV cache, and a
+    sequence gives its slot back as soon as it emits EOS or reaches its length
+    limit, so concurrent users share every forward pass instead of queueing
+    behind each other.
+
+    With a ``speculative`` PromptLookup, steps where a single sequence is
+    active verify a drafted continuation in one forward pass instead of
+    decoding one token; rejected draft positions are simply overwritten later
+    in the slot.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_length=200, prefix_cache=None, speculative=None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.speculative = speculative
+        self.max_batch_size = max_batch_size
+        self.max_length = max_length
+
+        config = model.config
+        head_dim = config.n_embd // config.n_head
+        param = next(model.parameters())
+        self.device = param.device
+        shape = (max_batch_size, config.n_head, max_length, head_dim)
+        self.key_cache = [torch.zeros(shape, dtype=param.dtype, device=param.device) for _ in range(config.n_layer)]
+        self.value_cache = [torch.zeros(shape, dtype=param.dtype, device=param.device) for _ in range(config.n_layer)]
+
+        self.free_slots = list(range(max_batch_size))
+        self.active = []
+        # Entries are (priority, arrival order, request) so emergencies jump the queue
+        self.waiting = queue.PriorityQueue()
+        self.waiting_counts = Counter()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        # Every request not yet collected by its caller, for drain()
+        self._submitted = weakref.WeakSet()
+
+        self.steps = 0
+        self.tokens_generated = 0
+        self.requests_completed = 0
+        self.draft_tokens = 0
+        self.accepted_draft_tokens = 0
+        self.requests_shed = 0
+        self.mean_service_time = None
+        self.started_at = None
+
+        self._running = False
+        self._closed = False
+        self._thread = None
+
+    # ---------------- Public API ----------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._closed = False
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="inference-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._closed = True
+        self._running = False
+        # Sorts ahead of every request so the worker wakes up and exits
+        self.waiting.put((-1, next(self._order), None))
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # Nothing can be queued once closed; fail what the worker left (or never saw)
+        while True:
+            try:
+                request = self._take(self.waiting.get_nowait())
+            except queue.Empty:
+                break
+            if request is not None:
+                request.finish(RuntimeError("Inference engine stopped"))
+
+    def submit(self, prompt_ids, **kwargs):
+        """Queue a prompt and return its GenerationRequest handle
+
+        Raises EngineClosed once drain() or stop() has begun; after a model
+        swap the caller resubmits to the engine that replaced this one.
+        """
+        kwargs['max_length'] = min(kwargs.get('max_length', self.max_length), self.max_length)
+        request = GenerationRequest(prompt_ids, **kwargs)
+        with self._lock:
+            if self._closed:
+                raise EngineClosed("Inference engine is no longer accepting requests")
+            self.waiting_counts[request.priority] += 1
+            self._submitted.add(request)
+            # Queued under the lock so stop() cannot miss a request it has accepted
+            self.waiting.put((request.priority, next(self._order), request))
+        return request
+
+    def in_flight(self):
+        """Number of submitted requests that have not finished yet"""
+        with self._lock:
+            return sum(1 for request in list(self._submitted) if not request.is_finished())
+
+    def drain(self, timeout=None, poll_interval=0.05):
+        """Stop accepting requests, let queued and running ones finish, then stop; False if the timeout cut them off"""
+        with self._lock:
+            self._closed = True
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.in_flight():
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(poll_interval)
+        drained = not self.in_flight()
+        self.stop()
+        return drained
+
+    def projected_latency(self, priority=PRIORITY_NORMAL):
+        """Estimated seconds until a new request at this priority would finish
+
+        Requests of equal or higher priority already waiting must get a slot
+        first; slots free up at roughly max_batch_size per mean service time.
+        Returns 0 until a request has completed and there is data to go on.
+        """
+        if self.mean_service_time is None:
+            return 0.0
+        with self._lock:
+            ahead = sum(count for p, count in self.waiting_counts.items() if p <= priority)
+        blocked = max(0, ahead - len(self.free_slots) + 1)
+        return blocked * self.mean_service_time / self.max_batch_size + self.mean_service_time
+
+    def generate(self, prompt_ids, **kwargs):
+        """Blocking helper returning the generated token ids for one prompt"""
+        return self.submit(prompt_ids, **kwargs).wait()
+
+    def stats(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        with self._lock:
+            waiting_by_priority = dict(self.waiting_counts)
+        return {
+            'active_sequences': len(self.active),
+            'waiting_requests': self.waiting.qsize(),
+            'waiting_by_priority': waiting_by_priority,
+            'free_slots': len(self.free_slots),
+            'decode_steps': self.steps,
+            'tokens_generated': self.tokens_generated,
+            'requests_completed': self.requests_completed,
+            'tokens_per_second': round(self.tokens_generated / elapsed, 2) if elapsed > 0 else 0.0,
+            'speculative': self.speculative is not None,
+            'draft_tokens': self.draft_tokens,
+            'accepted_draft_tokens': self.accepted_draft_tokens,
+            'draft_acceptance': round(self.accepted_draft_tokens / self.draft_tokens, 3) if self.draft_tokens else 0.0,
+            'requests_shed': self.requests_shed,
+            'mean_service_ms': round(self.mean_service_time * 1000, 1) if self.mean_service_time else None
+        }
+
+    # ---------------- Worker loop ----------------
+    def _run(self):
+        while self._running:
+            try:
+                if not self.active:
+                    # Idle: sleep until something arrives
+                    request = self._take(self.waiting.get())
+                    if request is None:
+                        break
+                    self._admit(request)
+
+                self._admit_waiting()
+
+                if self.active:
+                    self._decode_step()
+            except Exception as e:
+                print(f"Inference engine error: {e}")
+                for request in list(self.active):
+                    self._retire(request, error=e)
+
+        for request in list(self.active):
+            self._retire(request, error=RuntimeError("Inference engine stopped"))
+        while True:
+            try:
+                request = self._take(self.waiting.get_nowait())
+            except queue.Empty:
+                break
+            if request is not None:
+                request.finish(RuntimeError("Inference engine stopped"))
+
+    def _take(self, entry):
+        """Unwrap a queue entry and update the per-priority depth"""
+        request = entry[2]
+        if request is not None:
+            with self._lock:
+                self.waiting_counts[request.priority] -= 1
+                if not self.waiting_counts[request.priority]:
+                    del self.waiting_counts[request.priority]
+        return request
+
+    def _admit_waiting(self):
+        while self.free_slots:
+            try:
+                request = self._take(self.waiting.get_nowait())
+            except queue.Empty:
+                return
+            if request is None:
+                self._running = False
+                return
+            self._admit(request)
+
+    def _admit(self, request):
+        """Prefill a new prompt into a free KV slot and sample its first token"""
+        prompt_length = len(request.prompt_ids)
+        if prompt_length == 0 or prompt_length >= request.max_length or request.cancelled:
+            request.finish()
+            return
+        if request.deadline is not None and time.time() > request.deadline:
+            # Starting now would already miss the deadline; let the caller answer another way
+            self.requests_shed += 1
+            request.finish(DeadlineExceeded("Deadline passed while queued"))
+            return
+
+        request.admitted_at = time.time()
+
+        request.slot = self.free_slots.pop()
+        self.active.append(request)
+
+        try:
+            outputs = None
+            if self.prefix_cache is not None:
+                outputs = self.prefix_cache.prefill(self.model, request.prompt_ids)
+            if outputs is None:
+                input_ids = torch.tensor([request.prompt_ids], dtype=torch.long, device=self.device)
+                with torch.no_grad():
+                    outputs = self.model(input_ids, use_cache=True)
+
+            for layer, (key, value) in enumerate(outputs.past_key_values):
+                self.key_cache[layer][request.slot, :, :prompt_length] = key[0]
+                self.value_cache[layer][request.slot, :, :prompt_length] = value[0]
+            request.length = prompt_length
+
+            self._append_token(request, outputs.logits[0, -1, :])
+        except Exception as e:
+            self._retire(request, error=e)
+
+    def _decode_step(self):
+        """Advance every active sequence by one token in a single forward pass"""
+        batch = list(self.active)
+        if self.speculative is not None and len(batch) == 1 and self._speculative_step(batch[0]):
+            return
+
+        slots = torch.tensor([r.slot for r in batch], dtype=torch.long, device=self.device)
+        lengths = torch.tensor([r.length for r in batch], dtype=torch.long, device=self.device)
+        max_len = max(r.length for r in batch)
+
+        past_key_values = tuple(
+            (key[:, :, :max_len].index_select(0, slots), value[:, :, :max_len].index_select(0, slots))
+            for key, value in zip(self.key_cache, self.value_cache)
+        )
+
+        # Each sequence only attends to its own cached tokens plus the new one
+        attention_mask = torch.zeros((len(batch), max_len + 1), dtype=torch.long, device=self.device)
+        for row, request in enumerate(batch):
+            attention_mask[row, :request.length] = 1
+        attention_mask[:, max_len] = 1
+
+        input_ids = torch.tensor([[r.token_ids[-1]] for r in batch], dtype=torch.long, device=self.device)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids,
+                past_key_values=past_key_values,
+                attention_mask=attention_mask,
+                position_ids=lengths.unsqueeze(1),
+                use_cache=True
+            )
+
+        for layer, (key, value) in enumerate(outputs.past_key_values):
+            self.key_cache[layer][slots, :, lengths] = key[:, :, -1]
+            self.value_cache[layer][slots, :, lengths] = value[:, :, -1]
+
+        self.steps += 1
+        for row, request in enumerate(batch):
+            request.length += 1
+            self._append_token(request, outputs.logits[row, -1, :])
+
+    def _speculative_step(self, request):
+        """Verify a drafted continuation for one sequence; False when there is nothing to draft"""
+        # Room for the draft plus the token that follows it, in both the request and the slot
+        room = min(request.max_length - len(request.token_ids), self.max_length - request.length) - 1
+        draft = self.speculative.draft(request.token_ids, room)
+        if not draft:
+            return False
+
+        start = request.length
+        end = start + 1 + len(draft)
+        past_key_values = tuple(
+            (key[request.slot:request.slot + 1, :, :start], value[request.slot:request.slot + 1, :, :start])
+            for key, value in zip(self.key_cache, self.value_cache)
+        )
+        input_ids = torch.tensor([[request.token_ids[-1]] + draft], dtype=torch.long, device=self.device)
+        position_ids = torch.arange(start, end, dtype=torch.long, device=self.device).unsqueeze(0)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids,
+                past_key_values=past_key_values,
+                position_ids=position_ids,
+                use_cache=True
+            )
+
+        for layer, (key, value) in enumerate(outputs.past_key_values):
+            self.key_cache[layer][request.slot, :, start:end] = key[0, :, start:end]
+            self.value_cache[layer][request.slot, :, start:end] = value[0, :, start:end]
+
+        self.steps += 1
+        self.draft_tokens += len(draft)
+        for position, draft_token in enumerate(draft + [None]):
+            request.length += 1
+            accepted = self._append_token(request, outputs.logits[0, position, :], draft_token)
+            if accepted:
+                self.accepted_draft_tokens += 1
+            if not accepted or request not in self.active:
+                break
+        return True
+
+    def _append_token(self, request, logits, draft_token=None):
+        """Sample (or verify a drafted) next token; returns whether the draft token was kept"""
+        if draft_token is None:
+            token = sample_next_token(
+                logits,
+                request.token_ids,
+                temperature=request.temperature,
+                top_k=request.top_k,
+                repetition_penalty=request.repetition_penalty,
+                do_sample=request.do_sample
+            )
+            accepted = False
+        else:
+            token, accepted = verify_draft_token(
+                logits,
+                request.token_ids,
+                draft_token,
+                temperature=request.temperature,
+                top_k=request.top_k,
+                repetition_penalty=request.repetition_penalty,
+                do_sample=request.do_sample
+            )
+        request.push(token)
+        self.tokens_generated += 1
+
+        stopped = request.stopping is not None and request.stopping.check(token) is not None
+        if (stopped or token == request.eos_token_id or request.cancelled
+                or len(request.token_ids) >= request.max_length):
+            self._retire(request)
+        return accepted
+
+    def _retire(self, request, error=None):
+        if request in self.active:
+            self.active.remove(request)
+            self.free_slots.append(request.slot)
+        if error is None:
+            self.requests_completed += 1
+            if request.admitted_at is not None:
+                service_time = time.time() - request.admitted_at
+                if self.mean_service_time is None:
+                    self.mean_service_time = service_time
+                else:
+                    self.mean_service_time += SERVICE_TIME_SMOOTHING * (service_time - self.mean_service_time)
+        if request.stopping is not None:
+            if request.cancelled and request.stopping.stop_reason is None:
+                request.stopping.stop_reason = "cancelled"
+            request.stopping.finish()
+        request.finish(error)
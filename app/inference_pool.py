@@ -0,0 +1,337 @@
+import itertools
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+import torch
+import torch.multiprocessing as mp
+from generation import PrefixCache
+from mmap_weights import load_mmap_model
+from inference_engine import (ContinuousBatchingEngine, GenerationRequest, DeadlineExceeded, EngineClosed,
+                              PRIORITY_NORMAL, SERVICE_TIME_SMOOTHING)
+from speculative import PromptLookup
+from stopping import StoppingCriteria
+
+
+def default_threads_per_worker(workers):
+    """Split the cores evenly so workers don't oversubscribe each other"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _forward_tokens(request_id, request, outbox):
+    """Relay one request's tokens from the worker's engine back to the web process"""
+    error = None
+    shed = False
+    try:
+        for token in request.iter_tokens():
+            outbox.put(("token", request_id, token))
+    except DeadlineExceeded as e:
+        error, shed = str(e), True
+    except Exception as e:
+        error = str(e)
+    reason = request.stopping.stop_reason if request.stopping is not None else None
+    outbox.put(("done", request_id, reason, error, shed))
+
+
+def _worker_main(worker_id, model, tokenizer, config, inbox, outbox):
+    """Worker process: own batching engine over the shared weights, fed from inbox
+
+    model is the model itself (its tensors arrive as shared-memory handles),
+    the (model_path, weights_path) of a safetensors file to map, or a pickled
+    int8 model.
+    """
+    torch.set_num_threads(config['threads_per_worker'])
+    if isinstance(model, tuple):
+        model_path, weights_path = model
+        model = load_mmap_model(model_path, weights_path=weights_path)
+    elif isinstance(model, bytes):
+        model = pickle.loads(model)
+
+    prefix_cache = PrefixCache(model, tokenizer, config['prefix']) if config.get('prefix') else None
+    texts = config.get('speculative_texts')
+    speculative = PromptLookup(tokenizer, texts) if texts else None
+    engine = ContinuousBatchingEngine(
+        model,
+        max_batch_size=config['max_batch_size'],
+        max_length=config['max_length'],
+        prefix_cache=prefix_cache,
+        speculative=speculative
+    )
+    engine.start()
+    print(f"Inference worker {worker_id} ready (pid {os.getpid()}, {config['threads_per_worker']} threads)")
+
+    requests = {}
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+
+        kind, request_id = message[0], message[1]
+        if kind == "cancel":
+            request = requests.get(request_id)
+            if request is not None:
+                request.cancel()
+        elif kind == "generate":
+            prompt_ids, kwargs, stopping_spec = message[2], message[3], message[4]
+            if stopping_spec is not None:
+                criteria, budget, eos_token_id = stopping_spec
+                kwargs['stopping'] = StoppingCriteria(tokenizer, criteria, budget=budget, eos_token_id=eos_token_id)
+            request = engine.submit(prompt_ids, **kwargs)
+            requests[request_id] = request
+            threading.Thread(target=_forward_tokens, args=(request_id, request, outbox), daemon=True).start()
+
+        # Forget finished requests so cancels for them are no-ops
+        for finished in [rid for rid, r in requests.items() if r.is_finished()]:
+            del requests[finished]
+
+    engine.stop()
+
+
+class PooledRequest(GenerationRequest):
+    """Web-process handle for a request running in a worker process"""
+
+    def __init__(self, pool, request_id, prompt_ids, **kwargs):
+        super().__init__(prompt_ids, **kwargs)
+        self.pool = pool
+        self.request_id = request_id
+        self.worker = None
+
+    def cancel(self):
+        if not self.cancelled and not self.is_finished():
+            self.pool._cancel(self)
+        super().cancel()
+
+
+class InferenceProcessPool:
+    """Pool of inference worker processes sharing one copy of the model weights
+
+    Workers are spawned, not forked: the web process already runs threads
+    (loader, watcher, engine), and forking a threaded process can leave a
+    child holding a lock some other thread owned. Weights mapped from
+    model.safetensors are mapped again by each worker, so they share the
+    page cache; other weights are moved to shared memory once and reach the
+    workers as handles, so every worker uses the same pages instead of
+    holding its own copy. Each worker runs a ContinuousBatchingEngine with
+    its own torch thread pool; requests are dispatched to the least busy
+    worker and tokens come back over a single result queue. ``submit``,
+    ``generate``, ``stats`` and ``projected_latency`` match the in-process
+    engine so the web app can use either.
+
+    Only the torch backend is supported (onnxruntime sessions cannot be sent
+    to another process). Dynamically quantized int8 weights are not regular
+    tensors, so each worker receives its own copy of them. A spawned worker
+    re-imports the main script as __mp_main__, so entry points must not do
+    their startup work outside the main process (see web_app).
+    """
+
+    def __init__(self, model, tokenizer, workers=2, threads_per_worker=None, max_batch_size=8,
+                 max_length=200, prefix=None, speculative_texts=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self.config = {
+            'threads_per_worker': self.threads_per_worker,
+            'max_batch_size': max_batch_size,
+            'max_length': max_length,
+            'prefix': prefix,
+            'speculative_texts': speculative_texts
+        }
+
+        self.context = mp.get_context("spawn")
+        self.processes = []
+        self.inboxes = []
+        self.outbox = None
+        self.pending = {}
+        self.outstanding = []
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+        self._receiver = None
+        self._closed = False
+
+        self.tokens_generated = 0
+        self.requests_completed = 0
+        self.requests_shed = 0
+        self.mean_service_time = None
+        self.started_at = None
+
+    # ---------------- Public API ----------------
+    def start(self):
+        if self.processes:
+            return
+        self._closed = False
+        if getattr(self.model, 'weights_mapped', False) and getattr(self.model, 'weights_source', None):
+            # Each worker maps the file itself; the page cache holds the one copy
+            source = self.model.weights_source
+        elif any(name.endswith('_packed_params') for name, _ in self.model.named_modules()):
+            # Packed int8 weights become temporary tensors when pickled, which cannot be passed as shared handles
+            source = pickle.dumps(self.model)
+        else:
+            self.model.share_memory()
+            source = self.model
+        self.outbox = self.context.Queue()
+        for worker_id in range(self.workers):
+            inbox = self.context.Queue()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(worker_id, source, self.tokenizer, self.config, inbox, self.outbox),
+                name=f"inference-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            self.inboxes.append(inbox)
+        self.outstanding = [Counter() for _ in range(self.workers)]
+        self.started_at = time.time()
+
+        self._receiver = threading.Thread(target=self._receive, name="inference-pool-receiver", daemon=True)
+        self._receiver.start()
+
+    def stop(self):
+        with self.lock:
+            self._closed = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        if self.outbox is not None:
+            self.outbox.put(None)
+        if self._receiver:
+            self._receiver.join()
+            self._receiver = None
+
+        with self.lock:
+            pending, self.pending = list(self.pending.values()), {}
+        for request in pending:
+            request.finish(RuntimeError("Inference pool stopped"))
+        self.processes = []
+        self.inboxes = []
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.pending)
+
+    def drain(self, timeout=None, poll_interval=0.05):
+        """Stop accepting requests, let outstanding ones finish, then stop the workers; False if the timeout cut them off"""
+        with self.lock:
+            self._closed = True
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.in_flight():
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(poll_interval)
+        drained = not self.in_flight()
+        self.stop()
+        return drained
+
+    def submit(self, prompt_ids, **kwargs):
+        """Queue a prompt on the least busy worker and return its handle; EngineClosed once draining"""
+        kwargs['max_length'] = min(kwargs.get('max_length', self.max_length), self.max_length)
+        request = PooledRequest(self, next(self._ids), prompt_ids, **kwargs)
+
+        stopping_spec = None
+        if request.stopping is not None:
+            # Criteria are small picklable rules; the worker pairs them with its own tokenizer
+            stopping = request.stopping
+            stopping_spec = (stopping.criteria, stopping.budget, stopping.eos_token_id)
+        kwargs.pop('stopping', None)
+
+        with self.lock:
+            if self._closed:
+                raise EngineClosed("Inference pool is no longer accepting requests")
+            request.worker = min(range(self.workers), key=lambda w: sum(self.outstanding[w].values()))
+            self.outstanding[request.worker][request.priority] += 1
+            self.pending[request.request_id] = request
+        self.inboxes[request.worker].put(("generate", request.request_id, list(prompt_ids), kwargs, stopping_spec))
+        return request
+
+    def generate(self, prompt_ids, **kwargs):
+        """Blocking helper returning the generated token ids for one prompt"""
+        return self.submit(prompt_ids, **kwargs).wait()
+
+    def projected_latency(self, priority=PRIORITY_NORMAL):
+        """Estimated seconds until a new request would finish on the least busy worker
+
+        Same model as ContinuousBatchingEngine.projected_latency, using the
+        submit-to-done time seen from this process as the service time.
+        """
+        if self.mean_service_time is None:
+            return 0.0
+        with self.lock:
+            ahead = min(
+                sum(count for p, count in outstanding.items() if p <= priority)
+                for outstanding in self.outstanding
+            )
+        blocked = max(0, ahead - self.max_batch_size + 1)
+        return blocked * self.mean_service_time / self.max_batch_size + self.mean_service_time
+
+    def stats(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        with self.lock:
+            outstanding = [sum(c.values()) for c in self.outstanding]
+            by_priority = Counter()
+            for c in self.outstanding:
+                by_priority.update(c)
+        return {
+            'workers': self.workers,
+            'workers_alive': sum(1 for p in self.processes if p.is_alive()),
+            'threads_per_worker': self.threads_per_worker,
+            'outstanding_per_worker': outstanding,
+            'outstanding_by_priority': {p: n for p, n in by_priority.items() if n},
+            'tokens_generated': self.tokens_generated,
+            'requests_completed': self.requests_completed,
+            'requests_shed': self.requests_shed,
+            'tokens_per_second': round(self.tokens_generated / elapsed, 2) if elapsed > 0 else 0.0,
+            'mean_service_ms': round(self.mean_service_time * 1000, 1) if self.mean_service_time else None
+        }
+
+    # ---------------- Internals ----------------
+    def _cancel(self, request):
+        if request.worker is not None:
+            self.inboxes[request.worker].put(("cancel", request.request_id))
+
+    def _receive(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+
+            kind, request_id = message[0], message[1]
+            with self.lock:
+                request = self.pending.get(request_id)
+            if request is None:
+                continue
+
+            if kind == "token":
+                request.push(message[2])
+                self.tokens_generated += 1
+            elif kind == "done":
+                reason, error, shed = message[2], message[3], message[4]
+                with self.lock:
+                    self.pending.pop(request_id, None)
+                    self.outstanding[request.worker][request.priority] -= 1
+                    if shed:
+                        self.requests_shed += 1
+                    elif not error:
+                        self.requests_completed += 1
+                        service_time = time.time() - request.submitted_at
+                        if self.mean_service_time is None:
+                            self.mean_service_time = service_time
+                        else:
+                            self.mean_service_time += SERVICE_TIME_SMOOTHING * (service_time - self.mean_service_time)
+                if request.stopping is not None:
+                    # Mirror the worker's outcome so trim() and the stats work here
+                    request.stopping.generated_ids = list(request.generated)
+                    request.stopping.stop_reason = reason
+                    if request.cancelled and reason is None:
+                        request.stopping.stop_reason = "cancelled"
+                    request.stopping.finish()
+                if shed:
+                    request.finish(DeadlineExceeded(error))
+                else:
+                    request.finish(RuntimeError(error) if error else None)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Compiled knowledge-base snapshot
+
+Every knowledge source (knowledge_bases/verified/*.json, the facts that
+VerifiedHeartAttackKnowledgeSystem adds in code and HeartAttackKnowledgeSystem's
+categories and keywords) is compiled into one binary file, so processes
+map it at startup instead of importing and running the knowledge modules.
+Text is only decoded when a key or answer is actually read.
+
+Layout (little-endian, sections 8-byte aligned):
+
+    magic "MEDKBSN1" | u64 header size | JSON header (sources, categories,
+    disclaimer, section offsets, source fingerprint) | fact table | key
+    table | keyword table | UTF-8 text blob
+
+The fact table holds (key, answer) offsets into the text blob plus the
+source and keyword category of each fact; the key table is sorted
+(hash(source, key), fact) pairs for exact lookups by binary search; the
+keyword table holds (keyword offset, category) for the keyword automaton.
+
+    python kb_snapshot.py            # (re)build the snapshot
+"""
+
+import glob
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import types
+from collections.abc import MutableMapping
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERIFIED_DIR = os.path.join(BASE_DIR, "knowledge_bases", "verified")
+# Knowledge modules whose in-code facts and keywords are compiled into the snapshot
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+VERIFIED_SYSTEM_PATH = os.path.join(APP_DIR, "verified_medical_knowledge.py")
+KEYWORD_SYSTEM_PATH = os.path.join(APP_DIR, "heart_attack_knowledge.py")
+DEFAULT_SNAPSHOT_PATH = os.environ.get(
+    'MEDAI_KB_SNAPSHOT', os.path.join(BASE_DIR, "knowledge_bases", "index", "knowledge.kbsnap")
+)
+
+MAGIC = b"MEDKBSN1"
+VERSION = 1
+VERIFIED_SYSTEM_SOURCE = "VerifiedHeartAttackKnowledgeSystem"
+KEYWORD_SYSTEM_SOURCE = "HeartAttackKnowledgeSystem"
+
+FACT_DTYPE = np.dtype([('key_offset', '<u8'), ('answer_offset', '<u8'), ('key_length', '<u4'),
+                       ('answer_length', '<u4'), ('source', '<u4'), ('category', '<i4')])
+KEY_DTYPE = np.dtype([('hash', '<u8'), ('fact', '<u8')])
+KEYWORD_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('category', '<u4')])
+
+
+def knowledge_module_paths():
+    return [VERIFIED_SYSTEM_PATH, KEYWORD_SYSTEM_PATH]
+
+
+def verified_files(verified_dir=VERIFIED_DIR):
+    return sorted(glob.glob(os.path.join(verified_dir, "*.json"))) if verified_dir else []
+
+
+def source_paths(verified_dir=VERIFIED_DIR):
+    """Every file a snapshot is compiled from; verified_dir=None leaves out the JSON files"""
+    return verified_files(verified_dir) + knowledge_module_paths()
+
+
+def load_source_module(path):
+    """Run a knowledge module from its current source as a new module object
+
+    Neither sys.modules nor the bytecode cache is used, so an edit to the
+    file is always picked up, even within the same second.
+    """
+    module = types.ModuleType(f"_kb_source_{os.path.splitext(os.path.basename(path))[0]}")
+    module.__file__ = path
+    with open(path, 'rb') as f:
+        exec(compile(f.read(), path, 'exec'), module.__dict__)
+    return module
+
+
+def source_fingerprint(verified_dir=VERIFIED_DIR):
+    """Hash of everything the knowledge indexes are built from (verified files and the knowledge modules)"""
+    paths = source_paths(verified_dir)
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def key_hash(source, key):
+    digest = hashlib.blake2b(f"{source}\0{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def collect_knowledge(verified_dir=VERIFIED_DIR):
+    """Run the knowledge sources once: (facts, keywords, categories, disclaimer)
+
+    facts are (source, key, answer, category) with category -1 outside the
+    keyword system; keywords are (keyword, category) in priority order. The
+    knowledge modules are run from their current source (load_source_module),
+    not the copies this process imported at startup.
+    """
+    facts = []
+    for path in verified_files(verified_dir):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for key, answer in json.load(f).items():
+                    if isinstance(answer, str):
+                        facts.append((os.path.basename(path), key.lower(), answer, -1))
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+
+    verified_module = load_source_module(VERIFIED_SYSTEM_PATH)
+    keyword_module = load_source_module(KEYWORD_SYSTEM_PATH)
+
+    for key, answer in verified_module.VerifiedHeartAttackKnowledgeSystem(snapshot=False).medical_knowledge.items():
+        facts.append((VERIFIED_SYSTEM_SOURCE, key, answer, -1))
+
+    keyword_system = keyword_module.HeartAttackKnowledgeSystem()
+    keywords = []
+    categories = list(keyword_system.medical_knowledge)
+    for priority, category in enumerate(categories):
+        data = keyword_system.medical_knowledge[category]
+        facts.append((KEYWORD_SYSTEM_SOURCE, category, data["response"], priority))
+        keywords.extend((keyword.lower(), priority) for keyword in data["keywords"])
+    return facts, keywords, categories, keyword_system.safety_disclaimer
+
+
+def _align(buffer):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def write_snapshot(path, facts, keywords, categories, disclaimer, fingerprint=None):
+    """Serialize collected knowledge (see collect_knowledge) into a snapshot file"""
+    text = bytearray()
+
+    def put(string):
+        data = string.encode('utf-8')
+        offset = len(text)
+        text.extend(data)
+        return offset, len(data)
+
+    sources = sorted({fact[0] for fact in facts})
+    source_ids = {source: i for i, source in enumerate(sources)}
+    fact_table = np.zeros(len(facts), dtype=FACT_DTYPE)
+    for i, (source, key, answer, category) in enumerate(facts):
+        key_offset, key_length = put(key)
+        answer_offset, answer_length = put(answer)
+        fact_table[i] = (key_offset, answer_offset, key_length, answer_length, source_ids[source], category)
+
+    key_table = np.zeros(len(facts), dtype=KEY_DTYPE)
+    key_table['hash'] = [key_hash(source, key) for source, key, _, _ in facts]
+    key_table['fact'] = np.arange(len(facts))
+    key_table.sort(order=['hash', 'fact'])
+
+    keyword_table = np.zeros(len(keywords), dtype=KEYWORD_DTYPE)
+    for i, (keyword, category) in enumerate(keywords):
+        offset, length = put(keyword)
+        keyword_table[i] = (offset, length, category)
+
+    body = bytearray()
+    sections = {}
+    for name, data in (("facts", fact_table.tobytes()), ("keys", key_table.tobytes()),
+                       ("keywords", keyword_table.tobytes()), ("text", bytes(text))):
+        _align(body)
+        sections[name] = [len(body), len(data)]
+        body.extend(data)
+
+    header = json.dumps({
+        'version': VERSION,
+        'fingerprint': fingerprint,
+        'sources': sources,
+        'categories': categories,
+        'disclaimer': disclaimer,
+        'counts': {'facts': len(facts), 'keywords': len(keywords)},
+        'sections': sections
+    }).encode('utf-8')
+    header += b" " * (-len(header) % 8)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+    print(f"✅ Wrote knowledge snapshot {path} ({len(facts)} facts, {len(keywords)} keywords, "
+          f"{os.path.getsize(path) / 1e3:.1f} KB)")
+
+
+class KnowledgeSnapshot:
+    """Read-only view of a snapshot file; tables are views over the mapped bytes"""
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if self.data[:8].tobytes() != MAGIC:
+            raise ValueError(f"{path} is not a knowledge snapshot")
+        header_size = struct.unpack('<Q', self.data[8:16].tobytes())[0]
+        self.header = json.loads(self.data[16:16 + header_size].tobytes().decode('utf-8'))
+        if self.header['version'] != VERSION:
+            raise ValueError(f"{path} has snapshot version {self.header['version']}, expected {VERSION}")
+
+        body = 16 + header_size
+        sections = self.header['sections']
+
+        def section(name, dtype):
+            offset, length = sections[name]
+            return self.data[body + offset:body + offset + length].view(dtype)
+
+        self.facts = section("facts", FACT_DTYPE)
+        self.keys = section("keys", KEY_DTYPE)
+        self.keyword_table = section("keywords", KEYWORD_DTYPE)
+        self.text = section("text", np.uint8)
+        self.sources = self.header['sources']
+        self.categories = self.header['categories']
+        self.disclaimer = self.header['disclaimer']
+
+    def __len__(self):
+        return len(self.facts)
+
+    @classmethod
+    def load_or_build(cls, path=DEFAULT_SNAPSHOT_PATH, verified_dir=VERIFIED_DIR, fingerprint=None):
+        """Map the snapshot, compiling it first when it is missing or a source changed
+
+        fingerprint defaults to source_fingerprint() (sizes and mtimes); a
+        caller that already hashed the sources can pass its own.
+        """
+        fingerprint = fingerprint or source_fingerprint(verified_dir)
+        try:
+            snapshot = cls(path)
+            if snapshot.header.get('fingerprint') == fingerprint:
+                return snapshot
+        except (OSError, ValueError, KeyError):
+            pass
+        write_snapshot(path, *collect_knowledge(verified_dir), fingerprint=fingerprint)
+        return cls(path)
+
+    # ---------------- Text ----------------
+    def _string(self, offset, length):
+        return self.text[offset:offset + length].tobytes().decode('utf-8')
+
+    def key(self, fact):
+        row = self.facts[fact]
+        return self._string(int(row['key_offset']), int(row['key_length']))
+
+    def answer(self, fact):
+        row = self.facts[fact]
+        return self._string(int(row['answer_offset']), int(row['answer_length']))
+
+    def source(self, fact):
+        return self.sources[int(self.facts[fact]['source'])]
+
+    # ---------------- Lookup ----------------
+    def source_facts(self, source):
+        """Fact numbers of one source, in their original order"""
+        if source not in self.sources:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.facts['source'] == self.sources.index(source))
+
+    def lookup(self, source, key):
+        """Fact number of key in source, or None"""
+        target = key_hash(source, key)
+        position = int(np.searchsorted(self.keys['hash'], target))
+        while position < len(self.keys) and int(self.keys[position]['hash']) == target:
+            fact = int(self.keys[position]['fact'])
+            if self.source(fact) == source and self.key(fact) == key:
+                return fact
+            position += 1
+        return None
+
+    def keywords(self):
+        """(keyword, category priority) in priority order"""
+        return [(self._string(int(row['offset']), int(row['length'])), int(row['category']))
+                for row in self.keyword_table]
+
+    def category_fact(self, category):
+        matches = np.flatnonzero(self.facts['category'] == category)
+        return int(matches[0]) if len(matches) else None
+
+
+class SnapshotFacts(MutableMapping):
+    """key -> answer mapping over one snapshot source; answers are decoded on access
+
+    Writes go to an in-memory overlay, so a system loaded from the snapshot
+    can still take add_verified_fact/load_verified_knowledge updates.
+    """
+
+    def __init__(self, snapshot, source):
+        self.snapshot = snapshot
+        self.source = source
+        self.fact_numbers = snapshot.source_facts(source)
+        self.overlay = {}
+        self.removed = set()
+        self._keys = None
+
+    def _snapshot_keys(self):
+        if self._keys is None:
+            self._keys = [self.snapshot.key(int(fact)) for fact in self.fact_numbers]
+        return self._keys
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        if key not in self.removed:
+            fact = self.snapshot.lookup(self.source, key)
+            if fact is not None:
+                return self.snapshot.answer(fact)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.overlay:
+            return True
+        return key not in self.removed and self.snapshot.lookup(self.source, key) is not None
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        self.removed.add(key)
+
+    def __iter__(self):
+        for key in self._snapshot_keys():
+            if key not in self.removed and key not in self.overlay:
+                yield key
+        yield from self.overlay
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SnapshotKeywordSystem:
+    """HeartAttackKnowledgeSystem answered from the snapshot's keyword table"""
+
+    def __init__(self, snapshot):
+        from heart_attack_knowledge import KeywordAutomaton
+
+        self.snapshot = snapshot
+        self.categories = snapshot.categories
+        self.safety_disclaimer = snapshot.disclaimer
+        self.keyword_automaton = KeywordAutomaton()
+        for keyword, priority in snapshot.keywords():
+            self.keyword_automaton.add(keyword, priority)
+        self.keyword_automaton.build()
+
+    def query_knowledge_base(self, user_input):
+        best = None
+        for priority in self.keyword_automaton.matches(user_input.lower()):
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        if best is None:
+            return None
+        return self.snapshot.answer(self.snapshot.category_fact(best)) + self.safety_disclaimer
+
+
+_default_snapshot = None
+_default_lock = threading.Lock()
+
+
+def default_snapshot():
+    """Process-wide snapshot at MEDAI_KB_SNAPSHOT, compiled on first use when stale"""
+    global _default_snapshot
+    with _default_lock:
+        if _default_snapshot is None:
+            _default_snapshot = KnowledgeSnapshot.load_or_build()
+        return _default_snapshot
+
+
+def main():
+    snapshot = KnowledgeSnapshot.load_or_build()
+    print(f"{snapshot.path}: {len(snapshot)} facts from {', '.join(snapshot.sources)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
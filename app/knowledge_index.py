@@ -0,0 +1,203 @@
+import math
+import re
+import threading
+from array import array
+from collections import defaultdict
+import numpy as np
+
+# Contractions and possessives stay one token ("it's", "heart's")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Question words and glue that would otherwise match every fact
+STOPWORDS = frozenset("""
+a about am an and any are as at be been being but by can could do does did for from had has have how i if in
+into is it its it's long many me much my of on or should so than that the their them then there these they
+this to too was we were what when where which who whom why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, with plurals folded ("symptoms" -> "symptom")"""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower().replace("\u2019", "'")):
+        if token in STOPWORDS:
+            continue
+        if token.endswith("'s"):
+            token = token[:-2]
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 ranking over (key, text) documents
+
+    Each document is a fact: its key (the question it answers) and its
+    answer text, with key terms counted KEY_WEIGHT times so a fact is ranked
+    mainly by what it is about. Documents are appended incrementally;
+    posting lists are turned into NumPy arrays of precomputed per-term
+    scores (a frozen view), so a query only touches the postings of its own
+    terms. Replacing a key retires the old document.
+
+    Only the first search freezes in the foreground. Documents added later
+    form a small delta that searches score directly, while a background
+    thread rebuilds the frozen view and swaps it in, so adding facts never
+    stalls a request behind a full rebuild.
+    """
+
+    KEY_WEIGHT = 3
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys = []
+        self.key_terms = []
+        self.lengths = []
+        # One byte per document, 1 while it is the live version of its key
+        self.alive = bytearray()
+        self.doc_ids = {}
+        # token -> (doc ids, term counts), kept as compact arrays so freezing is a buffer copy
+        self.postings = defaultdict(lambda: (array('q'), array('f')))
+        self.lock = threading.Lock()
+        self._frozen = None
+        self._stale = False
+        self._refresher = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, key, text=""):
+        """Index one document; a document already stored under key is replaced"""
+        key_tokens = tokenize(key)
+        counts = defaultdict(int)
+        for token in key_tokens:
+            counts[token] += self.KEY_WEIGHT
+        for token in tokenize(text):
+            counts[token] += 1
+
+        with self.lock:
+            old = self.doc_ids.get(key)
+            if old is not None:
+                self.alive[old] = 0
+            doc_id = len(self.keys)
+            self.keys.append(key)
+            self.key_terms.append(frozenset(key_tokens))
+            self.lengths.append(sum(counts.values()))
+            self.alive.append(1)
+            self.doc_ids[key] = doc_id
+            for token, count in counts.items():
+                ids, tfs = self.postings[token]
+                ids.append(doc_id)
+                tfs.append(count)
+            if self._frozen is not None:
+                self._stale = True
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh, name="bm25-refresh", daemon=True)
+                    self._refresher.start()
+
+    def freeze(self):
+        """Build the frozen view now (in the caller's thread) and return it"""
+        with self.lock:
+            snapshot = self._snapshot()
+        self._frozen = self._build(*snapshot)
+        return self._frozen
+
+    def _snapshot(self):
+        """Document state and posting list lengths to build from; caller holds the lock"""
+        return bytes(self.alive), array('f', self.lengths), {token: len(ids) for token, (ids, _) in self.postings.items()}
+
+    def _build(self, alive, lengths, covered):
+        """Precompute idf-weighted BM25 term scores for the postings covered by a snapshot
+
+        Runs without the lock: posting arrays are append-only, so their first
+        covered entries do not change, and each slice is copied in one step.
+        """
+        postings = {}
+        for token, size in covered.items():
+            ids, tfs = self.postings[token]
+            postings[token] = (ids[:size], tfs[:size])
+        alive = np.frombuffer(alive, dtype=bool)
+        lengths = np.frombuffer(lengths, dtype=np.float32)
+        live_count = max(int(alive.sum()), 1)
+        average_length = float(lengths[alive].mean()) if alive.any() else 1.0
+        norms = self.k1 * (1 - self.b + self.b * lengths / max(average_length, 1e-6))
+
+        frozen = {}
+        for token, (token_ids, token_tfs) in postings.items():
+            ids = np.frombuffer(token_ids, dtype=np.int64)
+            live = alive[ids]
+            ids = ids[live]
+            if not len(ids):
+                continue
+            tf = np.frombuffer(token_tfs, dtype=np.float32)[live]
+            idf = math.log(1 + (live_count - len(ids) + 0.5) / (len(ids) + 0.5))
+            frozen[token] = (ids, (idf * tf * (self.k1 + 1) / (tf + norms[ids])).astype(np.float32))
+        return frozen, covered, len(alive), live_count, average_length
+
+    def _refresh(self):
+        """Background thread: rebuild the frozen view until no adds are pending"""
+        while True:
+            with self.lock:
+                if not self._stale:
+                    self._refresher = None
+                    return
+                self._stale = False
+                snapshot = self._snapshot()
+            self._frozen = self._build(*snapshot)
+
+    def _delta_scores(self, query_tokens, frozen):
+        """(ids, weights) for postings added since the frozen view was built"""
+        _, covered, _, live_count, average_length = frozen
+        hits = []
+        with self.lock:
+            for token in query_tokens:
+                posting = self.postings.get(token)
+                start = covered.get(token, 0)
+                if posting is None or len(posting[0]) <= start:
+                    continue
+                ids = np.frombuffer(posting[0][start:], dtype=np.int64)
+                tf = np.frombuffer(posting[1][start:], dtype=np.float32)
+                lengths = np.array([self.lengths[i] for i in ids], dtype=np.float32)
+                document_frequency = len(posting[0])
+                hits.append((ids, tf, lengths, document_frequency))
+        delta = []
+        for ids, tf, lengths, document_frequency in hits:
+            idf = math.log(1 + max(live_count - document_frequency + 0.5, 0.5) / (document_frequency + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * lengths / max(average_length, 1e-6))
+            delta.append((ids, (idf * tf * (self.k1 + 1) / (tf + norms)).astype(np.float32)))
+        return delta
+
+    def search(self, query, k=5):
+        """Top-k (key, score, key coverage) for query, best first
+
+        Coverage is the fraction of the key's terms that occur in the query,
+        which callers use to reject facts that merely share a word.
+        """
+        query_tokens = set(tokenize(query))
+        frozen = self._frozen or self.freeze()
+        postings = frozen[0]
+        hits = [postings[token] for token in query_tokens if token in postings]
+        if len(self.keys) > frozen[2]:
+            hits.extend(self._delta_scores(query_tokens, frozen))
+        if not hits:
+            return []
+
+        with self.lock:
+            alive = np.frombuffer(bytes(self.alive), dtype=bool)
+        scores = np.zeros(len(alive), dtype=np.float32)
+        for ids, weights in hits:
+            scores[ids] += weights
+        candidates = np.unique(np.concatenate([ids for ids, _ in hits]))
+        # Documents replaced since the frozen view was built
+        candidates = candidates[alive[candidates]]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        results = []
+        for doc_id in candidates:
+            terms = self.key_terms[doc_id]
+            coverage = len(terms & query_tokens) / len(terms) if terms else 0.0
+            results.append((self.keys[doc_id], float(scores[doc_id]), coverage))
+        return results
@@ -1,12 +1,99 @@
+import hashlib
 import json
-import yaml
 import os
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds between checks of the watched knowledge sources (0 disables watching)
+RELOAD_INTERVAL_SECONDS = float(os.environ.get('MEDAI_KB_RELOAD_SECONDS', 5))
+# Files with question/answer data that get their own segment
+DATA_EXTENSIONS = ('.json', '.txt')
+# From this many facts, dense lookups probe an IVF index (ann_index.py) instead of scanning every segment
+ANN_MIN_FACTS = int(os.environ.get('MEDAI_ANN_MIN_FACTS', 50000))
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class KnowledgeView:
+    """Read-only set of knowledge segments published by KnowledgeBaseManager
+
+    Each registered or verified data file is its own segment (a
+    VerifiedMedicalKnowledgeSystem with its BM25 index and its own dense
+    index); a snapshot compiled from the knowledge modules alone supplies
+    the in-code verified facts and the keyword system. dense is a
+    SegmentedDenseIndex over the per-segment dense indexes. A view is never
+    changed once published: a reload builds a new one that reuses the
+    unchanged segments and swaps the reference, so a lookup always reads one
+    consistent view without taking a lock.
+    """
+
+    def __init__(self, segments, snapshot_system, keyword_system, dense, version):
+        self.segments = segments
+        self.snapshot_system = snapshot_system
+        self.keyword_system = keyword_system
+        self.dense = dense
+        self.version = version
+        self.created = time.time()
+
+    def systems(self):
+        return list(self.segments.values()) + [self.snapshot_system]
+
+    def get_response(self, question):
+        """Exact key, then the best-ranked fact of any segment, then the keyword system"""
+        question_lower = question.lower()
+        for system in self.systems():
+            if question_lower in system.medical_knowledge:
+                return system.medical_knowledge[question_lower]
+        ranked = self.search(question, k=1)
+        if ranked:
+            return ranked[0][2]
+        return self.keyword_system.query_knowledge_base(question)
+
+    def search(self, question, k=5):
+        """Top-k (key, score, answer, segment) over every segment's BM25 index"""
+        results = []
+        for name, system in list(self.segments.items()) + [("snapshot", self.snapshot_system)]:
+            results.extend((key, score, answer, name) for key, score, answer in system.search(question, k))
+        results.sort(key=lambda result: -result[1])
+        return results[:k]
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'segments': len(self.segments) + 1,
+            'facts': sum(len(system.medical_knowledge) for system in self.systems()),
+            'dense_facts': len(self.dense),
+            'ann': self.dense.vector_index is not None,
+            'created': self.created
+        }
+
 
 class KnowledgeBaseManager:
     def __init__(self):
         self.knowledge_bases = {}
         self.registry_path = os.path.join(os.path.dirname(__file__), 'knowledge_registry.json')
         self.load_knowledge_registry()
+        # Current KnowledgeView; replaced wholesale by reload()
+        self.view = None
+        # path -> [size, mtime_ns, sha256] of every watched file as of the current view
+        self.file_states = {}
+        # snapshot_sources() as of the current view, so a deleted input still counts as a change
+        self.snapshot_paths = set()
+        # ann_index.IVFIndex, opened once a view reaches ANN_MIN_FACTS facts
+        self.vector_index = None
+        self.reload_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.watch_thread = None
+        self.reloads = 0
+        self.last_reload_seconds = None
+        self.last_error = None
     
     def load_knowledge_registry(self):
         try:
@@ -20,16 +107,13 @@ class KnowledgeBaseManager:
             self.create_default_registry()
     
     def create_default_registry(self):
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        from kb_snapshot import DEFAULT_SNAPSHOT_PATH
+
+        # The compiled snapshot (kb_snapshot.py) of every knowledge source; mapped, never executed
         self.knowledge_bases = {
             "Heart Attack Knowledge": {
-                "path": os.path.join(base_dir, "knowledge_bases", "heart_attack_knowledge.py"),
-                "type": "heart_conditions",
-                "loaded": False
-            },
-            "Comprehensive Medical": {
-                "path": os.path.join(base_dir, "knowledge_bases", "create_comprehensive_knowledge_base.py"),
-                "type": "general_medical",
+                "path": DEFAULT_SNAPSHOT_PATH,
+                "type": "snapshot",
                 "loaded": False
             }
         }
@@ -52,4 +136,227 @@ class KnowledgeBaseManager:
         return True
     
     def get_knowledge_base_list(self):
-        return list(self.knowledge_bases.keys())
\ No newline at end of file
+        return list(self.knowledge_bases.keys())
+
+    # ---------------- Hot reload ----------------
+    def resolve_path(self, path):
+        # Registry entries written on Windows are relative to the project root with backslashes
+        path = path.replace("\\", os.sep)
+        if path and not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(BASE_DIR, path)
+        return os.path.abspath(path)
+
+    def data_sources(self):
+        """Question/answer files that become segments: registered .json/.txt sources and knowledge_bases/verified/*.json
+
+        Registered .py entries are scripts that generate knowledge files, not
+        sources a view can load, so they are neither loaded nor watched.
+        """
+        import kb_snapshot
+
+        paths = [self.resolve_path(info.get("path", "")) for info in self.knowledge_bases.values()]
+        paths = [path for path in paths if path.endswith(DATA_EXTENSIONS)]
+        paths += [os.path.abspath(path) for path in kb_snapshot.verified_files(kb_snapshot.VERIFIED_DIR)]
+        return list(dict.fromkeys(path for path in paths if os.path.exists(path)))
+
+    def snapshot_sources(self):
+        """The knowledge modules the code snapshot is compiled from"""
+        import kb_snapshot
+
+        return [os.path.abspath(path) for path in kb_snapshot.knowledge_module_paths()]
+
+    @staticmethod
+    def segment_dir(name):
+        """On-disk cache directory of one segment's dense index (and the code snapshot)"""
+        from dense_index import DEFAULT_INDEX_DIR
+
+        return os.path.join(DEFAULT_INDEX_DIR, "segments", hashlib.sha256(name.encode('utf-8')).hexdigest()[:16])
+
+    def segment_dense_index(self, path, segment):
+        """Dense index of one data segment, re-embedded only when the segment's facts change"""
+        from dense_index import DenseKnowledgeIndex, index_fingerprint
+
+        documents = [(key, answer, os.path.basename(path))
+                     for key, answer in segment.medical_knowledge.items() if isinstance(answer, str)]
+        # Keyed on the facts actually loaded, so a cache entry can never describe other content
+        facts_hash = hashlib.sha256(json.dumps(documents, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return DenseKnowledgeIndex.load_cached(self.segment_dir(path), index_fingerprint(sources=facts_hash),
+                                               lambda: documents)
+
+    def active_vector_index(self, facts):
+        """The IVF index for a view of this many facts, or None below ANN_MIN_FACTS"""
+        if facts < ANN_MIN_FACTS:
+            return None
+        if self.vector_index is None:
+            from ann_index import IVFIndex
+            self.vector_index = IVFIndex()
+        return self.vector_index
+
+    def load_code_segment(self, states):
+        """(snapshot system, keyword system, dense index) compiled from the knowledge modules' current source"""
+        from verified_medical_knowledge import VerifiedHeartAttackKnowledgeSystem
+        from kb_snapshot import VERSION as SNAPSHOT_VERSION, KnowledgeSnapshot, SnapshotKeywordSystem
+        from dense_index import DenseKnowledgeIndex, index_fingerprint, snapshot_documents
+
+        digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}\n".encode('utf-8'))
+        for path in self.snapshot_sources():
+            state = states.get(path)
+            digest.update(f"{path}:{state[2] if state else 'missing'}\n".encode('utf-8'))
+        directory = self.segment_dir("code")
+        snapshot = KnowledgeSnapshot.load_or_build(os.path.join(directory, "knowledge.kbsnap"), verified_dir=None,
+                                                   fingerprint=digest.hexdigest())
+        dense = DenseKnowledgeIndex.load_cached(directory, index_fingerprint(sources=digest.hexdigest()),
+                                                lambda: snapshot_documents(snapshot))
+        return VerifiedHeartAttackKnowledgeSystem(snapshot=snapshot), SnapshotKeywordSystem(snapshot), dense
+
+    def detect_changes(self):
+        """(changed paths, new file states); mtime/size pick candidates, the content hash decides"""
+        watched = set(self.data_sources()) | set(self.snapshot_sources()) | {os.path.abspath(self.registry_path)}
+        states = {}
+        changed = set()
+        for path in watched:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            old = self.file_states.get(path)
+            if old and old[:2] == [stat.st_size, stat.st_mtime_ns]:
+                states[path] = old
+                continue
+            digest = content_hash(path)
+            states[path] = [stat.st_size, stat.st_mtime_ns, digest]
+            if not old or old[2] != digest:
+                changed.add(path)
+        # Deleted sources change the view too
+        changed |= set(self.file_states) - set(states)
+        return changed, states
+
+    def reload(self, force=False):
+        """Rebuild the segments whose sources changed and publish a new view; True when one was published"""
+        from verified_medical_knowledge import VerifiedMedicalKnowledgeSystem
+        from dense_index import SegmentedDenseIndex
+
+        with self.reload_lock:
+            start_time = time.time()
+            changed, states = self.detect_changes()
+            if os.path.abspath(self.registry_path) in changed:
+                self.load_knowledge_registry()
+                changed, states = self.detect_changes()
+            old = self.view
+            if old is not None and not changed and not force:
+                return False
+
+            # Segments of a view that already uses the IVF index insert their facts as they load;
+            # the published view keeps searching its own snapshot of the index meanwhile
+            attached = self.vector_index if old is not None and old.dense.vector_index is not None else None
+            segments = {}
+            dense_segments = {}
+            rebuilt = 0
+            for path in self.data_sources():
+                if old is not None and not force and path in old.segments and path not in changed:
+                    segments[path] = old.segments[path]
+                    dense_segments[path] = old.dense.segments[path]
+                    continue
+                segment = VerifiedMedicalKnowledgeSystem()
+                if attached is not None:
+                    segment.attach_vector_index(attached)
+                segment.load_verified_knowledge(path)
+                segments[path] = segment
+                dense_segments[path] = self.segment_dense_index(path, segment)
+                rebuilt += 1
+
+            snapshot_paths = set(self.snapshot_sources())
+            if old is None or force or changed & (snapshot_paths | self.snapshot_paths):
+                # Recompiled only when a module's content hash is new; otherwise mapped from disk
+                snapshot_system, keyword_system, code_dense = self.load_code_segment(states)
+                if attached is not None:
+                    attached.add_documents(zip(code_dense.keys, code_dense.answers, code_dense.sources))
+                rebuilt += 1
+            else:
+                snapshot_system, keyword_system = old.snapshot_system, old.keyword_system
+                code_dense = old.dense.segments["snapshot"]
+            dense_segments["snapshot"] = code_dense
+            dense = SegmentedDenseIndex(dense_segments)
+            vector_index = self.active_vector_index(len(dense))
+            if vector_index is not None:
+                documents = dense.documents()
+                if vector_index.needs_retraining(len(documents)):
+                    # The corpus outgrew (or shrank away from) the IDF the index was trained with
+                    vector_index.rebuild(documents)
+                    print(f"IVF index: retrained on {len(documents)} facts, {vector_index.stats()}")
+                elif vector_index is not attached:
+                    # First view at this size: index everything (trains the centroids; facts already indexed are skipped)
+                    added = vector_index.add_documents(documents)
+                    print(f"IVF index: added {added} facts, {vector_index.stats()}")
+                # Facts of replaced or removed sources would otherwise crowd out live ones
+                vector_index.remove(set(vector_index.keys) - {key for key, _, _ in documents})
+                # Published with the view: the index as of this reload's inserts
+                dense = SegmentedDenseIndex(dense_segments, vector_index.snapshot())
+
+            # Publishing is a single reference swap; readers of the old view finish undisturbed
+            self.view = KnowledgeView(segments, snapshot_system, keyword_system, dense, old.version + 1 if old else 1)
+            self.file_states = states
+            self.snapshot_paths = snapshot_paths
+            self.reloads += 1
+            self.last_reload_seconds = time.time() - start_time
+            print(f"Knowledge view v{self.view.version}: rebuilt {rebuilt} of {len(segments) + 1} segments "
+                  f"in {self.last_reload_seconds:.2f}s")
+            return True
+
+    def current_view(self):
+        """The published view; never waits on a reload once one exists
+
+        The server builds the first view in start_watching() before serving,
+        so only a caller that skipped it builds (or waits for) the first view.
+        """
+        view = self.view
+        if view is None:
+            self.reload()
+            view = self.view
+        return view
+
+    def get_response(self, question):
+        return self.current_view().get_response(question)
+
+    def _reload_logged(self):
+        try:
+            self.reload()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Knowledge reload failed, keeping view v{self.view.version if self.view else 0}: {e}")
+
+    def _watch(self, interval):
+        while not self.stop_event.wait(interval):
+            self._reload_logged()
+
+    def start_watching(self, interval=RELOAD_INTERVAL_SECONDS):
+        """Build the first view now, then poll the sources every interval seconds and reload in the background"""
+        if self.view is None:
+            self._reload_logged()
+        if interval <= 0 or (self.watch_thread and self.watch_thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.watch_thread = threading.Thread(target=self._watch, args=(interval,), daemon=True, name="kb-watcher")
+        self.watch_thread.start()
+
+    def stop_watching(self):
+        self.stop_event.set()
+        if self.watch_thread:
+            self.watch_thread.join()
+
+    def reload_in_background(self, force=False):
+        thread = threading.Thread(target=self.reload, kwargs={'force': force}, daemon=True, name="kb-reload")
+        thread.start()
+        return thread
+
+    def stats(self):
+        view = self.view
+        return {
+            'view': view.stats() if view else None,
+            'watching': bool(self.watch_thread and self.watch_thread.is_alive()),
+            'reloading': self.reload_lock.locked(),
+            'reloads': self.reloads,
+            'last_reload_seconds': round(self.last_reload_seconds, 3) if self.last_reload_seconds is not None else None,
+            'last_error': self.last_error
+        }
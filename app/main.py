@@ -1,17 +1,19 @@
+import json
 import os
 import sys
 import platform
 import re
+import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QPushButton, 
                              QLineEdit, QTextEdit, QVBoxLayout, QHBoxLayout, 
                              QWidget, QFrame, QComboBox)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QTextCursor, QPalette, QColor
-from transformers import GPT2Tokenizer, GPT2LMHeadModel
 from model_manager import ModelManager
 from knowledge_manager import KnowledgeBaseManager
 from data_manager import DataManager
 from model_manager_dialog import ModelManagerDialog
+from stopping import default_stopping_criteria
 
 # Add the app directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -27,22 +29,26 @@ if sys.platform == "win32":
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-# ---------------- Medical Knowledge Base ----------------
-# Add these imports at the top
-import importlib.util
-import sys
-
 # ---------------- Knowledge Base Integration ----------------
-def load_knowledge_base(path):
-    """Dynamically load knowledge base from Python file"""
+def load_knowledge_base(path, source=None):
+    """Load a registered knowledge base as a key -> answer mapping
+
+    A compiled .kbsnap snapshot is mapped (and compiled first when missing
+    or stale), so no knowledge code runs at startup; a .json file is read
+    as-is. Other files are not loaded.
+    """
     try:
-        spec = importlib.util.spec_from_file_location("knowledge_base", path)
-        knowledge_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(knowledge_module)
-        return knowledge_module.get_knowledge_base()
+        if path.endswith(".kbsnap"):
+            # Built by kb_snapshot.py; answers are only decoded when looked up
+            from kb_snapshot import KnowledgeSnapshot, SnapshotFacts, VERIFIED_SYSTEM_SOURCE
+            return SnapshotFacts(KnowledgeSnapshot.load_or_build(path), source or VERIFIED_SYSTEM_SOURCE)
+        if path.endswith(".json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                return {key.lower(): answer for key, answer in json.load(f).items() if isinstance(answer, str)}
+        print(f"Skipping knowledge base {path}: not a .kbsnap snapshot or .json file")
     except Exception as e:
         print(f"Error loading knowledge base {path}: {e}")
-        return {}
+    return {}
 
 # Replace the MedicalKnowledgeBase class with this simpler version
 # ---------------- Medical Knowledge Base ----------------
@@ -94,6 +100,10 @@ class MedicalAIApp(QMainWindow):
         self.current_model = "Heart-Specific Model"  # Default model
         self.medical_tokenizer = None
         self.medical_model = None
+        self.prefix_cache = None
+        self.static_decoder = None
+        # key -> answer mappings of the registered knowledge bases (the compiled snapshot by default)
+        self.registered_knowledge = []
         
         # Initialize managers
         self.model_manager = ModelManager()
@@ -563,6 +573,10 @@ class MedicalAIApp(QMainWindow):
                 path = self.get_knowledge_base_path(kb_file)
                 if os.path.exists(path):
                     self.heart_attack_specialist.knowledge_system.load_verified_knowledge(path)
+            self.registered_knowledge = [
+                load_knowledge_base(self.kb_manager.resolve_path(info.get("path", "")))
+                for info in self.kb_manager.knowledge_bases.values()
+            ]
             print("All knowledge bases loaded successfully")
         except Exception as e:
             print(f"Error loading verified knowledge bases: {e}")
@@ -570,7 +584,8 @@ class MedicalAIApp(QMainWindow):
     def show_model_manager(self):
         dialog = ModelManagerDialog(self.model_manager, self)
         dialog.exec_()
-        # Reload model if needed
+        # Reload model if needed (registry settings such as precision may have changed)
+        self.model_manager.unload_model(self.current_model)
         self.load_medical_model()
 
     def setup_management_buttons(self):
@@ -670,24 +685,17 @@ class MedicalAIApp(QMainWindow):
                 self.add_to_conversation("System", f"Model files incomplete. Missing: {', '.join(missing_files)}")
                 return
             
-            # Load tokenizer and model using locally installed libraries
-            print("Loading tokenizer...")
-            self.medical_tokenizer = GPT2Tokenizer.from_pretrained(
-                model_path,
-                padding_side='left'
-            )
-            print("Tokenizer loaded successfully")
+            # The manager keeps recently used models resident, so switching back is instant
+            start_time = time.time()
+            loaded = self.model_manager.load_model(self.current_model, model_path, backend="torch")
+            self.medical_tokenizer = loaded.tokenizer
+            self.medical_model = loaded.model
+            print(f"Model ready in {(time.time() - start_time) * 1000:.0f} ms (precision: {loaded.precision})")
             
-            print("Loading model...")
-            self.medical_model = GPT2LMHeadModel.from_pretrained(model_path)
-            print("Model loaded successfully")
-            
-            # Add padding token if it doesn't exist
-            if self.medical_tokenizer.pad_token is None:
-                self.medical_tokenizer.pad_token = self.medical_tokenizer.eos_token
-                
-            # Set model to evaluation mode
-            self.medical_model.eval()
+            # KV cache for the fixed instruction scaffold and the preallocated decode buffers,
+            # built once per resident model
+            self.prefix_cache = loaded.prefix_cache("### Instruction:\n")
+            self.static_decoder = loaded.static_decoder(max_length=200)
             
             success_msg = f"{self.current_model} loaded successfully"
             print(success_msg)
@@ -710,21 +718,27 @@ class MedicalAIApp(QMainWindow):
         if self.current_model == "Heart-Specific Model" and self.medical_model and self.medical_tokenizer:
             try:
                 input_text = f"### Instruction:\n{question}\n\n### Response:\n"
-                inputs = self.medical_tokenizer.encode(input_text, return_tensors="pt")
+                inputs = self.medical_tokenizer.encode(input_text)
+                stopping = default_stopping_criteria(
+                    self.medical_tokenizer,
+                    budget=200 - len(inputs),
+                    eos_token_id=self.medical_tokenizer.eos_token_id
+                )
 
-                outputs = self.medical_model.generate(
+                outputs = list(self.static_decoder.generate(
                     inputs,
                     max_length=200,
-                    num_return_sequences=1,
                     temperature=0.7,
                     do_sample=True,
-                    pad_token_id=self.medical_tokenizer.eos_token_id,
                     repetition_penalty=1.2,
-                    no_repeat_ngram_size=3
-                )
+                    no_repeat_ngram_size=3,
+                    eos_token_id=self.medical_tokenizer.eos_token_id,
+                    prefix_cache=self.prefix_cache,
+                    stopping=stopping
+                ))
 
-                model_response = self.medical_tokenizer.decode(outputs[0], skip_special_tokens=True)
-                model_response = model_response.split("### Response:")[-1].strip()
+                model_response = self.medical_tokenizer.decode(inputs + outputs, skip_special_tokens=True)
+                model_response = stopping.trim(model_response.split("### Response:")[-1])
                 
                 # If model response is reasonable, use it
                 if len(model_response) > 5:
@@ -852,6 +866,11 @@ class MedicalAIApp(QMainWindow):
     def get_knowledge_based_response(self, question):
         question_lower = question.lower()
         
+        # Exact questions from the registered knowledge bases
+        for knowledge in self.registered_knowledge:
+            if question_lower in knowledge:
+                return knowledge[question_lower]
+        
         # Check for heart-related questions
         heart_terms = ["heart", "cardiac", "chest pain", "myocardial", "attack"]
         if any(term in question_lower for term in heart_terms):
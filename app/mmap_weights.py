@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Zero-copy loading of safetensors checkpoints
+
+load_mmap_model maps model.safetensors copy-on-write and points every
+parameter of a freshly built GPT2LMHeadModel straight at the mapped bytes,
+so nothing is read up front: pages come in from the page cache as the
+first forward pass touches them, and every process on the host (web
+workers, the GUI, inference pool workers that map the file themselves)
+shares the same physical pages. The file is parsed directly (8-byte header length, JSON header, raw
+little-endian data), so the safetensors package is not needed.
+
+Existing pytorch_model.bin checkpoints can be converted once:
+
+    python mmap_weights.py models/heart_attack_specialized_complete/model/
+"""
+
+import contextlib
+import json
+import os
+import struct
+import sys
+import numpy as np
+import torch
+
+SAFETENSORS_NAME = "model.safetensors"
+PYTORCH_BIN_NAME = "pytorch_model.bin"
+
+# safetensors dtype tag -> (numpy dtype used for the mapping, torch dtype of the parameter)
+DTYPES = {
+    "F64": (np.float64, torch.float64),
+    "F32": (np.float32, torch.float32),
+    "F16": (np.float16, torch.float16),
+    # numpy has no bfloat16; map the raw 16-bit words and reinterpret them in torch
+    "BF16": (np.int16, torch.bfloat16),
+    "I64": (np.int64, torch.int64),
+    "I32": (np.int32, torch.int32),
+    "I16": (np.int16, torch.int16),
+    "I8": (np.int8, torch.int8),
+    "U8": (np.uint8, torch.uint8),
+    "BOOL": (np.bool_, torch.bool),
+}
+TORCH_TO_TAG = {torch_dtype: tag for tag, (_, torch_dtype) in DTYPES.items()}
+
+
+def read_header(path):
+    """Return (header dict, byte offset where the tensor data starts)"""
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError(f"{path} is too small to be a safetensors file")
+        header_size = struct.unpack('<Q', prefix)[0]
+        if header_size > os.path.getsize(path) - 8:
+            # Typically a git-lfs pointer that was never pulled
+            raise ValueError(f"{path} has an invalid safetensors header")
+        header = json.loads(f.read(header_size).decode('utf-8'))
+    return header, 8 + header_size
+
+
+def is_safetensors(path):
+    try:
+        read_header(path)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def mmap_state_dict(path):
+    """Map a safetensors file and return {name: tensor} views over the mapped pages
+
+    The mapping is private copy-on-write ('c'): the weights are never written
+    through to the file, and pages stay shared until someone modifies them.
+    """
+    header, data_start = read_header(path)
+    header.pop("__metadata__", None)
+    if not header:
+        return {}
+
+    mapped = np.memmap(path, dtype=np.uint8, mode='c')
+    state_dict = {}
+    for name, info in header.items():
+        if info["dtype"] not in DTYPES:
+            raise ValueError(f"Unsupported dtype {info['dtype']} for {name}")
+        np_dtype, torch_dtype = DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        shape = info["shape"]
+
+        raw = mapped[data_start + start:data_start + end]
+        if (data_start + start) % np.dtype(np_dtype).itemsize:
+            # Misaligned tensors cannot be viewed in place; copy just this one
+            raw = raw.copy()
+        array = raw.view(np_dtype).reshape(shape)
+        tensor = torch.from_numpy(array)
+        if torch_dtype is torch.bfloat16:
+            tensor = tensor.view(torch.bfloat16)
+        state_dict[name] = tensor
+    return state_dict
+
+
+@contextlib.contextmanager
+def skip_weight_init():
+    """Build modules without running their random initializers (the checkpoint overwrites them)"""
+    names = ("normal_", "uniform_", "kaiming_uniform_", "kaiming_normal_", "xavier_uniform_", "xavier_normal_", "zeros_", "ones_")
+    saved = {name: getattr(torch.nn.init, name) for name in names}
+    for name in names:
+        setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+    try:
+        from transformers.modeling_utils import no_init_weights
+        context = no_init_weights()
+    except ImportError:
+        # contextlib.nullcontext needs Python 3.7; the Jetson image ships 3.6
+        context = contextlib.ExitStack()
+    try:
+        with context:
+            yield
+    finally:
+        for name, func in saved.items():
+            setattr(torch.nn.init, name, func)
+
+
+def _assign(model, name, tensor):
+    module_name, _, leaf = name.rpartition('.')
+    module = model.get_submodule(module_name) if module_name else model
+    if leaf in module._parameters:
+        module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[leaf] = tensor
+
+
+def load_mmap_model(model_path, model_class=None, weights_path=None):
+    """Build a model from config.json with its weights mapped from model.safetensors (or weights_path)"""
+    if model_class is None:
+        from transformers import GPT2LMHeadModel
+        model_class = GPT2LMHeadModel
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_path)
+    state_dict = mmap_state_dict(weights_path or os.path.join(model_path, SAFETENSORS_NAME))
+
+    with skip_weight_init():
+        model = model_class(config)
+
+    expected = dict(model.state_dict())
+    prefix = getattr(model, 'base_model_prefix', '')
+    loaded = set()
+    for name, tensor in state_dict.items():
+        # Checkpoints saved from the bare GPT2Model lack the "transformer." prefix
+        if name not in expected and prefix and f"{prefix}.{name}" in expected:
+            name = f"{prefix}.{name}"
+        if name not in expected:
+            continue
+        if tuple(expected[name].shape) != tuple(tensor.shape):
+            raise ValueError(f"Shape mismatch for {name}: checkpoint {tuple(tensor.shape)}, model {tuple(expected[name].shape)}")
+        _assign(model, name, tensor)
+        loaded.add(name)
+
+    # lm_head shares the embedding matrix and is not stored separately
+    model.tie_weights()
+    missing = [name for name in expected if name not in loaded and not name.endswith(('attn.bias', 'attn.masked_bias', 'lm_head.weight'))]
+    if missing:
+        raise ValueError(f"{len(missing)} weights missing from {SAFETENSORS_NAME}, e.g. {missing[0]}")
+
+    model.weights_mapped = True
+    # Lets other processes (inference pool workers) map the same file instead of receiving a copy
+    model.weights_source = (model_path, weights_path)
+    model.eval()
+    return model
+
+
+def save_safetensors(state_dict, path, metadata=None):
+    """Write tensors in safetensors layout (8-byte aligned header, contiguous data)"""
+    header = {"__metadata__": dict(metadata or {"format": "pt"})}
+    tensors = []
+    offset = 0
+    for name in sorted(state_dict):
+        tensor = state_dict[name].detach().cpu().contiguous()
+        if tensor.dtype not in TORCH_TO_TAG:
+            raise ValueError(f"Unsupported dtype {tensor.dtype} for {name}")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": TORCH_TO_TAG[tensor.dtype], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + size]}
+        tensors.append(tensor)
+        offset += size
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for tensor in tensors:
+            if tensor.dtype is torch.bfloat16:
+                tensor = tensor.view(torch.int16)
+            f.write(tensor.numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def convert_bin_to_safetensors(model_path, remove_bin=False, out_path=None):
+    """One-time conversion of pytorch_model.bin to model.safetensors (next to it unless out_path is given)"""
+    bin_path = os.path.join(model_path, PYTORCH_BIN_NAME)
+    out_path = out_path or os.path.join(model_path, SAFETENSORS_NAME)
+
+    state_dict = torch.load(bin_path, map_location="cpu")
+    # Tied tensors (lm_head/wte) share storage; store each storage once
+    seen = set()
+    unique = {}
+    for name, tensor in state_dict.items():
+        key = (tensor.data_ptr(), tuple(tensor.shape))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique[name] = tensor
+
+    save_safetensors(unique, out_path)
+    print(f"✅ Wrote {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB, {len(unique)} tensors)")
+    if remove_bin:
+        os.remove(bin_path)
+    return out_path
+
+
+def load_pretrained(model_path, convert=False):
+    """Load GPT-2 weights from model_path, mapping model.safetensors when it is usable
+
+    With ``convert`` a pytorch_model.bin without a safetensors twin is
+    converted first; otherwise it is loaded the usual way (full read).
+    Returns None when neither file holds real weights.
+    """
+    from transformers import GPT2LMHeadModel
+
+    safetensors_path = os.path.join(model_path, SAFETENSORS_NAME)
+    bin_path = os.path.join(model_path, PYTORCH_BIN_NAME)
+
+    if convert and os.path.exists(bin_path) and not is_safetensors(safetensors_path):
+        try:
+            convert_bin_to_safetensors(model_path)
+        except Exception as e:
+            print(f"Could not convert {bin_path} to safetensors: {e}")
+
+    if is_safetensors(safetensors_path):
+        try:
+            model = load_mmap_model(model_path)
+            print("Using model.safetensors (memory-mapped)...")
+            return model
+        except Exception as e:
+            print(f"Memory-mapped load failed ({e})")
+
+    if os.path.exists(bin_path):
+        print("Using pytorch_model.bin file...")
+        return GPT2LMHeadModel.from_pretrained(model_path)
+    return None
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert pytorch_model.bin checkpoints to memory-mappable safetensors")
+    parser.add_argument("model_paths", nargs="+", help="Model directories containing pytorch_model.bin")
+    parser.add_argument("--remove-bin", action="store_true", help="Delete the .bin file after converting")
+    args = parser.parse_args()
+
+    for model_path in args.model_paths:
+        if not os.path.exists(os.path.join(model_path, PYTORCH_BIN_NAME)):
+            print(f"❌ No {PYTORCH_BIN_NAME} in {model_path}")
+            continue
+        convert_bin_to_safetensors(model_path, remove_bin=args.remove_bin)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime backend for the DistilGPT2 models
+
+Exports a model directory to a single ONNX decoder graph that takes and
+returns the KV cache (past_key_values.N.key/value -> present.N.key/value),
+and runs it through onnxruntime on CPU. OnnxGPT2Model is called the same way
+as GPT2LMHeadModel's forward, so the batching engine and the streaming
+decode loop work with either backend.
+
+    python onnx_backend.py models/heart_attack_specialized_complete/model
+"""
+
+import inspect
+import os
+import sys
+import numpy as np
+import torch
+from transformers import GPT2Config
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILENAME = "decoder_with_past.onnx"
+
+
+def get_onnx_path(model_path):
+    return os.path.join(model_path, ONNX_SUBDIR, ONNX_FILENAME)
+
+
+def onnxruntime_installed():
+    return onnxruntime is not None
+
+
+def onnx_available(model_path):
+    """True when onnxruntime is installed and the model has been exported"""
+    return onnxruntime is not None and os.path.exists(get_onnx_path(model_path))
+
+
+class _DecoderWithPast(torch.nn.Module):
+    """Flattens the nested KV cache into positional inputs/outputs for export"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.n_layer
+
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        past_key_values = tuple((past[2 * i], past[2 * i + 1]) for i in range(self.num_layers))
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past_key_values,
+            use_cache=True,
+            return_dict=True
+        )
+        present = [tensor for layer in outputs.past_key_values for tensor in layer]
+        return (outputs.logits, *present)
+
+
+def export_onnx(model_path, output_path=None, opset_version=13):
+    """Export a GPT-2 model directory to an ONNX graph with KV-cache inputs and outputs"""
+    from transformers import GPT2LMHeadModel
+
+    output_path = output_path or get_onnx_path(model_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    model = GPT2LMHeadModel.from_pretrained(model_path)
+    model.eval()
+    config = model.config
+    head_dim = config.n_embd // config.n_head
+
+    # Trace with a non-empty cache so the concat path is kept; prefill feeds an empty one
+    past_length = 2
+    input_ids = torch.ones((1, 3), dtype=torch.long)
+    attention_mask = torch.ones((1, past_length + 3), dtype=torch.long)
+    position_ids = torch.arange(past_length, past_length + 3, dtype=torch.long).unsqueeze(0)
+    past = [torch.zeros((1, config.n_head, past_length, head_dim)) for _ in range(2 * config.n_layer)]
+
+    past_names = []
+    present_names = []
+    dynamic_axes = {
+        'input_ids': {0: 'batch', 1: 'sequence'},
+        'attention_mask': {0: 'batch', 1: 'total_sequence'},
+        'position_ids': {0: 'batch', 1: 'sequence'},
+        'logits': {0: 'batch', 1: 'sequence'}
+    }
+    for layer in range(config.n_layer):
+        for kind in ('key', 'value'):
+            past_name = f"past_key_values.{layer}.{kind}"
+            present_name = f"present.{layer}.{kind}"
+            past_names.append(past_name)
+            present_names.append(present_name)
+            dynamic_axes[past_name] = {0: 'batch', 2: 'past_sequence'}
+            dynamic_axes[present_name] = {0: 'batch', 2: 'total_sequence'}
+
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; keep the TorchScript one
+        export_kwargs['dynamo'] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _DecoderWithPast(model),
+            (input_ids, attention_mask, position_ids, *past),
+            output_path,
+            input_names=['input_ids', 'attention_mask', 'position_ids'] + past_names,
+            output_names=['logits'] + present_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            do_constant_folding=True,
+            **export_kwargs
+        )
+
+    print(f"✅ Exported ONNX model to {output_path}")
+    return output_path
+
+
+class OnnxModelOutput:
+    """Mimics the fields of a transformers CausalLMOutputWithPast we rely on"""
+
+    def __init__(self, logits, past_key_values):
+        self.logits = logits
+        self.past_key_values = past_key_values
+
+
+class OnnxGPT2Model:
+    """GPT-2 decoder running on onnxruntime with the same call signature as the torch model"""
+
+    backend = "onnx"
+
+    def __init__(self, model_path, onnx_path=None, num_threads=None):
+        if onnxruntime is None:
+            raise ImportError("onnxruntime is not installed")
+
+        self.model_path = model_path
+        self.onnx_path = onnx_path or get_onnx_path(model_path)
+        self.config = GPT2Config.from_pretrained(model_path)
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            self.onnx_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+
+        self.num_layers = self.config.n_layer
+        self.head_dim = self.config.n_embd // self.config.n_head
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+    def eval(self):
+        return self
+
+    def parameters(self):
+        # Lets code that inspects the first parameter find the dtype/device
+        yield torch.zeros(0, dtype=self.dtype)
+
+    @staticmethod
+    def _to_numpy(tensor, dtype):
+        if isinstance(tensor, torch.Tensor):
+            tensor = tensor.detach().cpu().numpy()
+        return np.ascontiguousarray(tensor, dtype=dtype)
+
+    def __call__(self, input_ids, past_key_values=None, attention_mask=None, position_ids=None,
+                 use_cache=True, **kwargs):
+        input_ids = self._to_numpy(input_ids, np.int64)
+        batch_size, sequence_length = input_ids.shape
+        past_length = past_key_values[0][0].shape[2] if past_key_values else 0
+
+        if attention_mask is None:
+            attention_mask = np.ones((batch_size, past_length + sequence_length), dtype=np.int64)
+        if position_ids is None:
+            position_ids = np.arange(past_length, past_length + sequence_length, dtype=np.int64)
+            position_ids = np.broadcast_to(position_ids, (batch_size, sequence_length))
+
+        feed = {
+            'input_ids': input_ids,
+            'attention_mask': self._to_numpy(attention_mask, np.int64),
+            'position_ids': self._to_numpy(position_ids, np.int64)
+        }
+
+        empty = np.zeros((batch_size, self.config.n_head, 0, self.head_dim), dtype=np.float32)
+        for layer in range(self.num_layers):
+            key, value = past_key_values[layer] if past_key_values else (empty, empty)
+            feed[f"past_key_values.{layer}.key"] = self._to_numpy(key, np.float32)
+            feed[f"past_key_values.{layer}.value"] = self._to_numpy(value, np.float32)
+
+        outputs = self.session.run(self.output_names, feed)
+
+        logits = torch.from_numpy(outputs[0])
+        present = tuple(
+            (torch.from_numpy(outputs[1 + 2 * layer]), torch.from_numpy(outputs[2 + 2 * layer]))
+            for layer in range(self.num_layers)
+        )
+        return OnnxModelOutput(logits, present)
+
+    forward = __call__
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python onnx_backend.py <model_dir> [output.onnx]")
+        return 1
+    export_onnx(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
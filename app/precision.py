@@ -0,0 +1,61 @@
+import torch
+import torch.nn as nn
+
+try:
+    from transformers.pytorch_utils import Conv1D
+except ImportError:
+    # Older transformers releases keep Conv1D in modeling_utils
+    from transformers.modeling_utils import Conv1D
+
+# Selectable per model through the "precision" field in model_registry.json
+PRECISION_MODES = ("fp32", "bf16", "int8")
+DEFAULT_PRECISION = "fp32"
+
+
+def _linear_from_conv1d(conv):
+    """GPT-2's Conv1D is a transposed Linear; rebuild it as nn.Linear so it can be quantized"""
+    in_features, out_features = conv.weight.shape
+    linear = nn.Linear(in_features, out_features)
+    linear.weight.data = conv.weight.data.t().contiguous()
+    linear.bias.data = conv.bias.data
+    return linear
+
+
+def conv1d_to_linear(module):
+    """Replace every Conv1D in a module tree with an equivalent nn.Linear"""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            setattr(module, name, _linear_from_conv1d(child))
+        else:
+            conv1d_to_linear(child)
+    return module
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of all Linear/Conv1D layers (weights int8, activations fp32)"""
+    engines = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine not in engines or torch.backends.quantized.engine == 'none':
+        # x86 uses fbgemm, ARM boards such as the Jetson use qnnpack
+        torch.backends.quantized.engine = 'fbgemm' if 'fbgemm' in engines else 'qnnpack'
+
+    conv1d_to_linear(model)
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def apply_precision(model, precision=DEFAULT_PRECISION):
+    """Convert a loaded fp32 model to the requested precision mode"""
+    precision = (precision or DEFAULT_PRECISION).lower()
+    if precision not in PRECISION_MODES:
+        print(f"Unknown precision '{precision}', using {DEFAULT_PRECISION}")
+        precision = DEFAULT_PRECISION
+
+    if precision == "bf16":
+        model = model.to(torch.bfloat16)
+    elif precision == "int8":
+        model = quantize_int8(model)
+    if precision != DEFAULT_PRECISION:
+        # Converted weights are fresh tensors, no longer backed by a mapped file
+        model.weights_mapped = False
+
+    model.eval()
+    return model
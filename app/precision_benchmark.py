@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Compare precision modes (fp32, bf16, int8) on a fixed question set
+
+For each mode this reports mean latency per answer, decode throughput,
+model size in memory, process RSS (each mode measured in a fresh process,
+so earlier modes do not inflate it) and how far the answers drift from the
+fp32 reference: exact-match rate, token agreement and the mean KL divergence
+of the next-token distribution along the fp32 answers.
+
+    python precision_benchmark.py --model-path models/heart_attack_specialized_complete/model
+"""
+
+import argparse
+import copy
+import io
+import json
+import gc
+import os
+import subprocess
+import sys
+import time
+import torch
+from transformers import GPT2Tokenizer, GPT2LMHeadModel
+from precision import PRECISION_MODES, apply_precision
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BENCHMARK_QUESTIONS = [
+    "What are the symptoms of a heart attack?",
+    "What should I do during a heart attack?",
+    "How can I prevent a heart attack?",
+    "What causes a heart attack?",
+    "How are heart attacks treated?",
+    "What is recovery like after a heart attack?",
+    "Do women have different heart attack symptoms?",
+    "What is the difference between a heart attack and cardiac arrest?"
+]
+
+PROMPT_TEMPLATE = "### Instruction:\n{}\n\n### Response:\n"
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", "heart_attack_specialized_complete", "model"
+)
+
+
+def model_size_bytes(model):
+    """Serialized state_dict size; counts packed int8 weights that parameters() misses"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def process_rss_bytes():
+    return psutil.Process(os.getpid()).memory_info().rss if psutil else None
+
+
+def rss_probe(model_path, precision, max_length):
+    """Child side of measure_rss: load one mode, answer one question, print RSS"""
+    tokenizer = GPT2Tokenizer.from_pretrained(model_path)
+    model = GPT2LMHeadModel.from_pretrained(model_path)
+    model.eval()
+    model = apply_precision(model, precision)
+    gc.collect()
+    greedy_answer(model, tokenizer, BENCHMARK_QUESTIONS[0], max_length)
+    print(process_rss_bytes())
+
+
+def measure_rss(model_path, precision, max_length):
+    """RSS in bytes of a fresh process that holds only this mode's model"""
+    if psutil is None:
+        return None
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--model-path", model_path,
+         "--max-length", str(max_length), "--rss-probe", precision],
+        stdout=subprocess.PIPE, universal_newlines=True
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines or not lines[-1].isdigit():
+        print(f"Could not measure RSS for {precision}")
+        return None
+    return int(lines[-1])
+
+
+def greedy_answer(model, tokenizer, question, max_length):
+    input_ids = tokenizer.encode(PROMPT_TEMPLATE.format(question), return_tensors="pt")
+    start_time = time.time()
+    with torch.no_grad():
+        output = model.generate(
+            input_ids,
+            max_length=max_length,
+            do_sample=False,
+            pad_token_id=tokenizer.eos_token_id,
+            repetition_penalty=1.2
+        )
+    elapsed = time.time() - start_time
+    return input_ids, output[0, input_ids.size(1):].tolist(), elapsed
+
+
+def next_token_log_probs(model, input_ids, answer_ids):
+    """Log-probabilities at every answer position, teacher-forced on the given answer"""
+    sequence = torch.tensor([input_ids[0].tolist() + answer_ids], dtype=torch.long)
+    with torch.no_grad():
+        logits = model(sequence).logits[0, input_ids.size(1) - 1:-1].float()
+    return torch.log_softmax(logits, dim=-1)
+
+
+def token_agreement(reference, candidate):
+    """Fraction of reference tokens reproduced before the first divergence"""
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    matched = 0
+    for ref_token, token in zip(reference, candidate):
+        if ref_token != token:
+            break
+        matched += 1
+    return matched / len(reference)
+
+
+def run_mode(base_model, tokenizer, precision, questions, max_length, reference=None):
+    model = apply_precision(copy.deepcopy(base_model), precision)
+    results = {'precision': precision, 'size_mb': round(model_size_bytes(model) / 1e6, 1)}
+
+    answers = []
+    latencies = []
+    tokens = 0
+    for question in questions:
+        input_ids, answer_ids, elapsed = greedy_answer(model, tokenizer, question, max_length)
+        answers.append((input_ids, answer_ids))
+        latencies.append(elapsed)
+        tokens += len(answer_ids)
+
+    results['mean_latency_ms'] = round(sum(latencies) / len(latencies) * 1000, 1)
+    results['tokens_per_second'] = round(tokens / sum(latencies), 2) if sum(latencies) > 0 else 0.0
+
+    if reference is not None:
+        exact = 0
+        agreement = 0.0
+        kl_total = 0.0
+        kl_positions = 0
+        for (input_ids, ref_ids, ref_log_probs), (_, answer_ids) in zip(reference, answers):
+            exact += int(answer_ids == ref_ids)
+            agreement += token_agreement(ref_ids, answer_ids)
+            if ref_ids:
+                log_probs = next_token_log_probs(model, input_ids, ref_ids)
+                kl = torch.sum(ref_log_probs.exp() * (ref_log_probs - log_probs), dim=-1)
+                kl_total += float(kl.sum())
+                kl_positions += kl.numel()
+        results['exact_match'] = round(exact / len(answers), 3)
+        results['token_agreement'] = round(agreement / len(answers), 3)
+        results['mean_kl'] = round(kl_total / kl_positions, 5) if kl_positions else 0.0
+
+    del model
+    return results, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, memory and answer drift per precision mode")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--modes", nargs="+", default=list(PRECISION_MODES), choices=PRECISION_MODES)
+    parser.add_argument("--max-length", type=int, default=200)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--rss-probe", choices=PRECISION_MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rss_probe:
+        rss_probe(args.model_path, args.rss_probe, args.max_length)
+        return 0
+
+    print(f"Loading fp32 model from {args.model_path}...")
+    tokenizer = GPT2Tokenizer.from_pretrained(args.model_path)
+    base_model = GPT2LMHeadModel.from_pretrained(args.model_path)
+    base_model.eval()
+
+    # fp32 answers and distributions are the reference every mode is compared to
+    fp32_results, fp32_answers = run_mode(base_model, tokenizer, "fp32", BENCHMARK_QUESTIONS, args.max_length)
+    reference = [
+        (input_ids, answer_ids, next_token_log_probs(base_model, input_ids, answer_ids) if answer_ids else None)
+        for input_ids, answer_ids in fp32_answers
+    ]
+
+    all_results = []
+    for precision in args.modes:
+        results, _ = run_mode(base_model, tokenizer, precision, BENCHMARK_QUESTIONS, args.max_length, reference)
+        rss = measure_rss(args.model_path, precision, args.max_length)
+        results['rss_mb'] = round(rss / 1e6, 1) if rss else None
+        all_results.append(results)
+
+    print()
+    print(f"{'mode':<6}{'size MB':>10}{'RSS MB':>10}{'latency ms':>12}{'tok/s':>10}{'exact':>8}{'agree':>8}{'KL':>10}")
+    for r in all_results:
+        print(f"{r['precision']:<6}{r['size_mb']:>10}{str(r['rss_mb']):>10}{r['mean_latency_ms']:>12}"
+              f"{r['tokens_per_second']:>10}{r['exact_match']:>8}{r['token_agreement']:>8}{r['mean_kl']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'questions': BENCHMARK_QUESTIONS, 'fp32': fp32_results, 'results': all_results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
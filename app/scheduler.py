@@ -0,0 +1,88 @@
+import re
+import threading
+import time
+from collections import Counter
+from heart_attack_knowledge import HeartAttackKnowledgeSystem
+from inference_engine import EngineClosed, PRIORITY_EMERGENCY, PRIORITY_NORMAL
+
+DEFAULT_DEADLINE_SECONDS = 10.0
+
+
+def _emergency_pattern():
+    """Word-boundary regex over the heart_attack_emergency keywords of the knowledge system"""
+    keywords = HeartAttackKnowledgeSystem().medical_knowledge["heart_attack_emergency"]["keywords"]
+    return re.compile(r'\b(?:' + '|'.join(re.escape(k) for k in keywords) + r')\b')
+
+
+EMERGENCY_PATTERN = _emergency_pattern()
+
+
+def classify_priority(message):
+    """Emergency-intent questions are admitted ahead of everything else"""
+    if EMERGENCY_PATTERN.search(message.lower()):
+        return PRIORITY_EMERGENCY
+    return PRIORITY_NORMAL
+
+
+class AdmissionController:
+    """Priority admission with deadline-based shedding in front of the inference engine
+
+    Each request gets a priority from its text and a latency deadline. If the
+    engine's projected latency for that priority already exceeds the deadline
+    the request is shed up front (``submit`` returns None) and the caller
+    answers from the knowledge base; requests whose deadline passes while
+    queued are shed by the engine with DeadlineExceeded.
+    """
+
+    def __init__(self, engine, deadline_seconds=DEFAULT_DEADLINE_SECONDS):
+        self.engine = engine
+        self.deadline_seconds = deadline_seconds
+        self.lock = threading.Lock()
+        self.admitted = Counter()
+        self.shed_on_admission = Counter()
+        self.shed_in_queue = Counter()
+
+    def submit(self, prompt_ids, message, deadline_seconds=None, **kwargs):
+        """Queue a generation, or return None when it cannot meet its deadline"""
+        priority = classify_priority(message)
+        budget = deadline_seconds or self.deadline_seconds
+
+        if self.engine.projected_latency(priority) > budget:
+            with self.lock:
+                self.shed_on_admission[priority] += 1
+            return None
+
+        with self.lock:
+            self.admitted[priority] += 1
+        return self.submit_to_engine(prompt_ids, priority=priority, deadline=time.time() + budget, **kwargs)
+
+    def submit_to_engine(self, prompt_ids, **kwargs):
+        """Submit to the current engine, following a model swap that closed the one we saw"""
+        while True:
+            engine = self.engine
+            try:
+                return engine.submit(prompt_ids, **kwargs)
+            except EngineClosed:
+                if self.engine is engine:
+                    raise
+
+    def record_shed(self, request):
+        """Count a request the engine shed because its deadline passed in the queue"""
+        with self.lock:
+            self.shed_in_queue[request.priority] += 1
+
+    def stats(self):
+        engine_stats = self.engine.stats()
+        names = {PRIORITY_EMERGENCY: 'emergency', PRIORITY_NORMAL: 'normal'}
+        with self.lock:
+            return {
+                'deadline_seconds': self.deadline_seconds,
+                'queue_depth': engine_stats.get('waiting_requests', sum(engine_stats.get('outstanding_per_worker', []))),
+                'projected_latency_ms': {
+                    names[p]: round(self.engine.projected_latency(p) * 1000, 1) for p in names
+                },
+                'admitted': {names[p]: n for p, n in self.admitted.items()},
+                'shed_on_admission': {names[p]: n for p, n in self.shed_on_admission.items()},
+                'shed_in_queue': {names[p]: n for p, n in self.shed_in_queue.items()},
+                'shed_total': sum(self.shed_on_admission.values()) + sum(self.shed_in_queue.values())
+            }
@@ -0,0 +1,106 @@
+import torch
+from generation import next_token_logits
+
+# Longest n-gram tried first; a 1-token match is too weak to be worth a draft
+DEFAULT_NGRAM_SIZES = (4, 3, 2)
+DEFAULT_MAX_DRAFT = 8
+
+
+def knowledge_base_texts():
+    """Answer texts from the verified and keyword knowledge bases the model tends to quote"""
+    from kb_snapshot import KEYWORD_SYSTEM_SOURCE, VERIFIED_SYSTEM_SOURCE, default_snapshot
+
+    snapshot = default_snapshot()
+    texts = []
+    for fact in snapshot.source_facts(VERIFIED_SYSTEM_SOURCE):
+        # Drop the "[Source: ...]" attribution added by add_verified_fact
+        texts.append(snapshot.answer(fact).split("\n\n[Source:")[0])
+    for fact in snapshot.source_facts(KEYWORD_SYSTEM_SOURCE):
+        texts.append(snapshot.answer(fact))
+    return texts
+
+
+class PromptLookup:
+    """Draft tokens by matching the sequence's trailing n-gram against known text
+
+    Prompt-lookup decoding: if the last few tokens also occur earlier in the
+    prompt/answer, or in one of the knowledge-base texts, the tokens that
+    followed them there are a cheap guess for what comes next. The model then
+    checks the whole guess in one forward pass (see verify_draft_token).
+    """
+
+    def __init__(self, tokenizer, texts=(), ngram_sizes=DEFAULT_NGRAM_SIZES, max_draft=DEFAULT_MAX_DRAFT):
+        self.ngram_sizes = sorted(ngram_sizes, reverse=True)
+        self.max_draft = max_draft
+        self.documents = []
+        # n-gram -> (document index, position right after the n-gram), first occurrence wins
+        self.index = {}
+        for text in texts:
+            self.add_text(tokenizer, text)
+
+    def add_text(self, tokenizer, text):
+        doc_id = len(self.documents)
+        token_ids = tokenizer.encode(text)
+        self.documents.append(token_ids)
+        for n in self.ngram_sizes:
+            for end in range(n, len(token_ids)):
+                self.index.setdefault(tuple(token_ids[end - n:end]), (doc_id, end))
+
+    def __len__(self):
+        return len(self.documents)
+
+    @staticmethod
+    def _search_context(token_ids, ngram):
+        """Position after the most recent earlier occurrence of ngram in the sequence itself"""
+        n = len(ngram)
+        for start in range(len(token_ids) - n - 1, -1, -1):
+            if tuple(token_ids[start:start + n]) == ngram:
+                return start + n
+        return None
+
+    def draft(self, token_ids, max_tokens=None):
+        """Return a list of proposed next tokens (empty when nothing matches)"""
+        limit = min(self.max_draft, max_tokens) if max_tokens is not None else self.max_draft
+        if limit <= 0:
+            return []
+
+        for n in self.ngram_sizes:
+            if len(token_ids) < n:
+                continue
+            ngram = tuple(token_ids[-n:])
+
+            position = self._search_context(token_ids, ngram)
+            if position is not None:
+                return list(token_ids[position:position + limit])
+
+            match = self.index.get(ngram)
+            if match is not None:
+                doc_id, position = match
+                return self.documents[doc_id][position:position + limit]
+        return []
+
+
+def verify_draft_token(logits, token_ids, draft_token, temperature=0.7, top_k=50,
+                       repetition_penalty=1.0, do_sample=True):
+    """Decide one draft position; returns (token to emit, whether the draft was accepted)
+
+    Greedy: the draft is kept when it is the argmax. Sampling: the draft is a
+    point-mass proposal, so it is kept with probability p(draft) and otherwise
+    the token is resampled from p with the draft removed. Either way the
+    output has exactly the distribution of normal decoding.
+    """
+    logits = next_token_logits(logits, token_ids, temperature, top_k, repetition_penalty, do_sample)
+
+    if not do_sample:
+        token = int(torch.argmax(logits))
+        return token, token == draft_token
+
+    probs = torch.softmax(logits, dim=-1)
+    if draft_token is not None:
+        if float(torch.rand(())) < float(probs[draft_token]):
+            return draft_token, True
+        probs = probs.clone()
+        probs[draft_token] = 0.0
+        if float(probs.sum()) <= 0.0:
+            return draft_token, True
+    return int(torch.multinomial(probs, num_samples=1)), False
@@ -24,9 +24,14 @@ async function checkServerStatus() {
         const response = await fetch('/api/status');
         const data = await response.json();
         
-        updateStatusIndicator(data.model_loaded);
+        updateStatusIndicator(data.model_loaded, data.loading);
         updateModelInfo(data.model_type);
         
+        // The model loads in the background; poll until it is ready
+        if (!data.model_loaded && data.loading && data.loading.state !== 'failed') {
+            setTimeout(checkServerStatus, 2000);
+        }
+        
     } catch (error) {
         console.error('Status check failed:', error);
         updateStatusIndicator(false);
@@ -34,7 +39,7 @@ async function checkServerStatus() {
 }
 
 // Update status indicator
-function updateStatusIndicator(modelLoaded) {
+function updateStatusIndicator(modelLoaded, loading) {
     const statusDot = document.querySelector('.status-dot');
     const statusText = document.getElementById('statusText');
     const systemStatus = document.getElementById('systemStatus');
@@ -44,6 +49,11 @@ function updateStatusIndicator(modelLoaded) {
         statusText.textContent = 'AI Model Ready';
         systemStatus.textContent = 'Online';
         systemStatus.className = 'status-online';
+    } else if (loading && (loading.state === 'pending' || loading.state === 'loading')) {
+        statusDot.style.background = '#f59e0b';
+        statusText.textContent = `Loading AI Model (${loading.stage || 'starting'}, ${Math.round(loading.progress * 100)}%)`;
+        systemStatus.textContent = 'Starting';
+        systemStatus.className = 'status-offline';
     } else {
         statusDot.style.background = '#ef4444';
         statusText.textContent = 'Knowledge Base Only';
@@ -79,21 +89,25 @@ async function sendMessage() {
     showTypingIndicator();
     
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ message: message })
-        });
-        
-        const data = await response.json();
+        const streamed = await streamMessage(message);
         
-        if (data.response) {
-            addMessage(data.response, 'ai', data.source);
-            updateSourceBadge(data.source);
-        } else if (data.error) {
-            addMessage('Sorry, I encountered an error. Please try again.', 'ai', 'error');
+        if (!streamed) {
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ message: message })
+            });
+            
+            const data = await response.json();
+            
+            if (data.response) {
+                addMessage(data.response, 'ai', data.source);
+                updateSourceBadge(data.source);
+            } else if (data.error) {
+                addMessage('Sorry, I encountered an error. Please try again.', 'ai', 'error');
+            }
         }
         
     } catch (error) {
@@ -104,6 +118,111 @@ async function sendMessage() {
     }
 }
 
+// Stream a response token by token over server-sent events.
+// Returns false when streaming is unavailable so the caller can use /api/chat.
+async function streamMessage(message) {
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ message: message })
+    });
+    
+    if (!response.ok || !response.body || !response.body.getReader) {
+        return false;
+    }
+    
+    const reader = response.body.getReader();
+    const textDecoder = new TextDecoder();
+    let buffer = '';
+    let streamedText = '';
+    let messageContent = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += textDecoder.decode(value, { stream: true });
+        
+        // SSE frames are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = parseSseFrame(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            if (!frame) continue;
+            
+            if (frame.event === 'done') {
+                if (messageContent) {
+                    // The final answer may differ from the streamed text (e.g. knowledge base fallback)
+                    finishStreamingMessage(messageContent, frame.data.response, frame.data.source);
+                } else {
+                    hideTypingIndicator();
+                    addMessage(frame.data.response, 'ai', frame.data.source);
+                }
+                updateSourceBadge(frame.data.source);
+                if (frame.data.timing) {
+                    console.log('Response timing:', frame.data.timing);
+                }
+            } else if (frame.data.token) {
+                if (!messageContent) {
+                    hideTypingIndicator();
+                    messageContent = startStreamingMessage();
+                }
+                streamedText += frame.data.token;
+                messageContent.innerHTML = formatMessage(streamedText);
+                const chatMessages = document.getElementById('chatMessages');
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        }
+    }
+    
+    return true;
+}
+
+// Parse a single SSE frame into its event name and JSON data
+function parseSseFrame(frame) {
+    let event = 'message';
+    const dataLines = [];
+    
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    
+    if (dataLines.length === 0) return null;
+    
+    try {
+        return { event: event, data: JSON.parse(dataLines.join('\n')) };
+    } catch (error) {
+        return null;
+    }
+}
+
+// Create an empty AI message whose content is filled in as tokens arrive
+function startStreamingMessage() {
+    addMessage('', 'ai');
+    const messages = document.querySelectorAll('#chatMessages .ai-message .message-content');
+    return messages[messages.length - 1];
+}
+
+// Replace the streamed text with the final answer and record its source
+function finishStreamingMessage(messageContent, text, source) {
+    messageContent.innerHTML = formatMessage(text);
+    
+    const meta = messageContent.parentElement.querySelector('.message-meta');
+    if (meta && source) {
+        meta.innerHTML += ` • via ${formatSource(source)}`;
+    }
+    
+    const entry = chatHistory[chatHistory.length - 1];
+    entry.text = text;
+    entry.source = source;
+}
+
 // Add message to chat
 function addMessage(text, sender, source = null) {
     const chatMessages = document.getElementById('chatMessages');
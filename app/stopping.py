@@ -0,0 +1,203 @@
+import re
+import threading
+from collections import Counter
+from generation import StreamingTextDecoder
+
+
+class StoppingCriterion:
+    """One rule for ending generation early; subclasses override should_stop"""
+
+    reason = "criterion"
+
+    def reset(self):
+        pass
+
+    def should_stop(self, generated_ids, text):
+        return False
+
+    def trim(self, text):
+        """Remove whatever text triggered the stop (e.g. a trailing marker)"""
+        return text
+
+
+class MaxNewTokens(StoppingCriterion):
+    """Per-request budget of generated tokens, independent of the prompt length"""
+
+    reason = "max_new_tokens"
+
+    def __init__(self, max_new_tokens):
+        self.max_new_tokens = max_new_tokens
+
+    def should_stop(self, generated_ids, text):
+        return len(generated_ids) >= self.max_new_tokens
+
+
+class StopOnMarker(StoppingCriterion):
+    """Stop once the model starts a new template section such as '### Medical Question:'"""
+
+    reason = "marker"
+
+    def __init__(self, marker="###"):
+        self.marker = marker
+
+    def should_stop(self, generated_ids, text):
+        return self.marker in text
+
+    def trim(self, text):
+        return text.split(self.marker)[0]
+
+
+class SentenceLimit(StoppingCriterion):
+    """Stop after a number of complete sentences (list markers like '2.' don't count)"""
+
+    reason = "sentence_limit"
+    SENTENCE_END = re.compile(r'(?<!\b\d)(?<!\b\d\d)[.!?]+(?=\s|$)')
+
+    def __init__(self, max_sentences=5):
+        self.max_sentences = max_sentences
+
+    def should_stop(self, generated_ids, text):
+        return len(self.SENTENCE_END.findall(text)) >= self.max_sentences
+
+
+class RepeatedPhrase(StoppingCriterion):
+    """Stop when the same word n-gram keeps coming back, a sign the model is looping"""
+
+    reason = "repetition"
+
+    def __init__(self, phrase_words=4, max_repeats=2):
+        self.phrase_words = phrase_words
+        self.max_repeats = max_repeats
+        self.reset()
+
+    def reset(self):
+        self.counts = Counter()
+        self.counted_words = 0
+
+    def should_stop(self, generated_ids, text):
+        # The last word may still be growing, so only count completed ones
+        words = text.lower().split()[:-1]
+        stop = False
+        for end in range(max(self.counted_words + 1, self.phrase_words), len(words) + 1):
+            phrase = tuple(words[end - self.phrase_words:end])
+            self.counts[phrase] += 1
+            if self.counts[phrase] > self.max_repeats:
+                stop = True
+        self.counted_words = max(self.counted_words, len(words))
+        return stop
+
+
+# Ways a generation ends that are not an early stop by one of the criteria
+NATURAL_ENDS = ("eos", "max_length", "cancelled")
+
+
+class StoppingStats:
+    """Process-wide counters of how much decoding the stopping criteria saved"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.stopped_early = 0
+        self.tokens_generated = 0
+        self.tokens_saved = 0
+        self.reasons = Counter()
+
+    def record(self, generated, saved, reason):
+        with self.lock:
+            self.requests += 1
+            self.tokens_generated += generated
+            self.reasons[reason] += 1
+            if reason not in NATURAL_ENDS:
+                self.stopped_early += 1
+                self.tokens_saved += saved
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'stopped_early': self.stopped_early,
+                'tokens_generated': self.tokens_generated,
+                'tokens_saved': self.tokens_saved,
+                'reasons': dict(self.reasons)
+            }
+
+
+stopping_stats = StoppingStats()
+
+
+class StoppingCriteria:
+    """Ordered set of criteria checked after every generated token of one request
+
+    Keeps the decoded answer text up to date incrementally so text-based rules
+    don't re-decode the whole sequence each step. ``budget`` is the number of
+    tokens the fixed max_length would have allowed, used for the tokens-saved
+    metric.
+    """
+
+    def __init__(self, tokenizer, criteria, budget=None, eos_token_id=None):
+        self.criteria = list(criteria)
+        self.decoder = StreamingTextDecoder(tokenizer)
+        self.budget = budget
+        self.eos_token_id = eos_token_id
+        self.generated_ids = []
+        self.text = ""
+        self.stop_reason = None
+        self.recorded = False
+        for criterion in self.criteria:
+            criterion.reset()
+
+    def check(self, token_id):
+        """Feed one new token; return the stop reason or None to keep going"""
+        self.generated_ids.append(token_id)
+        self.text += self.decoder.push(token_id)
+
+        if token_id == self.eos_token_id:
+            self.stop_reason = "eos"
+            return self.stop_reason
+
+        for criterion in self.criteria:
+            if criterion.should_stop(self.generated_ids, self.text):
+                self.stop_reason = criterion.reason
+                return self.stop_reason
+        return None
+
+    def trim(self, text):
+        for criterion in self.criteria:
+            if criterion.reason == self.stop_reason:
+                return criterion.trim(text).strip()
+        return text.strip()
+
+    def tokens_saved(self):
+        """Tokens the fixed max_length would still have spent when a criterion fired"""
+        if self.stop_reason in (None,) + NATURAL_ENDS or self.budget is None:
+            return 0
+        return max(self.budget - len(self.generated_ids), 0)
+
+    def finish(self):
+        """Record this request in the global stats (once)"""
+        if self.recorded:
+            return
+        self.recorded = True
+        stopping_stats.record(len(self.generated_ids), self.tokens_saved(), self.stop_reason or "max_length")
+
+    def as_hf_stopping_criteria(self):
+        """Wrap for ``model.generate(stopping_criteria=...)`` (single sequence)"""
+        from transformers import StoppingCriteria as HFStoppingCriteria, StoppingCriteriaList
+
+        criteria = self
+
+        class _Adapter(HFStoppingCriteria):
+            # generate() calls this once per step, after the new token is appended
+            def __call__(self, input_ids, scores, **kwargs):
+                return criteria.check(int(input_ids[0, -1])) is not None
+
+        return StoppingCriteriaList([_Adapter()])
+
+
+def default_stopping_criteria(tokenizer, max_new_tokens=None, budget=None, marker="###",
+                              max_sentences=6, eos_token_id=None):
+    """Criteria used by the chat paths: template marker, sentence cap, loop detection, token budget"""
+    criteria = [StopOnMarker(marker), SentenceLimit(max_sentences), RepeatedPhrase()]
+    if max_new_tokens:
+        criteria.append(MaxNewTokens(max_new_tokens))
+    return StoppingCriteria(tokenizer, criteria, budget=budget, eos_token_id=eos_token_id)
@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+import torch
+from transformers import GPT2Tokenizer
+
+try:
+    from transformers import GPT2TokenizerFast
+except ImportError:
+    GPT2TokenizerFast = None
+
+# Whole prompts memoized per tokenizer; questions repeat a lot (FAQ-style traffic)
+DEFAULT_ENCODE_CACHE_SIZE = 4096
+# Per-word BPE results kept by the pure-Python tokenizer (unbounded in transformers)
+DEFAULT_WORD_CACHE_SIZE = 50000
+
+
+class LRUCache:
+    """Bounded mapping that drops the least recently used entry"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        self.data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.data else default
+
+    def clear(self):
+        self.data.clear()
+
+
+class CachedTokenizer:
+    """GPT-2 tokenizer wrapper shared by the web app, the GUI and the specialist
+
+    ``encode`` memoizes whole texts in an LRU, so a repeated question costs a
+    dictionary lookup instead of BPE over the full templated prompt. With the
+    pure-Python tokenizer the per-word BPE cache is swapped for a bounded LRU
+    and encodes are serialized (the slow path holds the GIL anyway). Any other
+    attribute or call is passed through, so it can be used wherever a
+    transformers tokenizer is expected.
+    """
+
+    _own_attributes = ('tokenizer', 'encode_cache', 'lock', 'hits', 'misses')
+
+    def __init__(self, tokenizer, cache_size=DEFAULT_ENCODE_CACHE_SIZE, word_cache_size=DEFAULT_WORD_CACHE_SIZE):
+        self.__dict__['tokenizer'] = tokenizer
+        self.__dict__['encode_cache'] = LRUCache(cache_size)
+        self.__dict__['lock'] = threading.Lock()
+        self.__dict__['hits'] = 0
+        self.__dict__['misses'] = 0
+        if not self.is_fast and isinstance(getattr(tokenizer, 'cache', None), dict):
+            tokenizer.cache = LRUCache(word_cache_size)
+
+    def __getattr__(self, name):
+        return getattr(self.tokenizer, name)
+
+    def __setattr__(self, name, value):
+        if name in self._own_attributes:
+            self.__dict__[name] = value
+        else:
+            setattr(self.tokenizer, name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self.tokenizer(*args, **kwargs)
+
+    def __len__(self):
+        return len(self.tokenizer)
+
+    @property
+    def is_fast(self):
+        return getattr(self.tokenizer, 'is_fast', False)
+
+    def _lookup(self, text):
+        with self.lock:
+            ids = self.encode_cache.get(text)
+            if ids is not None:
+                self.__dict__['hits'] += 1
+            return ids
+
+    def _store(self, text, ids):
+        with self.lock:
+            self.__dict__['misses'] += 1
+            self.encode_cache[text] = ids
+
+    def _encode_uncached(self, text):
+        if self.is_fast:
+            return tuple(self.tokenizer.encode(text))
+        with self.lock:
+            return tuple(self.tokenizer.encode(text))
+
+    def encode(self, text, return_tensors=None, **kwargs):
+        """Token ids for text, served from the LRU when it was seen before"""
+        if kwargs or not isinstance(text, str):
+            return self.tokenizer.encode(text, return_tensors=return_tensors, **kwargs)
+
+        ids = self._lookup(text)
+        if ids is None:
+            ids = self._encode_uncached(text)
+            self._store(text, ids)
+
+        if return_tensors == "pt":
+            return torch.tensor([ids], dtype=torch.long)
+        return list(ids)
+
+    def encode_batch(self, texts):
+        """Token id lists for many texts; misses go through the fast tokenizer in one call"""
+        results = [self._lookup(text) for text in texts]
+        missing = [i for i, ids in enumerate(results) if ids is None]
+        if missing:
+            if self.is_fast:
+                encoded = self.tokenizer([texts[i] for i in missing])['input_ids']
+            else:
+                encoded = [self._encode_uncached(texts[i]) for i in missing]
+            for i, ids in zip(missing, encoded):
+                results[i] = tuple(ids)
+                self._store(texts[i], results[i])
+        return [list(ids) for ids in results]
+
+    def cache_info(self):
+        with self.lock:
+            word_cache = getattr(self.tokenizer, 'cache', None)
+            return {
+                'fast': self.is_fast,
+                'entries': len(self.encode_cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'word_cache_entries': len(word_cache) if isinstance(word_cache, (dict, LRUCache)) else None
+            }
+
+
+def load_tokenizer(path, padding_side='right', fast=True, cache_size=DEFAULT_ENCODE_CACHE_SIZE):
+    """Load a GPT-2 tokenizer (Rust-backed when the tokenizers package allows) behind the LRU cache"""
+    tokenizer = None
+    if fast and GPT2TokenizerFast is not None:
+        try:
+            tokenizer = GPT2TokenizerFast.from_pretrained(path, padding_side=padding_side)
+        except Exception as e:
+            print(f"Fast tokenizer unavailable ({e}), using the Python tokenizer")
+    if tokenizer is None:
+        tokenizer = GPT2Tokenizer.from_pretrained(path, padding_side=padding_side)
+    return CachedTokenizer(tokenizer, cache_size=cache_size)
+
+
+def pad_batch(token_lists, pad_token_id, padding_side='left', device=None):
+    """Stack token id lists into input_ids/attention_mask tensors (left padding for generation)"""
+    longest = max(len(ids) for ids in token_lists)
+    input_ids = torch.full((len(token_lists), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(token_lists), longest), dtype=torch.long)
+    for row, ids in enumerate(token_lists):
+        if not ids:
+            continue
+        if padding_side == 'left':
+            input_ids[row, longest - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, longest - len(ids):] = 1
+        else:
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+    if device is not None:
+        input_ids = input_ids.to(device)
+        attention_mask = attention_mask.to(device)
+    return input_ids, attention_mask
@@ -2,24 +2,57 @@
 
 import os
 import json
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+from knowledge_index import BM25Index
+from kb_snapshot import SnapshotFacts, VERIFIED_SYSTEM_SOURCE, default_snapshot
 
 class VerifiedMedicalKnowledgeSystem:
+    # A ranked fact is only returned when the question covers this share of its key's terms
+    MIN_KEY_COVERAGE = 0.6
+
     def __init__(self):
         self.medical_knowledge = {}
+        self.index = None
+        self.vector_index = None
         self.initialize_verified_knowledge()
         
     def initialize_verified_knowledge(self):
         """Initialize with empty knowledge base - to be populated with verified sources"""
         self.medical_knowledge = {}
+        self.index = None
+
+    @staticmethod
+    def _index_text(answer) -> str:
+        return answer if isinstance(answer, str) else json.dumps(answer)
+
+    def _store(self, key: str, answer):
+        self.medical_knowledge[key] = answer
+        if self.index is not None:
+            self.index.add(key, self._index_text(answer))
+
+    def _ranking_index(self) -> BM25Index:
+        # Built on the first ranked lookup, so loading a snapshot reads no answer text up front
+        if self.index is None:
+            index = BM25Index()
+            for key, answer in self.medical_knowledge.items():
+                index.add(key, self._index_text(answer))
+            self.index = index
+        return self.index
+        
+    def attach_vector_index(self, vector_index):
+        """Also insert facts from every later load_verified_knowledge call into an ANN index (ann_index.IVFIndex)"""
+        self.vector_index = vector_index
         
     def load_verified_knowledge(self, file_path: str):
         """Load knowledge from a verified source file"""
+        new_facts = []
         try:
             if file_path.endswith('.json'):
                 with open(file_path, 'r', encoding='utf-8') as f:
                     verified_data = json.load(f)
-                    self.medical_knowledge.update(verified_data)
+                for key, answer in verified_data.items():
+                    self._store(key, answer)
+                    new_facts.append((key, answer))
             elif file_path.endswith('.txt'):
                 # Load from text file with question|answer format
                 with open(file_path, 'r', encoding='utf-8') as f:
@@ -27,15 +60,28 @@ class VerifiedMedicalKnowledgeSystem:
                         if '|' in line:
                             parts = line.strip().split('|', 1)
                             if len(parts) == 2:
-                                self.medical_knowledge[parts[0].lower()] = parts[1]
+                                self._store(parts[0].lower(), parts[1])
+                                new_facts.append((parts[0].lower(), parts[1]))
             print(f"Loaded verified knowledge from {file_path}")
+            if self.vector_index is not None:
+                source = os.path.basename(file_path)
+                added = self.vector_index.add_documents(
+                    [(key, answer, source) for key, answer in new_facts if isinstance(answer, str)]
+                )
+                print(f"Indexed {added} new or changed facts for similarity search")
         except Exception as e:
             print(f"Error loading verified knowledge: {e}")
     
     def add_verified_fact(self, question: str, answer: str, source: str):
         """Add a single verified fact with source attribution"""
         verified_answer = f"{answer}\n\n[Source: {source}]"
-        self.medical_knowledge[question.lower()] = verified_answer
+        self._store(question.lower(), verified_answer)
+    
+    def search(self, question: str, k: int = 5) -> List[Tuple[str, float, str]]:
+        """Top-k (key, BM25 score, answer) facts for a question, best first"""
+        return [(key, score, self.medical_knowledge[key])
+                for key, score, coverage in self._ranking_index().search(question, k)
+                if coverage >= self.MIN_KEY_COVERAGE]
     
     def get_response(self, question: str) -> Optional[str]:
         """Get a response from verified knowledge base"""
@@ -45,17 +91,26 @@ class VerifiedMedicalKnowledgeSystem:
         if question_lower in self.medical_knowledge:
             return self.medical_knowledge[question_lower]
         
-        # Partial match
-        for key, value in self.medical_knowledge.items():
-            if key in question_lower:
-                return value
+        # Best ranked match
+        results = self.search(question_lower)
+        if results:
+            return results[0][2]
         
         return None
 
 # Create a pre-configured heart attack knowledge system with verified sources
 class VerifiedHeartAttackKnowledgeSystem(VerifiedMedicalKnowledgeSystem):
-    def __init__(self):
+    def __init__(self, snapshot=None):
+        """Facts come from the compiled knowledge snapshot (kb_snapshot.py); snapshot=False runs the code below"""
         super().__init__()
+        if snapshot is not False:
+            try:
+                facts = SnapshotFacts(snapshot or default_snapshot(), VERIFIED_SYSTEM_SOURCE)
+                if len(facts.fact_numbers):
+                    self.medical_knowledge = facts
+                    return
+            except Exception as e:
+                print(f"Knowledge snapshot unavailable ({e}), building facts in code")
         self.initialize_heart_attack_knowledge()
         self.initialize_who_cardiovascular_knowledge()
         self.initialize_mayo_clinic_knowledge()
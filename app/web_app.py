@@ -1,11 +1,27 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, Response, stream_with_context
 import json
+import time
 from datetime import datetime
 import os
 import sys
-import torch
-from transformers import GPT2Tokenizer, GPT2LMHeadModel
+import gc
+import hmac
+import multiprocessing as mp
+import threading
+from transformers import GPT2LMHeadModel
 import numpy as np
+from generation import StreamingTextDecoder, PrefixCache
+from inference_engine import ContinuousBatchingEngine, DeadlineExceeded
+from batch_inference import batch_generate
+from tokenization import load_tokenizer
+from compiled_model import compile_model
+from knowledge_manager import KnowledgeBaseManager
+from model_manager import ModelManager
+from precision import apply_precision
+from stopping import default_stopping_criteria, stopping_stats
+from speculative import PromptLookup, knowledge_base_texts
+from inference_pool import InferenceProcessPool
+from scheduler import AdmissionController
 
 
 app = Flask(__name__)
@@ -32,49 +48,293 @@ MEDICAL_KNOWLEDGE = {
 model = None
 tokenizer = None
 model_loaded = False
+inference_engine = None
+scheduler = None
+# Registry plus the converted-artifact cache (ONNX exports, int8 weights, safetensors conversions)
+model_manager = ModelManager()
+current_model_name = "Heart-Specific Model"
+# Knowledge segments and dense index, republished in the background when a source changes
+knowledge_manager = KnowledgeBaseManager()
+
+# Admin hot swap: the replacement loads and warms up while the current model keeps serving
+swap_state = {'state': 'idle', 'model': None, 'stage': None, 'progress': None, 'started_at': None, 'finished_at': None,
+              'error': None, 'drained': None}
+swap_lock = threading.Lock()
+swap_thread = None
+
+# Background loading progress reported by /api/status; requests use the knowledge base until ready
+loading_state = {'state': 'pending', 'stage': None, 'progress': 0.0, 'started_at': None, 'ready_at': None, 'error': None}
+loading_lock = threading.Lock()
+loader_thread = None
+
+# Concurrency settings for the batching engine
+MAX_BATCH_SIZE = int(os.environ.get('MEDAI_MAX_BATCH_SIZE', 8))
+MAX_LENGTH = 200
+# Prompt-lookup speculative decoding drafted from the knowledge base texts
+SPECULATIVE_DECODING = os.environ.get('MEDAI_SPECULATIVE', '1') != '0'
+# Inference worker processes sharing the weights (0 = run the engine in this process)
+INFERENCE_WORKERS = int(os.environ.get('MEDAI_WORKERS', 0))
+THREADS_PER_WORKER = int(os.environ.get('MEDAI_THREADS_PER_WORKER', 0)) or None
+# Latency budget per chat request; past it the knowledge base answers instead
+DEADLINE_SECONDS = float(os.environ.get('MEDAI_DEADLINE_SECONDS', 10))
+# Longest a web request waits on a generation it was admitted for (per token when streaming)
+GENERATION_TIMEOUT_SECONDS = float(os.environ.get('MEDAI_GENERATION_TIMEOUT_SECONDS', 60))
+
+# Bucketed compiled forward pass: off, trace (TorchScript) or compile (torch.compile)
+COMPILE_MODE = os.environ.get('MEDAI_COMPILE', 'off')
+# Load the model in a background thread so the server accepts requests right away
+BACKGROUND_LOADING = os.environ.get('MEDAI_BACKGROUND_LOAD', '1') != '0'
+# Longest wait for the previous model's in-flight generations after a swap
+SWAP_DRAIN_SECONDS = float(os.environ.get('MEDAI_SWAP_DRAIN_SECONDS', 120))
+# Required in X-Admin-Token for /api/admin/*; when unset the admin API is disabled (403 for every caller)
+ADMIN_TOKEN = os.environ.get('MEDAI_ADMIN_TOKEN')
+# Cosine score and question-term coverage at which a retrieved fact answers without generating
+RETRIEVAL_MIN_SCORE = float(os.environ.get('MEDAI_RETRIEVAL_MIN_SCORE', 0.35))
+RETRIEVAL_MIN_COVERAGE = float(os.environ.get('MEDAI_RETRIEVAL_MIN_COVERAGE', 0.6))
+WARMUP_QUESTION = "What are the warning signs of a heart attack?"
+WARMUP_TOKENS = 8
+
+# Fixed scaffold every prompt starts with; its KV cache is computed once at load time
+PROMPT_PREFIX = "### Medical Question:\n"
+
+def create_inference_engine(engine_model, engine_tokenizer):
+    """Build and start a continuous batching engine (or worker pool) for one model"""
+    if INFERENCE_WORKERS > 0 and getattr(engine_model, 'backend', 'torch') == 'torch':
+        engine = InferenceProcessPool(
+            engine_model,
+            engine_tokenizer,
+            workers=INFERENCE_WORKERS,
+            threads_per_worker=THREADS_PER_WORKER,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_length=MAX_LENGTH,
+            prefix=PROMPT_PREFIX,
+            speculative_texts=speculative_texts() if SPECULATIVE_DECODING else None
+        )
+        engine.start()
+        print(f"Inference pool started ({INFERENCE_WORKERS} workers, "
+              f"{engine.threads_per_worker} threads each)")
+    else:
+        prefix_cache = PrefixCache(engine_model, engine_tokenizer, PROMPT_PREFIX)
+        speculative = PromptLookup(engine_tokenizer, speculative_texts()) if SPECULATIVE_DECODING else None
+        engine = ContinuousBatchingEngine(
+            engine_model, max_batch_size=MAX_BATCH_SIZE, max_length=MAX_LENGTH, prefix_cache=prefix_cache,
+            speculative=speculative
+        )
+        engine.start()
+        print(f"Inference engine started (max batch size {MAX_BATCH_SIZE}, speculative {'on' if speculative else 'off'})")
+    return engine
+
+def start_inference_engine():
+    """Start the engine that serves all model generations for the current model"""
+    global inference_engine, scheduler
+    if inference_engine:
+        inference_engine.stop()
+    inference_engine = create_inference_engine(model, tokenizer)
+    scheduler = AdmissionController(inference_engine, DEADLINE_SECONDS)
+
+def speculative_texts():
+    """Draft sources: the verified KB, the keyword KB and the fallback answers below"""
+    texts = knowledge_base_texts()
+    for info in MEDICAL_KNOWLEDGE.values():
+        texts.extend(info.values())
+    return texts
+
+def get_model_precision():
+    """Precision mode from MEDAI_PRECISION, else the registry entry for the heart model"""
+    return os.environ.get('MEDAI_PRECISION') or model_manager.get_model_precision("Heart-Specific Model")
+
+def get_model_backend(model_path):
+    """Backend from MEDAI_BACKEND, else the registry entry; torch when onnxruntime is missing"""
+    return model_manager.get_model_backend("Heart-Specific Model", model_path, backend=os.environ.get('MEDAI_BACKEND'))
+
+def set_loading_stage(stage, progress, state='loading'):
+    with loading_lock:
+        loading_state.update(state=state, stage=stage, progress=progress)
+
+def loading_status():
+    """Loading state/stage/progress for /api/status"""
+    with loading_lock:
+        status = dict(loading_state)
+    if status['started_at']:
+        end = status['ready_at'] or time.time()
+        status['elapsed_s'] = round(end - status['started_at'], 2)
+    return status
 
 def load_medical_model():
-    global model, tokenizer, model_loaded
+    global model, tokenizer
     
     print("Loading heart-specialized model...")
     model_path = "models/heart_attack_specialized_complete/model/"
+    precision = get_model_precision()
     
     try:
         # Load tokenizer
-        tokenizer = GPT2Tokenizer.from_pretrained(model_path)
-        print("Tokenizer loaded successfully")
+        set_loading_stage('tokenizer', 0.1)
+        tokenizer = load_tokenizer(model_path)
+        print(f"Tokenizer loaded successfully ({'fast' if tokenizer.is_fast else 'python'})")
         
-        # Check which model file to use
-        bin_path = os.path.join(model_path, "pytorch_model.bin")
-        safetensors_path = os.path.join(model_path, "model.safetensors")
-        
-        if os.path.exists(bin_path):
-            print("Using pytorch_model.bin file...")
-            model = GPT2LMHeadModel.from_pretrained(model_path)
-        elif os.path.exists(safetensors_path):
-            print("Using model.safetensors file...")
+        if get_model_backend(model_path) == "onnx":
+            print("Using ONNX Runtime backend...")
+            set_loading_stage('weights', 0.3)
             try:
-                model = GPT2LMHeadModel.from_pretrained(model_path, use_safetensors=True)
-            except:
-                print("Safetensors corrupted, using base model...")
-                model = GPT2LMHeadModel.from_pretrained("gpt2")
-        else:
+                # Exported into the artifact cache on the first start after a deploy
+                model = model_manager.load_onnx_model(model_path)
+                set_loading_stage('engine', 0.7)
+                start_inference_engine()
+                print("✅ ONNX model loaded successfully!")
+                return
+            except Exception as e:
+                print(f"⚠️ ONNX backend unavailable ({e}), using torch")
+        
+        # Memory-mapped safetensors (or cached conversions of the .bin / int8 weights)
+        set_loading_stage('weights', 0.3)
+        model = model_manager.load_torch_model(model_path, precision)
+        if model is None:
             print("No model files found, downloading base model...")
             model = GPT2LMHeadModel.from_pretrained("gpt2")
             model.save_pretrained(model_path)
+            model = apply_precision(model, precision)
         
-        model.eval()
-        model_loaded = True
-        print("✅ Model loaded successfully!")
+        model = compile_model(model, COMPILE_MODE)
+        set_loading_stage('engine', 0.7)
+        start_inference_engine()
+        print(f"✅ Model loaded successfully! ({precision})")
         
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         print("⚠️ Falling back to base GPT-2 model...")
-        tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+        set_loading_stage('fallback', 0.3)
+        tokenizer = load_tokenizer("gpt2")
         model = GPT2LMHeadModel.from_pretrained("gpt2")
-        model.eval()
+        model = apply_precision(model, precision)
+        set_loading_stage('engine', 0.7)
+        start_inference_engine()
+
+def warm_up_model(warm_model, warm_tokenizer, engine, on_stage=set_loading_stage):
+    """Run one short generation so the first user request doesn't pay for lazy init and cold pages"""
+    if hasattr(warm_model, 'warm_up'):
+        # Build the shape-bucket graphs now rather than on the first requests
+        on_stage('compile', 0.75)
+        warm_model.warm_up(MAX_BATCH_SIZE, MAX_LENGTH, prefix_length=len(warm_tokenizer.encode(PROMPT_PREFIX)))
+    on_stage('warm-up', 0.85)
+    start_time = time.time()
+    inputs = warm_tokenizer.encode(build_prompt(WARMUP_QUESTION))
+    engine.generate(
+        inputs,
+        max_length=min(len(inputs) + WARMUP_TOKENS, MAX_LENGTH),
+        do_sample=False,
+        eos_token_id=warm_tokenizer.eos_token_id
+    )
+    print(f"Model warm-up done in {time.time() - start_time:.2f}s")
+
+def load_and_warm_up():
+    """Load, warm up, then switch chat routing from the knowledge base to the model"""
+    global model_loaded
+    with loading_lock:
+        loading_state.update(state='loading', started_at=time.time(), ready_at=None, error=None)
+    try:
+        load_medical_model()
+        try:
+            warm_up_model(model, tokenizer, inference_engine)
+        except Exception as e:
+            print(f"⚠️ Warm-up failed ({e}), serving without it")
+        model_loaded = True
+        with loading_lock:
+            loading_state.update(state='ready', stage='ready', progress=1.0, ready_at=time.time())
+        print("✅ Model ready, chat requests now use the model")
+    except Exception as e:
+        print(f"❌ Model unavailable, answering from the knowledge base: {e}")
+        with loading_lock:
+            loading_state.update(state='failed', error=str(e), ready_at=time.time())
+
+def start_background_loading():
+    """Start loading the model without blocking the server (no-op if already started)"""
+    global loader_thread
+    if loader_thread is not None:
+        return loader_thread
+    loader_thread = threading.Thread(target=load_and_warm_up, name="model-loader", daemon=True)
+    loader_thread.start()
+    return loader_thread
+
+def build_model(model_path, precision, backend):
+    """Load a model version without touching the one currently serving"""
+    new_tokenizer = load_tokenizer(model_path)
+    if backend == "onnx":
+        return model_manager.load_onnx_model(model_path), new_tokenizer
+    new_model = model_manager.load_torch_model(model_path, precision)
+    if new_model is None:
+        raise FileNotFoundError(f"No model weights in {model_path}")
+    return compile_model(new_model, COMPILE_MODE), new_tokenizer
+
+def set_swap_stage(stage, progress=None):
+    with swap_lock:
+        swap_state.update(stage=stage, progress=progress)
+
+def swap_status():
+    with swap_lock:
+        return dict(swap_state)
+
+def swap_model(model_name):
+    """Load, warm up and switch to a registry model, then drain and release the old one
+    
+    Requests that already hold a GenerationRequest finish on the old engine;
+    everything submitted after the switch goes to the new one. Registered
+    models share the GPT-2 vocabulary, so a request that encoded its prompt
+    just before the switch is still valid on the new model.
+    """
+    global model, tokenizer, inference_engine, scheduler, current_model_name, model_loaded
+    try:
+        set_swap_stage('weights')
+        model_path = model_manager.get_model_path(model_name)
+        precision = model_manager.get_model_precision(model_name)
+        backend = model_manager.get_model_backend(model_name, model_path)
+        new_model, new_tokenizer = build_model(model_path, precision, backend)
+        
+        set_swap_stage('engine')
+        new_engine = create_inference_engine(new_model, new_tokenizer)
+        try:
+            warm_up_model(new_model, new_tokenizer, new_engine, on_stage=set_swap_stage)
+        except Exception:
+            new_engine.stop()
+            raise
+        
+        # The switch itself: plain reference assignments, so no request sees a half-swapped state
+        old_engine = inference_engine
+        model, tokenizer, inference_engine = new_model, new_tokenizer, new_engine
+        if scheduler is None:
+            scheduler = AdmissionController(new_engine, DEADLINE_SECONDS)
+        else:
+            scheduler.engine = new_engine
+        current_model_name = model_name
         model_loaded = True
+        print(f"🔁 Now serving {model_name} ({backend}, {precision})")
+        
+        set_swap_stage('draining')
+        drained = old_engine.drain(SWAP_DRAIN_SECONDS) if old_engine else True
+        if not drained:
+            print(f"⚠️ Previous model still had requests after {SWAP_DRAIN_SECONDS:.0f}s; they were cut off")
+        del old_engine
+        gc.collect()
         
+        with swap_lock:
+            swap_state.update(state='done', stage=None, progress=1.0, drained=drained, finished_at=time.time())
+    except Exception as e:
+        print(f"❌ Model swap to {model_name} failed, keeping the current model: {e}")
+        with swap_lock:
+            swap_state.update(state='failed', error=str(e), finished_at=time.time())
+
+def start_model_swap(model_name):
+    """Start a background swap; returns False when one is already running"""
+    global swap_thread
+    with swap_lock:
+        if swap_state['state'] == 'running':
+            return False
+        swap_state.update(state='running', model=model_name, stage='queued', started_at=time.time(),
+                          finished_at=None, error=None, drained=None)
+    swap_thread = threading.Thread(target=swap_model, args=(model_name,), name="model-swap", daemon=True)
+    swap_thread.start()
+    return True
+
 def fix_json_files(model_path):
     """Check and fix corrupted JSON files in model directory"""
     json_files = ['special_tokens_map.json', 'tokenizer_config.json', 'config.json']
@@ -124,35 +384,107 @@ def recreate_json_file(file_path, json_file):
             json.dump(default_content[json_file], f, indent=2)
         print(f"Recreated {json_file}")
 
-def generate_medical_response(message):
+def build_prompt(message):
+    """Wrap a user question in the template the model was fine-tuned on"""
+    return f"{PROMPT_PREFIX}{message}\n\n### Answer:\n"
+
+def build_stopping_criteria(inputs, max_new_tokens=None):
+    """Stop at the next ### section, after a few sentences, on loops or at the request's token budget"""
+    return default_stopping_criteria(
+        tokenizer,
+        max_new_tokens=max_new_tokens,
+        budget=MAX_LENGTH - len(inputs),
+        eos_token_id=tokenizer.eos_token_id
+    )
+
+def parse_max_new_tokens(data):
+    """Optional per-request 'max_new_tokens' from the JSON body"""
+    try:
+        value = int(data.get('max_new_tokens') or 0)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+def parse_deadline(data):
+    """Optional per-request 'deadline_ms' from the JSON body, in seconds"""
+    try:
+        value = float(data.get('deadline_ms') or 0)
+    except (TypeError, ValueError):
+        return None
+    return value / 1000 if value > 0 else None
+
+def parse_batch_size(data):
+    """'batch_size' from the JSON body clamped to MAX_BATCH_SIZE, or None when it is not a positive integer"""
+    value = data.get('batch_size', MAX_BATCH_SIZE)
+    if isinstance(value, bool):
+        return None
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    if size < 1 or size != value and not isinstance(value, str):
+        return None
+    return min(size, MAX_BATCH_SIZE)
+
+def submit_generation(message, inputs, stopping, deadline_seconds=None):
+    """Queue a chat generation through the admission controller; None when it was shed"""
+    generation = scheduler.submit(
+        inputs,
+        message,
+        deadline_seconds,
+        max_length=MAX_LENGTH,
+        temperature=0.7,
+        eos_token_id=tokenizer.eos_token_id,
+        repetition_penalty=1.2,
+        stopping=stopping
+    )
+    if generation is None:
+        print("Projected wait exceeds the deadline, answering from the knowledge base")
+    return generation
+
+def retrieve_answer(message, min_score=RETRIEVAL_MIN_SCORE, min_coverage=RETRIEVAL_MIN_COVERAGE):
+    """Best fact from the dense knowledge index that scores at least min_score and covers the question, else None"""
+    try:
+        return knowledge_manager.current_view().dense.answer(message, min_score, min_coverage)
+    except Exception as e:
+        print(f"Knowledge retrieval error: {e}")
+        return None
+
+def generate_medical_response(message, max_new_tokens=None, deadline_seconds=None):
     """Generate response using model first, knowledge base as fallback"""
+    # Questions with a close match in the knowledge bases skip generation
+    kb_answer = retrieve_answer(message)
+    if kb_answer:
+        return kb_answer, "knowledge_base"
+    
     # Try to use the AI model first
     if model_loaded:
+        generation = None
         try:
             # Prepare input
-            input_text = f"### Medical Question:\n{message}\n\n### Answer:\n"
-            inputs = tokenizer.encode(input_text, return_tensors="pt")
-            
-            # Generate response
-            with torch.no_grad():
-                outputs = model.generate(
-                    inputs,
-                    max_length=200,
-                    num_return_sequences=1,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=tokenizer.eos_token_id,
-                    repetition_penalty=1.2
-                )
-            
-            # Decode and clean up response
-            response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = response.split("### Answer:")[-1].strip()
+            input_text = build_prompt(message)
+            inputs = tokenizer.encode(input_text)
+            stopping = build_stopping_criteria(inputs, max_new_tokens)
             
-            # Validate response
-            if response and len(response) > 10:
-                return response, "model"
+            # Generate response (batched with other in-flight requests)
+            generation = submit_generation(message, inputs, stopping, deadline_seconds)
+            if generation is not None:
+                outputs = generation.wait(GENERATION_TIMEOUT_SECONDS)
+                
+                # Decode and clean up response
+                response = tokenizer.decode(inputs + outputs, skip_special_tokens=True)
+                response = stopping.trim(response.split("### Answer:")[-1])
                 
+                # Validate response
+                if response and len(response) > 10:
+                    return response, "model"
+                
+        except DeadlineExceeded:
+            scheduler.record_shed(generation)
+            print("Deadline passed while queued, answering from the knowledge base")
+        except TimeoutError as e:
+            generation.cancel()
+            print(f"{e}, answering from the knowledge base")
         except Exception as e:
             print(f"Model generation error: {e}")
     
@@ -160,6 +492,85 @@ def generate_medical_response(message):
     kb_response = get_knowledge_based_response(message)
     return kb_response, "knowledge_base"
 
+def sse_event(payload, event=None):
+    """Format a payload as a server-sent event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(payload)}\n\n"
+
+def stream_medical_response(message, max_new_tokens=None, deadline_seconds=None):
+    """Yield SSE frames with answer text as it is generated, then a final summary event"""
+    start_time = time.time()
+    first_token_time = None
+    token_count = 0
+    response = ""
+    response_source = "knowledge_base"
+    stopping = None
+
+    # Questions with a close match in the knowledge bases skip generation
+    kb_answer = retrieve_answer(message)
+    if kb_answer:
+        response = kb_answer
+    elif model_loaded:
+        generation = None
+        try:
+            input_text = build_prompt(message)
+            inputs = tokenizer.encode(input_text)
+            decoder = StreamingTextDecoder(tokenizer)
+            stopping = build_stopping_criteria(inputs, max_new_tokens)
+            started = False
+
+            generation = submit_generation(message, inputs, stopping, deadline_seconds)
+            if generation is not None:
+                try:
+                    for token in generation.iter_tokens(timeout=GENERATION_TIMEOUT_SECONDS):
+                        token_count += 1
+                        if first_token_time is None:
+                            first_token_time = time.time()
+
+                        delta = decoder.push(token)
+                        if not started:
+                            # Match the .strip() applied to non-streamed answers
+                            delta = delta.lstrip()
+                            started = bool(delta)
+                        if delta:
+                            yield sse_event({'token': delta})
+                finally:
+                    # Free the batch slot if the client went away mid-stream
+                    generation.cancel()
+
+                response = stopping.trim((input_text + decoder.text()).split("### Answer:")[-1])
+                if response and len(response) > 10:
+                    response_source = "model"
+
+        except DeadlineExceeded:
+            scheduler.record_shed(generation)
+            print("Deadline passed while queued, answering from the knowledge base")
+        except Exception as e:
+            print(f"Model streaming error: {e}")
+
+    if response_source != "model":
+        if not kb_answer:
+            response = get_knowledge_based_response(message)
+        if first_token_time is None:
+            first_token_time = time.time()
+
+    total_time = time.time() - start_time
+    save_chat_history(message, response, response_source)
+
+    yield sse_event({
+        'response': response,
+        'source': response_source,
+        'model_loaded': model_loaded,
+        'timing': {
+            'time_to_first_token_ms': round((first_token_time - start_time) * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+            'tokens': token_count,
+            'tokens_per_second': round(token_count / total_time, 2) if total_time > 0 else 0.0,
+            'stop_reason': stopping.stop_reason if stopping else None,
+            'tokens_saved': stopping.tokens_saved() if stopping else 0
+        }
+    }, event='done')
+
 def get_knowledge_based_response(message):
     """Get response from medical knowledge base"""
     message_lower = message.lower()
@@ -195,7 +606,9 @@ def chat():
             return jsonify({'error': 'Empty message'}), 400
         
         # Generate response (model first, then knowledge base)
-        response, response_source = generate_medical_response(message)
+        response, response_source = generate_medical_response(
+            message, parse_max_new_tokens(data), parse_deadline(data)
+        )
         
         # Save to chat history
         save_chat_history(message, response, response_source)
@@ -209,6 +622,75 @@ def chat():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json or {}
+    message = data.get('message', '').strip()
+
+    if not message:
+        return jsonify({'error': 'Empty message'}), 400
+
+    return Response(
+        stream_with_context(stream_medical_response(message, parse_max_new_tokens(data), parse_deadline(data))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of questions with padded batched generation, streamed back as JSON lines"""
+    data = request.json or {}
+    questions = [q.strip() for q in data.get('questions', []) if isinstance(q, str) and q.strip()]
+    batch_size = parse_batch_size(data)
+
+    if not questions:
+        return jsonify({'error': 'No questions provided'}), 400
+    if batch_size is None:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+    if not model_loaded:
+        return jsonify({'error': 'Model not loaded', 'loading': loading_status()}), 503
+
+    def results():
+        if not hasattr(model, 'generate'):
+            # Backends without HF generate (ONNX) answer through the batching engine
+            requests = []
+            for q in questions:
+                inputs = tokenizer.encode(build_prompt(q))
+                requests.append(scheduler.submit_to_engine(
+                    inputs,
+                    max_length=MAX_LENGTH,
+                    temperature=0.7,
+                    repetition_penalty=1.2,
+                    eos_token_id=tokenizer.eos_token_id,
+                    stopping=build_stopping_criteria(inputs)
+                ))
+            for i, (question, generation) in enumerate(zip(questions, requests)):
+                try:
+                    outputs = generation.wait(GENERATION_TIMEOUT_SECONDS)
+                except Exception as e:
+                    generation.cancel()
+                    yield json.dumps({'index': i, 'question': question, 'error': str(e)}) + "\n"
+                    continue
+                text = build_prompt(question) + tokenizer.decode(outputs, skip_special_tokens=True)
+                answer = generation.stopping.trim(text.split("### Answer:")[-1])
+                yield json.dumps({'index': i, 'question': question, 'answer': answer, 'source': 'model'}) + "\n"
+            return
+
+        records = ((i, {'question': q}) for i, q in enumerate(questions))
+        for result in batch_generate(
+            model,
+            tokenizer,
+            records,
+            template=build_prompt("{}"),
+            marker="### Answer:",
+            batch_size=batch_size,
+            max_length=MAX_LENGTH,
+            repetition_penalty=1.2
+        ):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     try:
@@ -217,12 +699,81 @@ def get_history():
     except:
         return jsonify({'history': []})
 
+def admin_authorized():
+    """X-Admin-Token matches MEDAI_ADMIN_TOKEN; without a token the admin routes are disabled"""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def admin_forbidden():
+    return jsonify({'error': 'Forbidden' if ADMIN_TOKEN else 'Admin API disabled: set MEDAI_ADMIN_TOKEN'}), 403
+
+@app.route('/api/admin/models', methods=['GET'])
+def admin_models():
+    """Registered models, the one serving and the state of the last swap"""
+    if not admin_authorized():
+        return admin_forbidden()
+    model_manager.load_model_registry()
+    return jsonify({
+        'current': current_model_name,
+        'models': {
+            name: {
+                'path': info.get('path'),
+                'precision': model_manager.get_model_precision(name),
+                'backend': info.get('backend'),
+                'version': info.get('version')
+            } for name, info in model_manager.available_models.items()
+        },
+        'swap': swap_status()
+    })
+
+@app.route('/api/admin/models/swap', methods=['POST'])
+def admin_swap_model():
+    """Load a registry model in the background and switch to it once it is warmed up"""
+    if not admin_authorized():
+        return admin_forbidden()
+    data = request.get_json(silent=True) or {}
+    model_name = data.get('model')
+    # Pick up entries (or new versions) added to model_registry.json since startup
+    model_manager.load_model_registry()
+    if model_name not in model_manager.available_models:
+        return jsonify({'error': f'Unknown model: {model_name}'}), 404
+    if loading_status()['state'] in ('pending', 'loading'):
+        return jsonify({'error': 'Initial model load still in progress'}), 409
+    if not start_model_swap(model_name):
+        return jsonify({'error': 'A model swap is already running', 'swap': swap_status()}), 409
+    return jsonify({'swap': swap_status()}), 202
+
+@app.route('/api/admin/knowledge/reload', methods=['POST'])
+def admin_reload_knowledge():
+    """Rebuild changed knowledge segments now instead of waiting for the next poll"""
+    if not admin_authorized():
+        return admin_forbidden()
+    data = request.get_json(silent=True) or {}
+    knowledge_manager.reload_in_background(force=bool(data.get('force')))
+    return jsonify({'knowledge': knowledge_manager.stats()}), 202
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    return jsonify({
+    return jsonify(status_payload())
+
+def status_payload():
+    """Model, loading, swap, engine, tokenizer, compile, artifact cache, knowledge, stopping and scheduler status shared by the Flask and ASGI servers"""
+    return {
         'model_loaded': model_loaded,
-        'model_type': 'Heart-Specialized DistilGPT2' if model_loaded else 'None'
-    })
+        'model_name': current_model_name,
+        'loading': loading_status(),
+        'swap': swap_status(),
+        'model_type': 'Heart-Specialized DistilGPT2' if model_loaded else 'None',
+        'backend': getattr(model, 'backend', 'torch') if model_loaded else None,
+        'engine': inference_engine.stats() if inference_engine else None,
+        'stopping': stopping_stats.as_dict(),
+        'tokenizer': tokenizer.cache_info() if hasattr(tokenizer, 'cache_info') else None,
+        'compiled': model.compile_stats() if hasattr(model, 'compile_stats') else None,
+        'artifacts': model_manager.artifacts.stats(),
+        'knowledge': knowledge_manager.stats(),
+        'scheduler': scheduler.stats() if scheduler else None
+    }
 
 def save_chat_history(question, answer, source):
     """Save chat history to file"""
@@ -263,9 +814,17 @@ def load_chat_history():
     return []
 
 # Add this right before the main block
-with app.app_context():
-    print("💡 Loading heart-specialized model...")
-    load_medical_model()
+# Inference pool workers are spawned and re-import the main script; only the server process starts up
+if mp.current_process().name == 'MainProcess':
+    with app.app_context():
+        # Knowledge sources are picked up on change without a restart
+        knowledge_manager.start_watching()
+        print("💡 Loading heart-specialized model...")
+        if BACKGROUND_LOADING:
+            # Knowledge-base answers until load_and_warm_up flips model_loaded
+            start_background_loading()
+        else:
+            load_and_warm_up()
 
 if __name__ == '__main__':
     print("🚀 Starting Medical AI Assistant Web Server...")
@@ -1,6 +1,69 @@
-import re
+from collections import deque
 from typing import Dict, List, Optional
 
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton that finds whole-word keyword matches in one pass
+
+    Matches follow the same rule as re.search(r'\b' + keyword + r'\b'):
+    there must be a word boundary on both sides of the keyword. Each keyword
+    carries a value (here the category priority), and every match yields it.
+    """
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[tuple]] = [[]]
+
+    def add(self, keyword: str, value):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(keyword), value))
+
+    def build(self):
+        """Compute failure links breadth-first; call once after adding keywords"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        return self
+
+    def matches(self, text: str):
+        """Yield the value of every whole-word keyword occurrence in text"""
+        state = 0
+        length = len(text)
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for size, value in self.output[state]:
+                start = end - size + 1
+                before = text[start - 1] if start > 0 else ' '
+                after = text[end + 1] if end + 1 < length else ' '
+                if (_is_word_char(before) != _is_word_char(text[start])
+                        and _is_word_char(after) != _is_word_char(char)):
+                    yield value
+
+
 class HeartAttackKnowledgeSystem:
     def __init__(self):
         # Comprehensive, pre-verified heart attack knowledge base
@@ -49,21 +112,39 @@ class HeartAttackKnowledgeSystem:
         }
         
         self.safety_disclaimer = "\n\n[Disclaimer: This is general medical information. For personal advice, consult a healthcare professional. In emergencies, call local emergency services immediately.]"
+        self.build_keyword_index()
+
+    def build_keyword_index(self):
+        """Compile every category's keywords into one automaton (rerun after editing medical_knowledge)"""
+        self.categories = list(self.medical_knowledge)
+        self.keyword_automaton = KeywordAutomaton()
+        for priority, category in enumerate(self.categories):
+            for keyword in self.medical_knowledge[category]["keywords"]:
+                self.keyword_automaton.add(keyword.lower(), priority)
+        self.keyword_automaton.build()
         
     def query_knowledge_base(self, user_input: str) -> Optional[str]:
         """Query the knowledge base for relevant heart attack information"""
         user_input = user_input.lower()
         
-        # Check each category in order of priority
-        for category, data in self.medical_knowledge.items():
-            for keyword in data["keywords"]:
-                if re.search(r'\b' + re.escape(keyword) + r'\b', user_input):
-                    return data["response"] + self.safety_disclaimer
+        # Single pass over the input; the earliest category with a keyword match wins
+        best = None
+        for priority in self.keyword_automaton.matches(user_input):
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
         
-        return None
+        if best is None:
+            return None
+        return self.medical_knowledge[self.categories[best]]["response"] + self.safety_disclaimer
+
+_default_system = None
 
 # Create a helper function for easy integration
 def get_heart_attack_response(user_query):
     """Get a response from the heart attack knowledge system"""
-    system = HeartAttackKnowledgeSystem()
-    return system.query_knowledge_base(user_query)
+    global _default_system
+    if _default_system is None:
+        _default_system = HeartAttackKnowledgeSystem()
+    return _default_system.query_knowledge_base(user_query)
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+# The app is a flat set of modules run from app/
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# Keep compiled snapshots and indexes out of knowledge_bases/index
+SCRATCH_DIR = tempfile.mkdtemp(prefix="medai-tests-")
+os.environ.setdefault("MEDAI_KB_INDEX_DIR", os.path.join(SCRATCH_DIR, "index"))
+os.environ.setdefault("MEDAI_KB_SNAPSHOT", os.path.join(SCRATCH_DIR, "index", "knowledge.kbsnap"))
+os.environ.setdefault("MEDAI_ANN_INDEX_DIR", os.path.join(SCRATCH_DIR, "ann"))
+
+import pytest
+
+
+class WordTokenizer:
+    """Whitespace tokenizer that grows its vocabulary on encode; stands in for GPT-2's where text matters"""
+
+    def __init__(self):
+        self.words = []
+        self.ids = {}
+
+    def encode(self, text):
+        token_ids = []
+        for word in text.split():
+            if word not in self.ids:
+                self.ids[word] = len(self.words)
+                self.words.append(word)
+            token_ids.append(self.ids[word])
+        return token_ids
+
+    def decode(self, token_ids, skip_special_tokens=False):
+        return " ".join(self.words[token_id] for token_id in token_ids)
+
+
+@pytest.fixture
+def word_tokenizer():
+    return WordTokenizer()
+
+
+@pytest.fixture(scope="session")
+def tiny_model():
+    """Randomly initialized two-layer GPT-2, small enough to decode in milliseconds"""
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(0)
+    # A wide init makes outputs depend sharply on every attended position
+    config = GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2, initializer_range=0.5)
+    return GPT2LMHeadModel(config).eval()
@@ -0,0 +1,106 @@
+import gc
+import os
+import threading
+from ann_index import IVFIndex
+
+
+def facts(start, count):
+    return [(f"condition {i} warning signs", f"Answer about condition {i}.", "test") for i in range(start, start + count)]
+
+
+def test_search_during_inserts_and_merges_sees_consistent_snapshots(tmp_path):
+    index = IVFIndex(str(tmp_path / "ann"), max_segments=2)
+    index.add_documents(facts(0, 200))
+    errors = []
+    done = threading.Event()
+
+    def insert():
+        try:
+            # Every few batches exceed max_segments and merge away the segments being searched
+            for batch in range(1, 40):
+                index.add_documents(facts(180 + batch * 20, 20))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    writer = threading.Thread(target=insert)
+    writer.start()
+    searches = 0
+    while not done.is_set() or not searches:
+        try:
+            for key, score, answer, source in index.search("condition 7 warning signs", k=5, nprobe=64):
+                assert answer == f"Answer about condition {key.split()[1]}."
+        except Exception as e:
+            errors.append(e)
+            break
+        searches += 1
+    writer.join()
+
+    assert not errors
+    assert len(index) == 200 + 39 * 20
+    assert index.search("condition 7 warning signs", k=1, nprobe=64)[0][0] == "condition 7 warning signs"
+    # Merged-away segments are deleted once no snapshot holds them
+    gc.collect()
+    live = {segment.name for segment in index.segments}
+    assert {name for name in os.listdir(index.directory) if name.startswith("segment-")} == live
+
+
+def test_snapshot_is_unchanged_by_later_inserts(tmp_path):
+    index = IVFIndex(str(tmp_path / "ann"), max_segments=1)
+    index.add_documents(facts(0, 50))
+    before = index.snapshot()
+    index.add_documents(facts(50, 50))
+    index.add_documents([("condition 3 warning signs", "Replaced answer.", "test")])
+
+    assert len(before) == 50
+    assert before.search("condition 3 warning signs", k=1, nprobe=64)[0][2] == "Answer about condition 3."
+    assert index.search("condition 3 warning signs", k=1, nprobe=64)[0][2] == "Replaced answer."
+
+
+def test_removed_facts_stay_removed_across_reopen_and_merge(tmp_path):
+    directory = str(tmp_path / "ann")
+    index = IVFIndex(directory, max_segments=1)
+    index.add_documents(facts(0, 50))
+    assert index.remove(["condition 3 warning signs", "not indexed"]) == 1
+    assert "condition 3 warning signs" not in [hit[0] for hit in index.search("condition 3 warning signs", k=5, nprobe=64)]
+
+    reopened = IVFIndex(directory, max_segments=1)
+    assert len(reopened) == 49
+    reopened.add_documents(facts(50, 10))
+    reopened.add_documents(facts(60, 10))
+    # The merge drops the removed rows for good
+    assert all(key != "condition 3 warning signs" for segment in reopened.segments for key, _, _ in segment.documents)
+    assert not reopened.removed
+
+    # Re-adding a removed key brings it back
+    reopened.add_documents(facts(3, 1))
+    assert reopened.search("condition 3 warning signs", k=1, nprobe=64)[0][0] == "condition 3 warning signs"
+
+
+def test_index_built_with_other_embedding_settings_is_discarded(tmp_path, monkeypatch):
+    import ann_index
+
+    directory = str(tmp_path / "ann")
+    IVFIndex(directory).add_documents(facts(0, 20))
+    monkeypatch.setattr(ann_index, "FEATURE_VERSION", ann_index.FEATURE_VERSION + 1)
+    index = IVFIndex(directory)
+    assert len(index) == 0
+    assert index.search("condition 3 warning signs") == []
+    assert index.add_documents(facts(0, 20)) == 20
+
+
+def test_rebuild_retrains_once_the_corpus_drifts(tmp_path):
+    index = IVFIndex(str(tmp_path / "ann"))
+    index.add_documents(facts(0, 20))
+    assert not index.needs_retraining(35)
+    assert index.needs_retraining(50)
+    assert index.needs_retraining(5)
+
+    before = index.snapshot()
+    index.rebuild(facts(100, 50))
+    assert index.idf_documents == 50 and len(index) == 50
+    assert not index.needs_retraining(50)
+    assert index.search("condition 3 warning signs", k=5, nprobe=64)[0][0] != "condition 3 warning signs"
+    # Searches already holding the old snapshot still see the old corpus
+    assert before.search("condition 3 warning signs", k=1, nprobe=64)[0][0] == "condition 3 warning signs"
@@ -0,0 +1,62 @@
+import pytest
+from ann_index import IVFIndex
+from dense_index import DenseKnowledgeIndex, SegmentedDenseIndex
+from knowledge_index import tokenize
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    return DenseKnowledgeIndex.load_or_build(index_dir=str(tmp_path_factory.mktemp("dense")))
+
+
+def test_contractions_and_possessives_tokenize_as_words():
+    assert tokenize("what are it's symptoms") == ["symptom"]
+    assert tokenize("the heart’s valves") == ["heart", "valve"]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What are the symptoms of a heart attack?", "symptom"),
+    ("what are it's symptoms", "symptom"),
+    ("how do I prevent a heart attack", "prevent"),
+    ("what causes a heart attack", "cause"),
+    ("how long is recovery", "recover"),
+])
+def test_close_paraphrases_are_answered(index, question, expected):
+    answer = index.answer(question)
+    assert answer is not None
+    assert expected in answer.lower()
+
+
+@pytest.mark.parametrize("question", [
+    "symptoms of flu",
+    "symptoms of covid",
+    "what is diabetes",
+    "what is cholesterol",
+    "tell me a joke about cats",
+    "what is it",
+])
+def test_unrelated_questions_are_not_answered(index, question):
+    assert index.answer(question) is None
+
+
+def test_rebuilds_when_features_change(index, tmp_path, monkeypatch):
+    import dense_index
+    built = DenseKnowledgeIndex.load_or_build(index_dir=str(tmp_path))
+    manifest = (tmp_path / "manifest.json").read_text()
+    monkeypatch.setattr(dense_index, "FEATURE_VERSION", dense_index.FEATURE_VERSION + 1)
+    DenseKnowledgeIndex.load_or_build(index_dir=str(tmp_path))
+    assert (tmp_path / "manifest.json").read_text() != manifest
+    assert len(built) == len(index)
+
+
+def test_ivf_search_skips_facts_the_view_no_longer_has(tmp_path):
+    live = [("sphygmomanometer cuff use", "Wrap the cuff above the elbow.", "live")]
+    dead = [(f"sphygmomanometer reading {i}", f"Stale answer {i}.", "old") for i in range(30)]
+    vector_index = IVFIndex(str(tmp_path / "ann"))
+    vector_index.add_documents(dead + live, nlist=1)
+    segment = DenseKnowledgeIndex.build(live, str(tmp_path / "dense"))
+    # More dead facts outrank the live one than a fixed over-fetch would cover
+    assert "sphygmomanometer cuff use" not in [hit[0] for hit in vector_index.search("sphygmomanometer reading", 6)]
+
+    dense = SegmentedDenseIndex({"live": segment}, vector_index.snapshot())
+    assert dense.search("sphygmomanometer reading", k=1)[0][0] == "sphygmomanometer cuff use"
@@ -0,0 +1,74 @@
+import threading
+import pytest
+import torch
+from inference_engine import ContinuousBatchingEngine
+
+
+def greedy_reference(model, prompt_ids, max_length, eos_token_id=None):
+    """Greedy decoding by re-running the whole sequence each step, no KV cache"""
+    token_ids = list(prompt_ids)
+    generated = []
+    with torch.no_grad():
+        while len(token_ids) < max_length:
+            token = int(model(torch.tensor([token_ids])).logits[0, -1].argmax())
+            token_ids.append(token)
+            generated.append(token)
+            if token == eos_token_id:
+                break
+    return generated
+
+
+@pytest.fixture
+def engine(tiny_model):
+    engine = ContinuousBatchingEngine(tiny_model, max_batch_size=3, max_length=24)
+    engine.start()
+    yield engine
+    engine.stop()
+
+
+PROMPTS = [[1, 2, 3], [5, 9, 14, 20, 7, 3, 2], [11], [4, 4, 8, 15, 16], [30, 31, 2, 7]]
+
+
+def test_concurrent_requests_match_unbatched_greedy_decoding(engine, tiny_model):
+    # More prompts than slots, with different lengths, so slots are reused mid-flight
+    requests = [engine.submit(prompt, do_sample=False, repetition_penalty=1.0) for prompt in PROMPTS]
+    for prompt, request in zip(PROMPTS, requests):
+        assert request.wait(30) == greedy_reference(tiny_model, prompt, 24)
+
+    assert not engine.active
+    assert sorted(engine.free_slots) == [0, 1, 2]
+    assert engine.requests_completed == len(PROMPTS)
+    assert engine.tokens_generated == sum(24 - len(prompt) for prompt in PROMPTS)
+
+
+def test_eos_retires_the_sequence_and_frees_its_slot(engine, tiny_model):
+    reference = greedy_reference(tiny_model, PROMPTS[1], 24)
+    eos = reference[3]
+    expected = reference[:reference.index(eos) + 1]
+
+    request = engine.submit(PROMPTS[1], do_sample=False, repetition_penalty=1.0, eos_token_id=eos)
+    assert request.wait(30) == expected
+    assert sorted(engine.free_slots) == [0, 1, 2]
+
+
+def test_requests_are_capped_at_the_engine_max_length(engine):
+    request = engine.submit([1, 2, 3], max_length=500, do_sample=False)
+    assert len(request.wait(30)) == 24 - 3
+    # A prompt that already fills the length limit finishes without a token
+    assert engine.submit(list(range(24)), do_sample=False).wait(30) == []
+
+
+def test_streamed_tokens_match_the_final_result(engine):
+    request = engine.submit(PROMPTS[0], do_sample=False)
+    streamed = []
+    done = threading.Event()
+
+    def listen(token):
+        if token is None:
+            done.set()
+        else:
+            streamed.append(token)
+
+    request.subscribe(listen)
+    assert done.wait(30)
+    assert streamed == request.wait(0)
@@ -0,0 +1,122 @@
+import json
+import pytest
+import kb_snapshot
+from heart_attack_knowledge import HeartAttackKnowledgeSystem
+from kb_snapshot import (KEYWORD_SYSTEM_SOURCE, KnowledgeSnapshot, SnapshotFacts, SnapshotKeywordSystem,
+                         collect_knowledge, write_snapshot)
+
+FACTS = [
+    ("a.json", "what is angina", "Chest pain from reduced blood flow.", -1),
+    ("b.json", "what is angina", "Angina pectoris — pressure in the chest.", -1),
+    ("a.json", "what is a stent", "A mesh tube that holds an artery open.", -1),
+    ("keywords", "symptoms", "Chest pain, sweating, nausea.", 0),
+    ("keywords", "treatment", "Aspirin and angioplasty.", 1),
+]
+KEYWORDS = [("chest pain", 0), ("symptom", 0), ("treat", 1), ("café", 1)]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / "knowledge.kbsnap")
+    write_snapshot(path, FACTS, KEYWORDS, ["symptoms", "treatment"], "[Disclaimer]", fingerprint="abc")
+    return KnowledgeSnapshot(path)
+
+
+def test_round_trip_preserves_facts_keywords_and_header(snapshot):
+    assert len(snapshot) == len(FACTS)
+    assert [(snapshot.source(i), snapshot.key(i), snapshot.answer(i), int(snapshot.facts[i]['category']))
+            for i in range(len(snapshot))] == FACTS
+    assert snapshot.keywords() == KEYWORDS
+    assert snapshot.categories == ["symptoms", "treatment"]
+    assert snapshot.disclaimer == "[Disclaimer]"
+    assert snapshot.header['fingerprint'] == "abc"
+
+    assert snapshot.source_facts("a.json").tolist() == [0, 2]
+    assert snapshot.source_facts("missing.json").tolist() == []
+    assert snapshot.category_fact(1) == 4
+    assert snapshot.category_fact(7) is None
+
+
+def test_lookup_is_scoped_to_the_source(snapshot):
+    assert snapshot.answer(snapshot.lookup("b.json", "what is angina")).startswith("Angina pectoris")
+    assert snapshot.answer(snapshot.lookup("a.json", "what is angina")).startswith("Chest pain")
+    assert snapshot.lookup("b.json", "what is a stent") is None
+    assert snapshot.lookup("a.json", "what is a ste") is None
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "knowledge.kbsnap"
+    path.write_bytes(b"NOTASNAP" + bytes(64))
+    with pytest.raises(ValueError):
+        KnowledgeSnapshot(str(path))
+
+
+def test_snapshot_facts_overlay_and_removal(snapshot):
+    facts = SnapshotFacts(snapshot, "a.json")
+    assert list(facts) == ["what is angina", "what is a stent"]
+    assert facts["what is angina"] == "Chest pain from reduced blood flow."
+
+    facts["what is angina"] = "Edited."
+    facts["what is a statin"] = "A cholesterol-lowering drug."
+    del facts["what is a stent"]
+    assert dict(facts) == {"what is angina": "Edited.", "what is a statin": "A cholesterol-lowering drug."}
+    assert "what is a stent" not in facts and len(facts) == 2
+    with pytest.raises(KeyError):
+        facts["what is a stent"]
+    with pytest.raises(KeyError):
+        del facts["what is a stent"]
+
+    # Deleting an overlaid snapshot key hides the snapshot answer too; setting it again restores it
+    del facts["what is angina"]
+    assert "what is angina" not in facts
+    facts["what is a stent"] = "A small mesh tube."
+    assert facts["what is a stent"] == "A small mesh tube."
+    # The snapshot file itself is untouched
+    assert snapshot.answer(snapshot.lookup("a.json", "what is angina")) == "Chest pain from reduced blood flow."
+
+
+def test_load_or_build_reuses_a_current_snapshot_and_rebuilds_a_stale_one(tmp_path, monkeypatch):
+    verified = tmp_path / "verified"
+    verified.mkdir()
+    (verified / "extra.json").write_text(json.dumps({"What is a Holter monitor": "A portable ECG recorder."}))
+    path = str(tmp_path / "knowledge.kbsnap")
+
+    snapshot = KnowledgeSnapshot.load_or_build(path, verified_dir=str(verified))
+    assert snapshot.answer(snapshot.lookup("extra.json", "what is a holter monitor")) == "A portable ECG recorder."
+
+    builds = []
+    real_write = kb_snapshot.write_snapshot
+
+    def counting_write(*args, **kwargs):
+        builds.append(args)
+        real_write(*args, **kwargs)
+
+    monkeypatch.setattr(kb_snapshot, "write_snapshot", counting_write)
+    KnowledgeSnapshot.load_or_build(path, verified_dir=str(verified))
+    assert not builds
+
+    (verified / "extra.json").write_text(json.dumps({"What is a Holter monitor": "A wearable ECG that records for a day."}))
+    snapshot = KnowledgeSnapshot.load_or_build(path, verified_dir=str(verified))
+    assert len(builds) == 1
+    assert snapshot.answer(snapshot.lookup("extra.json", "what is a holter monitor")).startswith("A wearable ECG")
+
+    # A damaged file is rebuilt rather than served
+    with open(path, 'r+b') as f:
+        f.write(b"garbage!")
+    KnowledgeSnapshot.load_or_build(path, verified_dir=str(verified))
+    assert len(builds) == 2
+
+
+def test_keyword_system_from_the_snapshot_answers_like_the_module(tmp_path):
+    path = str(tmp_path / "knowledge.kbsnap")
+    write_snapshot(path, *collect_knowledge(verified_dir=None))
+    snapshot = KnowledgeSnapshot(path)
+    system = HeartAttackKnowledgeSystem()
+    from_snapshot = SnapshotKeywordSystem(snapshot)
+
+    assert dict(SnapshotFacts(snapshot, KEYWORD_SYSTEM_SOURCE)) == {
+        category: data["response"] for category, data in system.medical_knowledge.items()}
+    queries = [keyword for data in system.medical_knowledge.values() for keyword in data["keywords"]]
+    queries += ["What should I do if my dad has chest pain?", "Tell me a joke", "HEART ATTACK treatment options"]
+    for query in queries:
+        assert from_snapshot.query_knowledge_base(query) == system.query_knowledge_base(query), query
@@ -0,0 +1,67 @@
+import random
+import re
+import pytest
+from heart_attack_knowledge import HeartAttackKnowledgeSystem, KeywordAutomaton
+
+
+def regex_matches(keywords, text):
+    """Values of the keywords the old per-keyword regex scan would match"""
+    return {value for keyword, value in keywords if re.search(r'\b' + re.escape(keyword) + r'\b', text)}
+
+
+def regex_query(system, user_input):
+    """The keyword lookup as it was before the automaton: first category with a matching keyword"""
+    user_input = user_input.lower()
+    for category, data in system.medical_knowledge.items():
+        for keyword in data["keywords"]:
+            if re.search(r'\b' + re.escape(keyword) + r'\b', user_input):
+                return data["response"] + system.safety_disclaimer
+    return None
+
+
+def random_queries(words, count, seed=0):
+    rng = random.Random(seed)
+    glue = [" ", " ", "  ", ", ", "? ", "-", "_", "'", "", "x", "2", "é"]
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 6)):
+            word = rng.choice(words)
+            if rng.random() < 0.3:
+                # Cut keywords apart so partial and overlapping matches come up
+                start = rng.randint(0, len(word) - 1)
+                word = word[start:rng.randint(start + 1, len(word))]
+            parts.append(word)
+            parts.append(rng.choice(glue))
+        yield "".join(parts).strip()
+
+
+def test_overlapping_keywords_match_like_word_boundary_regexes():
+    keywords = [("he", 0), ("she", 1), ("hers", 2), ("his", 3), ("e", 4), ("her s", 5), ("s-he", 6)]
+    automaton = KeywordAutomaton()
+    for keyword, value in keywords:
+        automaton.add(keyword, value)
+    automaton.build()
+
+    words = [keyword for keyword, _ in keywords] + ["ushers", "sheep", "the", "he's"]
+    for text in random_queries(words, 3000):
+        assert set(automaton.matches(text)) == regex_matches(keywords, text), text
+
+
+@pytest.fixture(scope="module")
+def system():
+    return HeartAttackKnowledgeSystem()
+
+
+def test_query_matches_the_regex_lookup(system):
+    keywords = [keyword.lower() for data in system.medical_knowledge.values() for keyword in data["keywords"]]
+    words = keywords + ["I", "think", "my", "dad", "Chest", "PAIN", "attacks", "heartburn", "whatis"]
+    for query in random_queries(words, 3000, seed=1):
+        assert system.query_knowledge_base(query) == regex_query(system, query), query
+
+
+def test_earliest_category_wins(system):
+    first, second = system.categories[0], system.categories[1]
+    query = (system.medical_knowledge[second]["keywords"][0] + " and "
+             + system.medical_knowledge[first]["keywords"][0])
+    assert system.query_knowledge_base(query).startswith(system.medical_knowledge[first]["response"])
+    assert system.query_knowledge_base("nothing relevant here") is None
@@ -0,0 +1,83 @@
+import pytest
+from knowledge_index import BM25Index, tokenize
+
+DOCUMENTS = [
+    ("what are the symptoms of a heart attack", "Chest pain, shortness of breath and cold sweats."),
+    ("how is a heart attack treated", "Aspirin, clot-busting drugs or angioplasty."),
+    ("what is angina", "Chest pain caused by reduced blood flow to the heart."),
+    ("what lowers blood pressure", "Exercise, less salt and medication."),
+]
+
+
+def build(documents):
+    index = BM25Index()
+    for key, text in documents:
+        index.add(key, text)
+    return index
+
+
+def scores(index, query):
+    return {key: pytest.approx(score, rel=1e-5) for key, score, _ in index.search(query, k=10)}
+
+
+def wait_for_refresh(index):
+    refresher = index._refresher
+    if refresher is not None:
+        refresher.join(10)
+    assert index._refresher is None and not index._stale
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("What are the Symptoms of a heart's attack?") == ["symptom", "heart", "attack"]
+    assert tokenize("It’s stress, not illness") == ["stress", "not", "illness"]
+
+
+def test_rankings_favour_the_fact_the_key_is_about():
+    index = build(DOCUMENTS)
+    results = index.search("heart attack symptoms", k=2)
+    assert [key for key, _, _ in results] == [DOCUMENTS[0][0], DOCUMENTS[1][0]]
+    assert results[0][2] == 1.0
+    assert results[1][2] == pytest.approx(2 / 3)
+    assert index.search("unrelated gibberish") == []
+
+
+def test_documents_added_after_freezing_are_searchable_before_the_refresh(monkeypatch):
+    index = build(DOCUMENTS)
+    index.freeze()
+    # Hold the background rebuild back so the search goes through the delta
+    monkeypatch.setattr(index, "_refresh", lambda: None)
+    index.add("what is an arrhythmia", "An irregular heartbeat.")
+    assert len(index.keys) > index._frozen[2]
+
+    assert index.search("arrhythmia", k=1)[0][0] == "what is an arrhythmia"
+    assert [key for key, _, _ in index.search("heart attack symptoms", k=1)] == [DOCUMENTS[0][0]]
+
+
+def test_replaced_keys_are_retired_from_results_and_idf():
+    index = build(DOCUMENTS)
+    index.freeze()
+    index.add(DOCUMENTS[2][0], "Chest tightness on exertion that eases with rest.")
+    wait_for_refresh(index)
+
+    assert len(index) == len(DOCUMENTS)
+    results = index.search("chest pain", k=10)
+    assert [key for key, _, _ in results].count(DOCUMENTS[2][0]) == 1
+    # The retired document counts towards neither the live total nor any document frequency
+    fresh = build(DOCUMENTS[:2] + [(DOCUMENTS[2][0], "Chest tightness on exertion that eases with rest.")] + DOCUMENTS[3:])
+    assert index._frozen[3] == len(DOCUMENTS)
+    for query in ("chest pain", "angina", "heart attack", "blood"):
+        assert scores(index, query) == scores(fresh, query)
+
+
+def test_background_refresh_matches_a_fresh_index():
+    extra = [(f"what causes condition {i}", f"Condition {i} is caused by plaque in the heart.") for i in range(20)]
+    index = build(DOCUMENTS)
+    index.search("heart")
+    for key, text in extra:
+        index.add(key, text)
+    wait_for_refresh(index)
+
+    assert index._frozen[2] == len(index.keys)
+    fresh = build(DOCUMENTS + extra)
+    for query in ("heart attack symptoms", "condition 7 plaque", "blood pressure"):
+        assert scores(index, query) == scores(fresh, query)
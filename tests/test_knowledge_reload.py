@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import pytest
+import dense_index
+import kb_snapshot
+import knowledge_manager
+from ann_index import IVFIndex
+from knowledge_manager import KnowledgeBaseManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """Manager over copies of the knowledge modules and one registered JSON source, all under tmp_path"""
+    for name in ("VERIFIED_SYSTEM_PATH", "KEYWORD_SYSTEM_PATH"):
+        copy = tmp_path / os.path.basename(getattr(kb_snapshot, name))
+        shutil.copy(getattr(kb_snapshot, name), copy)
+        monkeypatch.setattr(kb_snapshot, name, str(copy))
+    monkeypatch.setattr(dense_index, "DEFAULT_INDEX_DIR", str(tmp_path / "index"))
+
+    facts = tmp_path / "facts.json"
+    facts.write_text(json.dumps({"what is a sphygmomanometer": "A sphygmomanometer measures blood pressure."}))
+    registry = tmp_path / "knowledge_registry.json"
+    registry.write_text(json.dumps({"Test Facts": {"path": str(facts), "type": "custom", "loaded": False}}))
+
+    manager = KnowledgeBaseManager()
+    manager.registry_path = str(registry)
+    manager.load_knowledge_registry()
+    manager.start_watching(interval=0)
+    return manager
+
+
+def test_first_view_is_built_before_serving(manager):
+    assert manager.view is not None
+    assert manager.view.dense.answer("what is a sphygmomanometer") == "A sphygmomanometer measures blood pressure."
+
+
+def test_edited_data_source_is_served_after_reload(manager, tmp_path):
+    (tmp_path / "facts.json").write_text(json.dumps({"what is a sphygmomanometer": "A cuff that reads blood pressure."}))
+    assert manager.reload()
+    view = manager.current_view()
+    assert view.get_response("what is a sphygmomanometer") == "A cuff that reads blood pressure."
+    assert view.dense.answer("what is a sphygmomanometer") == "A cuff that reads blood pressure."
+
+
+def test_edited_knowledge_module_is_served_after_reload(manager):
+    question = "what are the symptoms of a heart attack"
+    assert "chest pain" in manager.current_view().dense.answer(question)
+
+    path = kb_snapshot.VERIFIED_SYSTEM_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source.replace("Common heart attack symptoms include: chest pain",
+                               "Edited heart attack symptoms include: crushing chest pain"))
+    assert manager.reload()
+
+    view = manager.current_view()
+    assert view.get_response("heart attack symptoms").startswith("Edited heart attack symptoms")
+    assert view.dense.answer(question).startswith("Edited heart attack symptoms")
+
+
+def test_unchanged_sources_do_not_publish_a_view(manager):
+    version = manager.view.version
+    assert not manager.reload()
+    assert manager.view.version == version
+
+
+def test_large_views_search_through_the_ivf_index(manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_manager, "ANN_MIN_FACTS", 1)
+    manager.vector_index = IVFIndex(str(tmp_path / "ann"))
+    assert manager.reload(force=True)
+    dense = manager.current_view().dense
+    assert dense.vector_index is manager.vector_index.snapshot()
+    assert len(manager.vector_index) >= len(dense.segments["snapshot"])
+    assert dense.answer("what is a sphygmomanometer") == "A sphygmomanometer measures blood pressure."
+
+    # The edited fact reaches the IVF index through the segment load; the old answer is never served
+    (tmp_path / "facts.json").write_text(json.dumps({"what is a sphygmomanometer": "A cuff that reads blood pressure."}))
+    assert manager.reload()
+    assert manager.current_view().dense.answer("what is a sphygmomanometer") == "A cuff that reads blood pressure."
+    # The reload inserted into the IVF index without touching the view published before it
+    assert dense.vector_index is not manager.vector_index.snapshot()
+    assert dense.answer("what is a sphygmomanometer") == "A sphygmomanometer measures blood pressure."
+
+    # Facts of a removed source stay in the IVF index but not in the view
+    (tmp_path / "facts.json").unlink()
+    assert manager.reload()
+    assert manager.current_view().dense.answer("what is a sphygmomanometer") is None
+    assert "what is a sphygmomanometer" not in manager.vector_index.keys
@@ -0,0 +1,103 @@
+import time
+import pytest
+from inference_engine import (ContinuousBatchingEngine, DeadlineExceeded, EngineClosed, PRIORITY_EMERGENCY,
+                              PRIORITY_NORMAL)
+from scheduler import AdmissionController, classify_priority
+
+
+@pytest.mark.parametrize("message, priority", [
+    ("My father has chest pain right now, what should I do?", PRIORITY_EMERGENCY),
+    ("Is this an emergency?", PRIORITY_EMERGENCY),
+    ("What are the symptoms of a heart attack?", PRIORITY_NORMAL),
+    # Keywords match whole words only
+    ("What does a cardiologist know about helpful diets?", PRIORITY_NORMAL),
+])
+def test_classify_priority(message, priority):
+    assert classify_priority(message) == priority
+
+
+@pytest.fixture
+def engine(tiny_model):
+    engine = ContinuousBatchingEngine(tiny_model, max_batch_size=1, max_length=16)
+    yield engine
+    engine.stop()
+
+
+def test_request_whose_deadline_passed_in_the_queue_is_shed(engine):
+    engine.start()
+    request = engine.submit([1, 2, 3], do_sample=False, deadline=time.time() - 1)
+    with pytest.raises(DeadlineExceeded):
+        request.wait(30)
+    assert request.generated == []
+    assert engine.requests_shed == 1
+    assert engine.free_slots == [0]
+    # The engine keeps serving requests within their deadline
+    assert engine.submit([1, 2, 3], do_sample=False, deadline=time.time() + 30).wait(30)
+
+
+def test_emergencies_are_admitted_ahead_of_earlier_requests(engine):
+    # Queued before the worker starts, so admission order is decided by priority alone
+    normal = engine.submit([1, 2, 3], do_sample=False, priority=PRIORITY_NORMAL)
+    emergency = engine.submit([4, 5, 6], do_sample=False, priority=PRIORITY_EMERGENCY)
+    assert engine.stats()['waiting_by_priority'] == {PRIORITY_NORMAL: 1, PRIORITY_EMERGENCY: 1}
+    engine.start()
+    normal.wait(30)
+    emergency.wait(30)
+    assert emergency.admitted_at < normal.admitted_at
+    assert engine.stats()['waiting_by_priority'] == {}
+
+
+def test_projected_latency_counts_only_requests_at_or_above_the_priority(engine):
+    assert engine.projected_latency() == 0.0
+    engine.mean_service_time = 2.0
+    for _ in range(3):
+        engine.submit([1, 2], priority=PRIORITY_NORMAL)
+    # One slot: three normal requests queue ahead of a new normal one, none ahead of an emergency
+    assert engine.projected_latency(PRIORITY_NORMAL) == pytest.approx(3 * 2.0 + 2.0)
+    assert engine.projected_latency(PRIORITY_EMERGENCY) == pytest.approx(2.0)
+
+
+class FakeEngine:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.submitted = []
+
+    def projected_latency(self, priority):
+        return self.latency
+
+    def submit(self, prompt_ids, **kwargs):
+        self.submitted.append(kwargs)
+        return kwargs
+
+
+def test_admission_sheds_requests_that_cannot_meet_their_deadline():
+    controller = AdmissionController(FakeEngine(latency=5.0), deadline_seconds=4.0)
+    assert controller.submit([1], "What is angina?") is None
+    assert controller.shed_on_admission[PRIORITY_NORMAL] == 1
+    assert not controller.engine.submitted
+
+    # A longer per-request budget admits it, with the deadline passed on to the engine
+    start = time.time()
+    kwargs = controller.submit([1], "What is angina?", deadline_seconds=6.0)
+    assert kwargs['priority'] == PRIORITY_NORMAL
+    assert start + 6.0 <= kwargs['deadline'] <= time.time() + 6.0
+    assert controller.admitted[PRIORITY_NORMAL] == 1
+
+
+def test_submit_follows_a_swapped_engine():
+    replacement = FakeEngine()
+
+    class ClosingEngine(FakeEngine):
+        def submit(self, prompt_ids, **kwargs):
+            controller.engine = replacement
+            raise EngineClosed("draining")
+
+    controller = AdmissionController(ClosingEngine())
+    assert controller.submit([1], "help, what should I do now?") == replacement.submitted[0]
+    assert replacement.submitted[0]['priority'] == PRIORITY_EMERGENCY
+
+    # Without a replacement the caller hears about the closed engine
+    stuck = FakeEngine()
+    stuck.submit = lambda prompt_ids, **kwargs: (_ for _ in ()).throw(EngineClosed("stopped"))
+    with pytest.raises(EngineClosed):
+        AdmissionController(stuck).submit([1], "What is angina?")
@@ -0,0 +1,74 @@
+import torch
+from inference_engine import ContinuousBatchingEngine
+from speculative import PromptLookup, verify_draft_token
+
+
+class IdTokenizer:
+    """Texts are already token id lists"""
+
+    def encode(self, token_ids):
+        return list(token_ids)
+
+
+def test_draft_prefers_the_sequence_then_the_longest_known_ngram():
+    lookup = PromptLookup(IdTokenizer(), [[7, 8, 9, 10, 11, 12], [1, 8, 9, 40, 41]], ngram_sizes=(3, 2), max_draft=3)
+    # The trailing 2-gram (8, 9) occurred earlier in the sequence itself
+    assert lookup.draft([8, 9, 50, 51, 8, 9]) == [50, 51, 8]
+    # Otherwise the longest n-gram found in a knowledge text wins: (1, 8, 9) over (8, 9)
+    assert lookup.draft([3, 1, 8, 9]) == [40, 41]
+    # A shorter n-gram continues from its first occurrence
+    assert lookup.draft([3, 5, 8, 9]) == [10, 11, 12]
+    assert lookup.draft([3, 5, 8, 9], max_tokens=1) == [10]
+    assert lookup.draft([60, 61]) == []
+
+
+def test_greedy_verification_keeps_only_the_argmax():
+    logits = torch.tensor([0.1, 2.0, 0.5, -1.0])
+    assert verify_draft_token(logits, [], 1, do_sample=False) == (1, True)
+    assert verify_draft_token(logits, [], 2, do_sample=False) == (1, False)
+    # The repetition penalty applies before the comparison, as in normal decoding
+    assert verify_draft_token(logits, [1], 1, repetition_penalty=10.0, do_sample=False) == (2, False)
+
+
+def test_sampled_verification_keeps_the_model_distribution():
+    torch.manual_seed(0)
+    logits = torch.tensor([1.0, 0.2, -0.5, 0.7])
+    expected = torch.softmax(logits, dim=-1)
+    trials = 20000
+    counts = torch.zeros(4)
+    accepted = 0
+    for _ in range(trials):
+        token, kept = verify_draft_token(logits, [], 2, temperature=1.0, top_k=0)
+        counts[token] += 1
+        accepted += kept
+    assert torch.allclose(counts / trials, expected, atol=0.015)
+    # The draft is kept with exactly its model probability
+    assert abs(accepted / trials - float(expected[2])) < 0.015
+
+
+def decode_all(model, prompts, speculative=None):
+    engine = ContinuousBatchingEngine(model, max_batch_size=2, max_length=32, speculative=speculative)
+    engine.start()
+    try:
+        # One at a time, so every step has a single active sequence and may speculate
+        return [engine.submit(prompt, do_sample=False).wait(30) for prompt in prompts], engine.stats()
+    finally:
+        engine.stop()
+
+
+def test_speculative_engine_output_matches_plain_decoding(tiny_model):
+    prompts = [[1, 2, 3], [5, 9, 14, 20], [11, 12]]
+    expected, _ = decode_all(tiny_model, prompts)
+
+    # Drafts that are right (the plain continuations) and drafts that are wrong (shifted ids)
+    right = PromptLookup(IdTokenizer(), [prompt + output for prompt, output in zip(prompts, expected)])
+    wrong = PromptLookup(IdTokenizer(), [prompt + [(t + 1) % 64 for t in output] for prompt, output in zip(prompts, expected)])
+
+    outputs, stats = decode_all(tiny_model, prompts, right)
+    assert outputs == expected
+    assert stats['accepted_draft_tokens'] > 0
+    assert stats['decode_steps'] < sum(len(output) for output in expected)
+
+    outputs, stats = decode_all(tiny_model, prompts, wrong)
+    assert outputs == expected
+    assert stats['draft_tokens'] > stats['accepted_draft_tokens']
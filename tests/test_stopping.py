@@ -0,0 +1,81 @@
+import pytest
+from inference_engine import ContinuousBatchingEngine
+from stopping import (MaxNewTokens, RepeatedPhrase, SentenceLimit, StopOnMarker, StoppingCriteria,
+                      default_stopping_criteria, stopping_stats)
+
+
+def feed(criteria, tokenizer, text):
+    """Check text word by word; (stop reason, words fed)"""
+    for count, token_id in enumerate(tokenizer.encode(text), 1):
+        reason = criteria.check(token_id)
+        if reason:
+            return reason, count
+    return None, len(criteria.generated_ids)
+
+
+def test_marker_stops_and_is_trimmed(word_tokenizer):
+    criteria = StoppingCriteria(word_tokenizer, [StopOnMarker()])
+    assert feed(criteria, word_tokenizer, "Call emergency services now. ### Medical Question: next") == ("marker", 5)
+    assert criteria.trim(criteria.text) == "Call emergency services now."
+
+
+def test_sentence_limit_ignores_list_numbers(word_tokenizer):
+    criteria = StoppingCriteria(word_tokenizer, [SentenceLimit(max_sentences=2)])
+    reason, count = feed(criteria, word_tokenizer, "Steps: 1. Call 911. 2. Chew aspirin. 3. Rest.")
+    assert reason == "sentence_limit"
+    assert criteria.text.endswith("Chew aspirin.")
+
+
+def test_repeated_phrase_stops_a_loop(word_tokenizer):
+    criteria = StoppingCriteria(word_tokenizer, [RepeatedPhrase(phrase_words=3, max_repeats=2)])
+    text = "see a doctor now and " * 6
+    reason, count = feed(criteria, word_tokenizer, text)
+    assert reason == "repetition"
+    assert count < len(text.split())
+
+    varied = StoppingCriteria(word_tokenizer, [RepeatedPhrase(phrase_words=3, max_repeats=2)])
+    assert feed(varied, word_tokenizer, "chest pain can spread to the arm jaw neck or back and may come and go")[0] is None
+
+
+def test_eos_and_budget_accounting(word_tokenizer):
+    eos = word_tokenizer.encode("<eos>")[0]
+    criteria = StoppingCriteria(word_tokenizer, [MaxNewTokens(3)], budget=10, eos_token_id=eos)
+    assert criteria.check(word_tokenizer.encode("rest")[0]) is None
+    assert criteria.check(eos) == "eos"
+    # A natural end saves nothing
+    assert criteria.tokens_saved() == 0
+
+    early = StoppingCriteria(word_tokenizer, [MaxNewTokens(3)], budget=10)
+    assert feed(early, word_tokenizer, "one two three four") == ("max_new_tokens", 3)
+    assert early.tokens_saved() == 7
+
+    before = stopping_stats.as_dict()
+    early.finish()
+    early.finish()
+    after = stopping_stats.as_dict()
+    assert after['requests'] == before['requests'] + 1
+    assert after['tokens_saved'] == before['tokens_saved'] + 7
+    assert after['reasons']['max_new_tokens'] == before['reasons'].get('max_new_tokens', 0) + 1
+
+
+class NumberTokenizer:
+    """Decodes any token id, for criteria fed by a real model"""
+
+    def decode(self, token_ids, skip_special_tokens=False):
+        return " ".join(f"t{token_id}" for token_id in token_ids)
+
+
+@pytest.mark.parametrize("max_new_tokens", [1, 5])
+def test_engine_retires_a_request_when_a_criterion_fires(tiny_model, max_new_tokens):
+    engine = ContinuousBatchingEngine(tiny_model, max_batch_size=2, max_length=40)
+    engine.start()
+    try:
+        stopping = default_stopping_criteria(NumberTokenizer(), max_new_tokens=max_new_tokens, budget=37)
+        request = engine.submit([1, 2, 3], do_sample=False, stopping=stopping)
+        assert len(request.wait(30)) == max_new_tokens
+        assert stopping.stop_reason == "max_new_tokens"
+        assert stopping.tokens_saved() == 37 - max_new_tokens
+        assert stopping.recorded
+        assert sorted(engine.free_slots) == [0, 1]
+    finally:
+        engine.stop()
@@ -0,0 +1,105 @@
+import pytest
+import torch
+from tokenization import CachedTokenizer, LRUCache, pad_batch
+
+
+class CountingTokenizer:
+    """Tokenizer stand-in mapping each character to its code point and counting the work done"""
+
+    def __init__(self, is_fast):
+        self.is_fast = is_fast
+        self.cache = {}
+        self.encoded = []
+        self.batches = []
+        self.pad_token = None
+
+    def encode(self, text, return_tensors=None, **kwargs):
+        self.encoded.append(text)
+        return [ord(c) for c in text]
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return {'input_ids': [[ord(c) for c in text] for text in texts]}
+
+    def __len__(self):
+        return 256
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1  # "b" is now the oldest
+    cache["c"] = 3
+    assert "b" not in cache and "a" in cache and "c" in cache
+    cache["a"] = 10  # Overwriting also refreshes the entry
+    cache["d"] = 4
+    assert "c" not in cache and cache.get("a") == 10
+    assert cache.get("c", "missing") == "missing"
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("is_fast", [True, False])
+def test_repeated_texts_are_served_from_the_cache(is_fast):
+    tokenizer = CachedTokenizer(CountingTokenizer(is_fast), cache_size=2)
+    assert tokenizer.encode("hi") == [104, 105]
+    assert tokenizer.encode("hi") == [104, 105]
+    assert tokenizer.tokenizer.encoded == ["hi"]
+
+    tensor = tokenizer.encode("hi", return_tensors="pt")
+    assert torch.equal(tensor, torch.tensor([[104, 105]]))
+    assert tokenizer.cache_info()['hits'] == 2 and tokenizer.cache_info()['misses'] == 1
+
+    # Callers may mutate the returned list without corrupting the cache
+    tokenizer.encode("hi").append(0)
+    assert tokenizer.encode("hi") == [104, 105]
+
+    tokenizer.encode("a")
+    tokenizer.encode("b")
+    tokenizer.encode("hi")
+    assert tokenizer.tokenizer.encoded == ["hi", "a", "b", "hi"]
+
+
+def test_encode_with_extra_arguments_bypasses_the_cache():
+    tokenizer = CachedTokenizer(CountingTokenizer(True))
+    tokenizer.encode("hi", add_special_tokens=False)
+    tokenizer.encode("hi", add_special_tokens=False)
+    assert tokenizer.tokenizer.encoded == ["hi", "hi"]
+    assert tokenizer.cache_info()['entries'] == 0
+
+
+def test_encode_batch_encodes_only_the_misses_in_one_call():
+    tokenizer = CachedTokenizer(CountingTokenizer(True))
+    tokenizer.encode("b")
+    assert tokenizer.encode_batch(["a", "b", "c"]) == [[97], [98], [99]]
+    assert tokenizer.tokenizer.batches == [["a", "c"]]
+    assert tokenizer.encode_batch(["c", "a"]) == [[99], [97]]
+    assert tokenizer.tokenizer.batches == [["a", "c"]]
+
+
+def test_python_tokenizer_word_cache_is_bounded():
+    inner = CountingTokenizer(False)
+    CachedTokenizer(inner, word_cache_size=3)
+    assert isinstance(inner.cache, LRUCache) and inner.cache.max_size == 3
+    # The fast tokenizer keeps its own caching
+    fast = CountingTokenizer(True)
+    CachedTokenizer(fast)
+    assert fast.cache == {}
+
+
+def test_unknown_attributes_pass_through_to_the_tokenizer():
+    tokenizer = CachedTokenizer(CountingTokenizer(True))
+    tokenizer.pad_token = "<eos>"
+    assert tokenizer.tokenizer.pad_token == "<eos>"
+    assert tokenizer.pad_token == "<eos>"
+    assert len(tokenizer) == 256
+    assert tokenizer(["ab"])['input_ids'] == [[97, 98]]
+
+
+def test_pad_batch_pads_on_either_side():
+    input_ids, attention_mask = pad_batch([[1, 2, 3], [4]], pad_token_id=0)
+    assert input_ids.tolist() == [[1, 2, 3], [0, 0, 4]]
+    assert attention_mask.tolist() == [[1, 1, 1], [0, 0, 1]]
+    input_ids, attention_mask = pad_batch([[1, 2, 3], [4]], pad_token_id=0, padding_side='right')
+    assert input_ids.tolist() == [[1, 2, 3], [4, 0, 0]]
+    assert attention_mask.tolist() == [[1, 1, 1], [1, 0, 0]]